@@ -28,25 +28,25 @@ from collections import deque, Counter, namedtuple
 from itertools import combinations
 from pathlib import Path
 from copy import copy
-from enum import enum
-import re
+from time import perf_counter
+import io
 import sys
 
 from cpp.um_emulator import UniversalMachine
 from byteio import *
-from clients import run
+from run import run, BudgetExhaustedError
+from room_graph import RoomGraph
+import adventure_text
 
 import logging
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    level=logging.DEBUG,
-    filename='bot.log',
-    format='%(levelname)-10s %(message)s'
-    )
 
 Coord = namedtuple('Coord', 'x y')
 quarters = ('north', 'east', 'south', 'west')
-directions = ((0, -1), (1, 0), (0, 1), (-1, 0))
+directions = (complex(0, -1), complex(1, 0), complex(0, 1), complex(-1, 0))
+
+# instructions UMIX may spend on one command, see Bot.makemove
+MOVE_BUDGET = 200_000_000
 
 
 # ====================== SOME SMALL AUXILIARY ===========================#
@@ -89,20 +89,47 @@ def missinglist(needed, current):
     C.subtract(counterwrap(needed))
     return None if any(c < 0 for c in C.values()) else C - Counter()
 
+# -----------------------------------------------------------------------#
+# Parts to add to current condition to make it needed, grouped by stage
+# from the current one; None if unreachable.
+# ((A b) c d) -> A: [(c, d), (b, )]
+# -----------------------------------------------------------------------#
+def repair_stages(needed, current):
+    if stage(needed) > stage(current):
+        return None
+    stages = []
+    while stage(needed) < stage(current):
+        stages.append(tuple(sorted(current[1:], key=str)))
+        current = current[0]
+    missing = missinglist(needed, current)
+    if missing is None:
+        return None
+    if missing or not stages:
+        stages.append(tuple(sorted(missing.elements(), key=str)))
+    return stages
+
 
 # ============================= BASE BOT ================================#
 
 class Bot:
-    def __init__(self, position=Coord(0, 0)):
+    def __init__(self, position=complex(0, 0)):
         self.position = position
-
-
-    # def makemove(self, cmd):
-    #     '''Shortcut for UM.run + log output.'''
-    #     self.UM.run(cmd)
-    #     text = self.UM.get_output()
-    #     self.log += text
-    #     return text
+        self.UM = None
+        self.log = ""
+
+
+    def makemove(self, cmd):
+        '''Shortcut for UM.run + log output.
+        Raises BudgetExhaustedError if a command takes more than MOVE_BUDGET
+        on average (cmd may be several lines).'''
+        moves = max(1, cmd.count('\n'))
+        self.UM.instruction_budget = self.UM.instructions_executed + MOVE_BUDGET * moves
+        self.UM.write_input_bytes(cmd.encode('ascii'))
+        output = io.BytesIO()
+        run(self.UM, umin=BaseReader(), umout=ByteWriter(output))
+        text = output.getvalue().decode('ascii')
+        self.log += text
+        return text
 
 
     def pos(self, coord=None):
@@ -127,38 +154,34 @@ class Bot:
 # =========================== EXPLORER BOT ==============================#
 
 class ExplorerBot(Bot):
+    INVENTORY_LIMIT = 6
+    BATCH_EXAMINE = True    # examine all items of a room with one makemove
 
-    def __init__(self, position=Coord(0, 0)):
-        super().__init__()
+    def __init__(self, position=complex(0, 0)):
+        super().__init__(position)
         self.unvisited_coords = deque([complex(0, 0)])  # room zero is not parsed yet
         self.rooms = { complex(0, 0) : Room(complex(0, 0)) }
+        self.graph = RoomGraph()      # passages between self.rooms
+        self.graph.add_room(complex(0, 0))
         self.strangelets = []
 
+        # pre-set list of things needed for uploader and downloader.
+        self.targets = {"downloader" : ["USB cable", "display", "jumper shunt", "progress bar", "power cord"], 
+                        "uploader" : ["MOSFET", "battery", "status LED", "RS232 adapter", "EPROM burner"]}
+        #self.targets = {"" : ["keypad"]}
+        self.inventory = Counter()
+        self.basic_inventory = []    # what should be left after assembling.
 
+        self.instruction_root = None    # root of instructions tree
+        self.simulation = None          # AssemblySimulation for the current detail
+        self.simulation_count = 0       # just for infolog
 
 
     # -------------------------------------------------------------------#
     # Given "English" text, convert it into list of sentences.
-    # Delete empty lines and lines with '>: ' (command prompts). 
-    # Hope there are no unexpected dots in the text.
     # -------------------------------------------------------------------#
     def split_sentences(self, text):
-        known_words_with_dots = ("incl", "construction", 'Bus 2')
-
-        for word in known_words_with_dots:
-            text = re.sub(word + '.', word, text)
-        # delete all prompts
-        text = re.sub(re.compile("^.*?\n"), "", text)  # previous command
-        text = re.sub(re.compile(">\:.*"), "", text)   # prompt for next
-
-        text = text.replace("\n\n", ".")
-        text = text.replace("\n", " ")
-        lines = []
-        for line in text.split('.'):
-            line = line.lstrip(' ')
-            if line:
-                lines.append(line)
-        return lines
+        return adventure_text.split_sentences(text)
 
 
     # =================== PARSE ROOM DESCRIPTION ========================#
@@ -179,31 +202,19 @@ class ExplorerBot(Bot):
         room.name = text[0]
         logger.debug(self.pos() + "Parsing " + room.name + '.')
 
-        regex_direction = re.compile("^From here,.*?")
-        regex_item = re.compile(".+here is an? (\(broken\) )?(.+?)( here)?$")  # group(2)
-        regexs_ignore = (
-                re.compile("^You are standing.*?"),
-                re.compile("A sign reads.*"),
-                re.compile("There are more.*")
-              )
-
+        fullnames = []
         for line in text[1:]:
-            if any(r.match(line) for r in regexs_ignore):
-                # no interesting info
-                pass
-
-            elif regex_item.match(line):
+            kind, value = adventure_text.room_line(line)
+            if kind == 'item':
                 # There is an (item) here.
-                fullname = regex_item.search(line).group(2)
-                self.parse_item(fullname, room)
-
-            elif regex_direction.match(line):
+                fullnames.append(value)
+            elif kind == 'directions':
                 # From here, you can go...
-                self.parse_directions(line, room)
-
-            else:
+                self.parse_directions(value, room)
+            elif kind == 'strange':
                 # something unexpected
-                room.strangelets.append(line)
+                room.strangelets.append(value)
+        self.examine_items(fullnames, room)
         return room
 
 
@@ -224,94 +235,61 @@ class ExplorerBot(Bot):
             # add as a neighroom and hope they are path-independent
             room.neighrooms[i] = self.rooms[coord]
             self.rooms[coord].neighrooms[i - 2] = room
+            self.graph.connect(self.position, coord)
 
 
     # ========================= PARSE ITEM ==============================#
 
     # -------------------------------------------------------------------#
-    # Take list of items, call for description and parse into Item.
+    # Examine items of the room, top of the pile first. All 'x' commands
+    # go to UM in one batch, the output is split by prompts; if it does
+    # not split into an answer per item, they are examined one by one,
+    # as is any item the answer of which describes another item.
     # -------------------------------------------------------------------#
-    def parse_item(self, fullname, room):
-        regex_standard = re.compile(r".*\w\-(\w){4}\-(\w){3}") # X-XXXX-XXX
-        regex_basetype = re.compile(".*?The (.*?) is.*")
-        regex_adjective = re.compile("Interestingly, this one is (.*)")
-        regex_alsobroken = re.compile("Also, it is broken: it is (.*)")
-
-        basetype, adj = fullname, ''
+    def examine_items(self, fullnames, room):
+        answers = [None] * len(fullnames)
+        if self.BATCH_EXAMINE and len(fullnames) > 1:
+            text = self.makemove(''.join('x ' + name + '\n' for name in fullnames))
+            batch = adventure_text.split_answers(text)
+            if len(batch) == len(fullnames):
+                answers = batch
+            else:
+                logger.warning(self.pos() + "%d answers to %d 'x' commands, examining again"
+                               % (len(batch), len(fullnames)))
+        for fullname, answer in zip(fullnames, answers):
+            if answer is not None:
+                if self.parse_item(fullname, room, answer):
+                    continue
+                logger.warning(self.pos() + "Batch answer is not about " + fullname + ", examining again")
+            if not self.parse_item(fullname, room):
+                logger.error(self.pos() + "Description is not about " + fullname)
 
-        text = self.split_sentences(self.makemove('x ' + fullname + '\n'))
-        for line in text:
-            if regex_basetype.match(line):
-                basetype = regex_basetype.search(line).group(1)
-                condition = [basetype]   # default - item is pristine.
-                
-            elif regex_adjective.match(line):
-                adj = regex_adjective.search(line).group(1) + ' '
 
-            elif regex_alsobroken.match(line):
-                conditiontext = regex_alsobroken.search(line).group(1)
-                conditiontext = self.pre_parse_condition(conditiontext)
-                _, condition = self.parse_condition_to_tuple(conditiontext, 1)
+    # -------------------------------------------------------------------#
+    # Parse item description (call for it, if not given) into Item.
+    # Returns False and adds nothing if the description is of another item.
+    # -------------------------------------------------------------------#
+    def parse_item(self, fullname, room, text=None):
+        if text is None:
+            text = self.makemove('x ' + fullname + '\n')
+        text = self.split_sentences(text)
+        basetype, adj, condition = adventure_text.parse_item_text(text)
+        basetype = basetype or fullname
+        if adj + basetype != fullname:
+            return False
 
-        assert adj + basetype == fullname 
         item = Item(basetype, adj)
-        item.set_condition(condition)
+        item.set_condition(condition or [basetype])
         if not basetype in room.trash:
             room.trash[basetype] = []
         room.trash[basetype].append(item)
         room.pile.append((item.fullname()))
-        if (not regex_standard.match(basetype) and 
+        if (not adventure_text.STANDARD_NAME.match(basetype) and 
                     not any(basetype in V for V in self.targets.values())):
             room.strangelets.append("Item named " + fullname)
+        return True
 
 
-    # -------------------------------------------------------------------#
-    # Make some changes before recursively split condition text into lists:
-    # items separated with '|', spaces between items are removed.
-    # -------------------------------------------------------------------#
-    def pre_parse_condition(self, line):
-        t = []
-        line = '(' + line + ')'
-        line = re.sub('\(an? ', '(', line)
-        line = re.sub(' missing ', ' | ', line)
-        line = re.sub(' and ', ' | ', line)
-        line = re.sub(' an? ', ' | ', line)
-        for _ in range(10):
-            line = re.sub('\| \|', '|', line)
-        for _ in range(10):
-            line = re.sub(' \| ', '|', line)
-        for _ in range(10):
-            line = re.sub('  ', ' ', line)
-        return line
-
-
-    # -------------------------------------------------------------------#
-    # Make list-based "condition" out of prepared line.
-    # '(a|b(c|d|e f))' -> ('a', 'b', ('c', 'd', 'e f'))
-    # -------------------------------------------------------------------#
-    def parse_condition_to_tuple(self, text, position):
-        previous = position
-        condition = []
-        while position < len(text):
-            if text[position] == '|':
-                if previous < position:
-                    condition.append(text[previous:position])
-                previous = position + 1
-
-            elif text[position] == '(':
-                position, new_t = self.parse_condition_to_tuple(text, position + 1)
-                condition.append(new_t)
-                previous = position + 1      
-
-            elif text[position] == ')':
-                if previous < position:
-                    condition.append(text[previous:position])
-                return (position, tuple(condition))
-            position += 1
-
-        logger.error('Missing closing bracket in ' + text)
-        return(position, tuple(condition))
-
     # ====================== LOCATIONS TRAVERSING =======================#
 
     # -------------------------------------------------------------------#
@@ -322,6 +300,13 @@ class ExplorerBot(Bot):
         return self.find_path_safe(destination)
 
 
+    # -------------------------------------------------------------------#
+    # Order to visit the rooms in, from here.
+    # -------------------------------------------------------------------#
+    def plan_tour(self, coords):
+        return self.graph.tour(self.position, coords)
+
+
 
     # -------------------------------------------------------------------#
     # Find route to the destination - assume there always is a passage.
@@ -335,31 +320,19 @@ class ExplorerBot(Bot):
 
 
     # -------------------------------------------------------------------#
-    # Find route to the destination by Dijkstra.
+    # Find route to the destination by the passages seen, see RoomGraph.
     # -------------------------------------------------------------------#
     def find_path_safe(self, destination):
-        if (destination == self.position): return []
-        routes = { coord : [] for coord in self.rooms }
-        discovered = deque([self.rooms[self.position]])
-        while discovered:
-            currentroom = discovered.popleft()
-            for neighroom in currentroom.neighrooms:
-                if neighroom is None or routes[neighroom.coord]:
-                    # no room or path is found.
-                    continue
-                discovered.append(neighroom)
-                routes[neighroom.coord] = (routes[currentroom.coord]
-                             + [neighroom.coord - currentroom.coord])
-                if neighroom.coord == destination: 
-                    return routes[neighroom.coord]
-        logger.error('Cannot find path from ' + str(self.position) 
-                                      + ' to ' + str(destination))
+        path = self.graph.path(self.position, destination)
+        if path is None:
+            logger.error('Cannot find path from ' + str(self.position) 
+                                          + ' to ' + str(destination))
+        return path
 
 
     def log_strangelets(self):
         '''Log all lines that did not match known patterns.'''
         text = "\n=== STRANGELETS ===\n"
-        for s in self.strangelets:        
         for room in self.rooms.values():
             if not room.strangelets: continue
             text += self.pos(room.coord) + " " + room.name + ":\n"
@@ -393,46 +366,16 @@ class ExplorerBot(Bot):
     #    |
     #    |--- [button]
     #
-    # Instruction query:
-    #       instruction stub (fullname and parent filled in)
-    #       needed condition (types only, no fullnames)
-    #       current condition (types only, no fullnames)
+    # Trees are made by AssemblySearch and checked by simulation
+    # one by one, until one works.
     # -------------------------------------------------------------------#
 
-        INVENTORY_LIMIT = 6
-
-        # pre-set list of things needed for uploader and downloader.
-        self.targets = {"downloader" : ["USB cable", "display", "jumper shunt", "progress bar", "power cord"], 
-                        "uploader" : ["MOSFET", "battery", "status LED", "RS232 adapter", "EPROM burner"]}
-        #self.targets = {"" : ["keypad"]}
-        self.inventory = []
-        self.basic_inventory = []    # what should be left after assembling.
-
-        # instruction generating globals (they should be passed in all
-        # recursive calls, but are just stored here instead).
-        self.instruction_root = None    # root of instructions tree
-        self.simulation_tree = None     # copy of tree (destroyed in simulation)
-        self.instruction_queries = []   # instructions to be done
-        self.items_available = None
-        self.simulations_count = 0      # just for infolog
-
-
-
     # -------------------------------------------------------------------#
     # Combine one of loader details in the room.
     # -------------------------------------------------------------------#
     def assemble_target_detail(self, room, target, detail):
         logger.debug(self.pos() + "Trying to repair " + detail)
-        self.instruction_queries = [(Instruction(target), target, (target, detail))]
-        self.instruction_root = self.instruction_queries[0][0]
-        self.items_available = {}
-        for x in room.trash:
-            self.items_available[x] = room.trash[x].copy()
-        self.simulation_count = 0
-
-        commands = self.make_and_check_instruction_tree(0)
-        logger.info(str(self.simulation_count) + " simulation runs for " + detail)
-
+        commands = self.find_commands(room, target, detail)
         if commands is None:
             logger.error("No working instruction tree found for " + detail)
             return
@@ -443,186 +386,36 @@ class ExplorerBot(Bot):
 
 
     # -------------------------------------------------------------------#
-    # Take the next instruction query and call make_instruction.
-    # If instruction tree is ready, run simulation.
-    # No ambiguities at this stage. 
-    # Return command list if found, None otherwise.
-    # -------------------------------------------------------------------#
-    def make_and_check_instruction_tree(self, pointer):
-        if pointer >= len(self.instruction_queries):
-            # tree is fully made, time to check.
-            return self.simulate_assembling()
-
-        # instruction stub (fullname and parent), needed and current conditions
-        I, needed, current = self.instruction_queries[pointer]
-        query_length = len(self.instruction_queries)
-
-        if counterwrap(needed) == counterwrap(current):
-            # Instruction is complete, take the next one
-            return self.make_and_check_instruction_tree(pointer + 1)
-
-        current = self.add_chain_of_stages(I, needed, current)
-        missing = missinglist(needed, current)
-        assert missing is not None
-
-        result = self.make_instruction(I, missing, pointer + 1)
-        if result is not None:
-            # solution found! Just pass it back
-            return result
-
-        # no solution here - undo changes
-        self.instruction_queries[query_length:] = []
-        return None
-
-
-    # -------------------------------------------------------------------#
-    # Make chain of nested instruction queries:
-    # (sepia A : needed [A, b] : current [[[A b c] d] e f]) ==> 
-    # ==> ((sepia A, e f), (sepia A, d), (sepia A, c))
-    # Return condition at the next stage and add others to queries.
-    # -------------------------------------------------------------------#
-    def add_chain_of_stages(self, I, needed, current):
-        if stage(needed) == stage(current): return current
-        stages = []
-        while (stage(needed) < stage(current)):
-            logger.debug("needed: " + str(needed) + " current: " + str(current))
-            stages.append((Instruction(I.itemname), (current[0], ), current))
-            current = current[0]
-        stages.append((Instruction(I.itemname), needed, current))
-
-        # set parents and add all stages but last as a query.
-        stages[-1] = tuple([I] + list(stages[-1][1:]))
-        for i in range(len(stages) - 1):
-            stage_I, parent_I = stages[i][0], stages[i + 1][0]
-            stage_I.itemname = I.itemname
-            stage_I.parent = parent_I
-            parent_I.children = [stage_I]
-        self.instruction_queries += stages[:-1]
-        return stages[-1][2]
-
-
-    # -------------------------------------------------------------------#
-    # Given incomplete instruction and Counter of missing items, add next
-    # item to instructions.
-    # This is the method for disambiguation between same-type items.
-    # Returns command list if found, None otherwise.
-    # -------------------------------------------------------------------#
-    def make_instruction(self, I, missing, pointer):
-        if not missing:
-            # instruction is made - go to the next one
-            return self.make_and_check_instruction_tree(pointer)
-
-        needed = next(iter(missing))
-        count = missing[needed]
-        basetype = getbasetype(needed)
-        if (not basetype in self.items_available or 
-               len(self.items_available[basetype]) < count):
-            return None
-
-        del missing[needed]
-        suitables = [item 
-                     for item in self.items_available[basetype] 
-                     if item.reachable(needed)]
-        for C in combinations(suitables, count):
-            # make changes
-            for item in C:
-                self.items_available[basetype].remove(item)
-                new_I = Instruction(item.fullname())
-                new_I.parent = I
-                I.children.append(new_I)
-
-                # whether item is ready or not is not this method's problem.
-                self.instruction_queries.append((new_I, 
-                                                 needed, 
-                                                 item.condition()))
-
-            # go for it!
-            result = self.make_instruction(I, missing, pointer)
-            if result is not None:
-                # solution found! Just pass it back
-                return result
-
-            # undo changes
-            for item in C:
-                self.items_available[basetype].append(item)
-            I.children[-count:] = []
-            self.instruction_queries[-count:] = []
-
-        missing[needed] = count
-        # no solutions at this branch
-        return None
-
-
-    # -------------------------------------------------------------------#
-    # Searches instruction set for full list of needed instructions.
+    # Search for the commands that repair detail of target (which is in
+    # the inventory) with the items of the room, None if there are none.
     # -------------------------------------------------------------------#
-    def list_needed_details(self):
-        needed = set()
-        for I in self.simulation_tree.traverse():
-            needed.add(I.itemname)
-        return needed
+    def find_commands(self, room, target, detail):
+        start = perf_counter()
+        # one slot is kept free to take the next item from the pile
+        slots = self.INVENTORY_LIMIT - len(self.basic_inventory) - 1
+        search = AssemblySearch(room, slots)
+        self.simulation = AssemblySimulation(room.pile, self.basic_inventory, self.INVENTORY_LIMIT)
+        self.simulation_count = 0
+        commands = None
+        for tree in search.trees(target, target, (target, detail)):
+            self.instruction_root = tree
+            commands = self.simulate_assembling()
+            if commands is not None:
+                break
+        logger.info("%s: %d nodes expanded, %d simulation runs (%d takes), %.3fs"
+                    % (detail, search.nodes, self.simulation_count,
+                       self.simulation.takes, perf_counter() - start))
+        return commands
 
 
     # -------------------------------------------------------------------#
     # Trying to carry out given instructions.
     # -------------------------------------------------------------------#
     def simulate_assembling(self):
-        # here item is always a fullname, not Item object.
-        commands = []
-        self.simulation_tree = self.instruction_root.copy()
-        needed = self.list_needed_details()
-        pile = self.rooms[self.position].pile.copy()
-        self.inventory = self.basic_inventory.copy()
         self.simulation_count += 1
-        if self.simulation_count % 20000 == 0: print("...", self.simulation_count)
-
-        while pile:
-            if len(self.inventory) >= self.INVENTORY_LIMIT:
-                return None     # no more place :(
-
-            item = pile.popleft()
-            commands.append('take ' + item + '\n')
-            if not item in needed:
-                commands.append('inc ' + item + '\n')
-            else:
-                # trying to combine smth
-                self.inventory.append(item)
-                if self.revise_instructions(commands):
-                    return commands
-
-
-    # -------------------------------------------------------------------#
-    # Try to carry out any instruction until no changes are made.
-    # Any finished instruction (I.children is empty and I.itemname 
-    # in inventory) is deleted. 
-    # Return True, if root instruction is finished.
-    # -------------------------------------------------------------------#
-    def revise_instructions(self, commands):
-        changed = True
-        while changed:
-            changed = False
-            for I in self.simulation_tree.traverse():
-                if I.itemname in self.inventory and not I.children:
-                    # instruction is complete.
-                    if I.parent is None:
-                        # finished the last instruction.
-                        return True
-                    elif not I.parent.itemname in self.inventory: 
-                        continue
-                    elif I.parent.itemname == I.itemname:
-                        # stage complete:
-                        I.parent.children.remove(I)
-                        changed = True
-                    elif I.parent.itemname == I.parent.children[0].itemname:
-                        # wrong stage
-                        pass
-                    else:
-                        commands.append('combine ' + I.parent.itemname
-                                        + ' with ' + I.itemname + '\n')
-                        I.parent.children.remove(I)
-                        changed = True
-                        self.inventory.remove(I.itemname)
-        return False
+        commands = self.simulation.run(self.instruction_root)
+        self.inventory = self.simulation.inventory.copy()
+        return commands
 
 
     # -------------------------------------------------------------------#
@@ -630,19 +423,27 @@ class ExplorerBot(Bot):
     # -------------------------------------------------------------------#
     def clear_inventory(self):
         text = self.makemove('inventory\n').split('\n')
-        regex_item = re.compile("^an? (\(broken\) )?(.+)([.,]|( and))$") # group 2
         for line in text:
-            if not regex_item.match(line):
+            name = adventure_text.inventory_line(line)
+            if name is None:
                 continue
-            name = regex_item.search(line).group(2)
             if not name in self.inventory:
                 logger.error(self.pos() + "Unexpected item in inventory: " + name)
             if not name in self.basic_inventory:
                 self.makemove('inc ' + name + '\n')
-        self.inventory = self.basic_inventory.copy()
+        self.inventory = Counter(self.basic_inventory)
+
 
 
 
+    # -------------------------------------------------------------------#
+    # Traverse rooms for info.
+    # -------------------------------------------------------------------#
+    def explore(self):
+        while self.unvisited_coords:
+            text = self.go_to_the_room(self.unvisited_coords.pop())
+            self.parse_room(text)
+
 
     # -------------------------------------------------------------------#
     # BOT GO!
@@ -650,12 +451,9 @@ class ExplorerBot(Bot):
     def run(self, UM):
         logger.info("\n\n  --- RUN ---")
         self.UM = UM
-        self.log += UM.get_output()
+        start = UM.instructions_executed
 
-        # traverse rooms for info
-        while self.unvisited_coords:
-            text = self.go_to_the_room(self.unvisited_coords.pop())
-            self.parse_room(text)
+        self.explore()
 
         # assembly target items.
         assembly_order = ['downloader']
@@ -664,19 +462,20 @@ class ExplorerBot(Bot):
             self.makemove('take ' + target + '\n')
             self.basic_inventory.append(target)
             # find rooms with missing details:
+            details = {}    # [ coord : details ]
             for detail in self.targets[target]:
                 for coord in self.rooms:
-                    room = self.rooms[coord]
-                    if detail in room.trash.keys():
+                    if detail in self.rooms[coord].trash.keys():
+                        details.setdefault(coord, []).append(detail)
                         break
-                else: continue # not in this room
-                # detail found
+            for coord in self.plan_tour(list(details)):
                 self.go_to_the_room(coord)
-                self.assemble_target_detail(room, target, detail)
-            else: return       # nothing to make in this room            
+                for detail in details[coord]:
+                    self.assemble_target_detail(self.rooms[coord], target, detail)
 
         self.makemove('quit\nlogout\n')
         self.log_strangelets()
+        logger.info("%d instructions executed by bot" % (UM.instructions_executed - start))
         return
 
 
@@ -711,10 +510,10 @@ class Item:
         return self.adj + self.type
 
     def condition(self):
-        return self.result + self.missing
+        return (self.result, ) + self.missing if self.missing else self.result
 
     def set_condition(self, condition):
-        self.missing = (condition[1:], )
+        self.missing = tuple(condition[1:])
         self.result = condition[0]
         assert not isinstance(self.result, list)
         if isinstance(self.result, tuple):
@@ -755,6 +554,324 @@ class Instruction:
             yield from child.traverse()
 
 
+# =========================== ASSEMBLY SEARCH ===========================#
+
+# -----------------------------------------------------------------------#
+# Makes instruction trees for repairing an item with the items of
+# the room.
+# Subtree is (fullname, stages): stages as made by repair_stages, with
+# subtrees in place of parts. Options for a list of parts are made
+# lazily and memoized on (parts, free items of the types these parts
+# may be made of), so e.g. choice of a screw does not repeat the search
+# for a transistor, and the first tree comes without making all others.
+# A (sub)tree is dropped as soon as it is made if it would ever hold
+# more than `slots` items in inventory, counting each item from its take
+# until the earliest take after which it can be combined.
+# -----------------------------------------------------------------------#
+class AssemblySearch:
+    def __init__(self, room, slots):
+        self.slots = slots
+        self.position = { name : i for i, name in enumerate(room.pile) }
+        self.items = {}     # [ basetype : [items] ] in pile order
+        for basetype, items in room.trash.items():
+            items = [item for item in items if item.fullname() in self.position]
+            self.items[basetype] = sorted(items, key=lambda item: self.position[item.fullname()])
+        self.memo = {}      # [ (parts, free) : (options made, generator) ]
+        self.usable_names = {}
+        self.nodes = 0      # options lists started, just for infolog
+
+
+    # -------------------------------------------------------------------#
+    # Yields Instruction trees for item `name` (not from the pile).
+    # -------------------------------------------------------------------#
+    def trees(self, name, needed, current):
+        stages = repair_stages(needed, current)
+        if stages is None:
+            return
+        parts = tuple(part for parts in stages for part in parts)
+        for subtrees, _, _ in self.parts_options(parts, frozenset(self.position)):
+            yield self.instruction((name, self.regroup(stages, subtrees)))
+
+
+    # -------------------------------------------------------------------#
+    # Yields (subtrees, fullnames used, spans of every subtree) for the
+    # parts from free items, from the memo as far as it goes.
+    # -------------------------------------------------------------------#
+    def parts_options(self, parts, free):
+        if not parts:
+            yield ((), frozenset(), ())
+            return
+        free = free & frozenset().union(*(self.usable(getbasetype(part)) for part in parts))
+        key = (parts, free)
+        if not key in self.memo:
+            self.nodes += 1
+            self.memo[key] = ([], self.make_parts_options(parts, free))
+        options, generator = self.memo[key]
+        i = 0
+        while True:
+            if i == len(options):
+                option = next(generator, None)
+                if option is None:
+                    return
+                options.append(option)
+            yield options[i]
+            i += 1
+
+
+    # -------------------------------------------------------------------#
+    # Equal parts take items in pile order, so that no combination is
+    # repeated.
+    # -------------------------------------------------------------------#
+    def make_parts_options(self, parts, free):
+        first, rest = parts[0], parts[1:]
+        for tree, used, spans in self.part_options(first, free):
+            for subtrees, rest_used, rest_spans in self.parts_options(rest, free - used):
+                if (rest and rest[0] == first and
+                        self.position[subtrees[0][0]] < self.position[tree[0]]):
+                    continue
+                forest_spans = (spans, ) + rest_spans
+                if self.peak(span for spans in forest_spans for span in spans) <= self.slots:
+                    yield ((tree, ) + subtrees, used | rest_used, forest_spans)
+
+
+    # -------------------------------------------------------------------#
+    # Yields (subtree, fullnames used, spans) for one needed part.
+    # Spans are (take, earliest combine) of every item, the root last;
+    # while the parent is unknown, the root is combined after its last
+    # part is taken.
+    # -------------------------------------------------------------------#
+    def part_options(self, needed, free):
+        for item in self.items.get(getbasetype(needed), []):
+            name = item.fullname()
+            if not name in free or not item.reachable(needed):
+                continue
+            position = self.position[name]
+            stages = repair_stages(needed, item.condition())
+            parts = tuple(part for parts in stages for part in parts)
+            for subtrees, used, forest_spans in self.parts_options(parts, free - {name}):
+                spans, last = [], position
+                for subtree_spans in forest_spans:
+                    take, subtree_last = subtree_spans[-1]
+                    spans += subtree_spans[:-1]
+                    spans.append((take, max(subtree_last, position)))
+                    last = max(last, subtree_last)
+                spans.append((position, last))
+                if self.peak(spans) <= self.slots:
+                    yield ((name, self.regroup(stages, subtrees)), used | {name}, tuple(spans))
+
+
+    # -------------------------------------------------------------------#
+    # Fullnames of all items that may go into a part of basetype.
+    # -------------------------------------------------------------------#
+    def usable(self, basetype):
+        if not basetype in self.usable_names:
+            types, todo = set(), [basetype]
+            while todo:
+                t = todo.pop()
+                if t in types: continue
+                types.add(t)
+                for item in self.items.get(t, []):
+                    condition = item.condition()
+                    while isinstance(condition, tuple):
+                        todo += [getbasetype(part) for part in condition[1:]]
+                        condition = condition[0]
+            self.usable_names[basetype] = frozenset(
+                item.fullname() for t in types for item in self.items.get(t, []))
+        return self.usable_names[basetype]
+
+
+    @staticmethod
+    def regroup(stages, subtrees):
+        grouped, i = [], 0
+        for parts in stages:
+            grouped.append(subtrees[i:i + len(parts)])
+            i += len(parts)
+        return grouped
+
+
+    # -------------------------------------------------------------------#
+    # Most items held at once for the spans, a lower bound of what
+    # simulation will hold.
+    # -------------------------------------------------------------------#
+    @staticmethod
+    def peak(spans):
+        events = []     # combines go before takes at the same position
+        for take, combine in spans:
+            if take < combine:
+                events += [(take, 1), (combine, -1)]
+        held = peak = 0
+        for _, change in sorted(events):
+            held += change
+            peak = max(peak, held)
+        return peak
+
+
+    # -------------------------------------------------------------------#
+    # Instruction tree for a subtree: each stage but the last is a child
+    # instruction for the same item, as in SAMPLE INSTRUCTION TREE.
+    # -------------------------------------------------------------------#
+    def instruction(self, tree, parent=None):
+        name, stages = tree
+        I = Instruction(name)
+        I.parent = parent
+        if len(stages) > 1:
+            I.children.append(self.instruction((name, stages[:-1]), I))
+        for subtree in stages[-1]:
+            I.children.append(self.instruction(subtree, I))
+        return I
+
+
+# ========================= ASSEMBLY SIMULATION =========================#
+
+# -----------------------------------------------------------------------#
+# Carries out instruction trees on the pile: every item is taken, kept
+# if the tree needs it and incinerated otherwise, and every complete
+# instruction is combined into its parent as soon as it can be.
+#
+# Instructions are keyed by (fullname, stage level), so that those of
+# different trees compare. The state before every position of the pile
+# is kept, and the next tree starts from the first position where it
+# differs from the previous one: trees from AssemblySearch come in
+# order and neighbours share most of their items.
+# After the tree is checked, the inventory is what it leaves.
+# -----------------------------------------------------------------------#
+class AssemblySimulation:
+    def __init__(self, pile, inventory, limit, incremental=True):
+        self.pile = list(pile)
+        self.position = { name : i for i, name in enumerate(self.pile) }
+        self.basic_inventory = Counter(inventory)
+        self.limit = limit
+        self.incremental = incremental
+        self.signature = []     # instructions of the previous tree, in pile order
+        self.states = []        # state before every position, for the previous tree
+        self.commands = []
+        self.inventory = Counter()
+        self.done = Counter()   # [ key : children finished ]
+        self.finished = set()   # keys of the instructions carried out
+        self.takes = 0          # positions simulated, just for infolog
+
+
+    # -------------------------------------------------------------------#
+    # Commands that carry out the tree, None if it does not work.
+    # -------------------------------------------------------------------#
+    def run(self, root):
+        tree = SimulationTree(root, self.position)
+        start = self.restore(tree.signature)
+        self.signature = tree.signature
+
+        for position in range(start, len(self.pile)):
+            self.states.append((self.inventory.copy(), self.done.copy(),
+                                self.finished.copy(), len(self.commands)))
+            if sum(self.inventory.values()) >= self.limit:
+                return None     # no more place :(
+
+            item = self.pile[position]
+            self.takes += 1
+            self.commands.append('take ' + item + '\n')
+            if not item in tree.keys:
+                self.commands.append('inc ' + item + '\n')
+            else:
+                self.inventory[item] += 1
+                if self.revise(tree, item):
+                    return self.commands.copy()
+        return None
+
+
+    # -------------------------------------------------------------------#
+    # Returns the position to run from, with the state before it.
+    # -------------------------------------------------------------------#
+    def restore(self, signature):
+        start = 0
+        if self.incremental:
+            start = len(self.pile)
+            for old, new in zip(self.signature, signature):
+                if old != new:
+                    start = min(old[0], new[0])
+                    break
+            else:
+                if len(self.signature) != len(signature):
+                    longer = max(self.signature, signature, key=len)
+                    start = longer[min(len(self.signature), len(signature))][0]
+            start = max(0, min(start, len(self.states) - 1))
+
+        if start == 0:
+            self.inventory = self.basic_inventory.copy()
+            self.done, self.finished, self.commands = Counter(), set(), []
+        else:
+            inventory, done, finished, commands = self.states[start]
+            self.inventory, self.done, self.finished = inventory.copy(), done.copy(), finished.copy()
+            del self.commands[commands:]
+        del self.states[start:]
+        return start
+
+
+    # -------------------------------------------------------------------#
+    # Carry out everything the new item makes possible.
+    # Return True, if root instruction is finished.
+    # -------------------------------------------------------------------#
+    def revise(self, tree, item):
+        ready = deque()
+        for key in tree.keys[item]:
+            ready.append(key)
+            ready.extend(tree.children[key])
+        while ready:
+            key = ready.popleft()
+            if (key in self.finished or not self.inventory[key[0]]
+                    or self.done[key] < len(tree.children[key])):
+                continue
+            # instruction is complete.
+            parent = tree.parent[key]
+            if parent is None:
+                # finished the last instruction.
+                return True
+            elif not self.inventory[parent[0]]:
+                continue
+            elif parent[0] == key[0]:
+                # stage complete
+                pass
+            elif parent in tree.stage and not tree.stage[parent] in self.finished:
+                # wrong stage
+                continue
+            else:
+                self.commands.append('combine ' + parent[0] + ' with ' + key[0] + '\n')
+                self.inventory[key[0]] -= 1
+                if not self.inventory[key[0]]:
+                    del self.inventory[key[0]]
+            self.finished.add(key)
+            self.done[parent] += 1
+            ready.append(parent)
+            ready.extend(tree.children[parent])
+        return False
+
+
+# -----------------------------------------------------------------------#
+# Instruction tree indexed for simulation, (fullname, stage level) keys.
+# Signature lists the instructions in pile order with what simulation
+# depends on: up to the first difference two trees run the same.
+# -----------------------------------------------------------------------#
+class SimulationTree:
+    def __init__(self, root, position):
+        self.parent = {}
+        self.children = {}
+        self.stage = {}     # [ key : key of the stage child ]
+        self.keys = {}      # [ fullname : keys ]
+        self.add(root, 0, None)
+        self.signature = sorted((position.get(key[0], -1), key[1], key[0], self.parent[key],
+                                 len(self.children[key])) for key in self.parent)
+
+    def add(self, I, level, parent):
+        key = (I.itemname, level)
+        self.parent[key] = parent
+        self.children[key] = []
+        self.keys.setdefault(I.itemname, []).append(key)
+        for child in I.children:
+            child_key = self.add(child, level + 1 if child.itemname == I.itemname else 0, key)
+            self.children[key].append(child_key)
+            if child_key[0] == I.itemname:
+                self.stage[key] = child_key
+        return key
+
+
 # =======================================================================#
 
 
@@ -775,10 +892,15 @@ def run_commands_from_file(UM, filename):
 
 
 def main():
+    logging.basicConfig(
+        level=logging.DEBUG,
+        filename='bot.log',
+        format='%(levelname)-10s %(message)s'
+        )
     timestart = time()
 
     # Load machine and run pre-defined commands from file
-    UM = UniversalMachine(Path('umix.umz').read_bytes())
+    UM = UniversalMachine(Path('umix.umz'))
     infile = Path('logs/howie.in').open('rb')
     outfile = Path('logs/howie.out').open('wb')
     writers = ForkWriter(ByteWriter(outfile), TextWriter(sys.stdin))
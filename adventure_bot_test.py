@@ -0,0 +1,112 @@
+from adventure_bot import ExplorerBot, Room, Item, AssemblySearch, AssemblySimulation, repair_stages
+
+
+# room with items given top of the pile first, as (fullname, condition)
+def make_room(*items):
+    room = Room(complex(0, 0))
+    for fullname, condition in items:
+        adj, basetype = fullname.split(' ', 1)
+        item = Item(basetype, adj + ' ')
+        item.set_condition(condition if isinstance(condition, tuple) else [condition])
+        room.trash.setdefault(basetype, []).append(item)
+        room.pile.append(fullname)
+    return room
+
+
+def make_bot(room):
+    bot = ExplorerBot()
+    bot.rooms[bot.position] = room
+    bot.basic_inventory = ['downloader']
+    return bot
+
+
+def test_repair_stages():
+    assert repair_stages('A', 'A') == [()]
+    assert repair_stages('A', ('A', 'b')) == [('b', )]
+    assert repair_stages('A', (('A', 'b'), 'd', 'c')) == [('c', 'd'), ('b', )]
+    assert repair_stages(('A', 'b'), (('A', 'b'), 'c')) == [('c', )]
+    assert repair_stages(('A', 'b'), 'A') is None
+
+
+def test_find_commands():
+    room = make_room(('blue display', ('display', 'screw', ('transistor', 'cache'))),
+                     ('plain A-1234-XYZ', 'A-1234-XYZ'),
+                     ('red screw', 'screw'),
+                     ('white transistor', 'transistor'),
+                     ('green transistor', ('transistor', 'cache')))
+    bot = make_bot(room)
+    assert bot.find_commands(room, 'downloader', 'display') == [
+        'take blue display\n',
+        'take plain A-1234-XYZ\n', 'inc plain A-1234-XYZ\n',
+        'take red screw\n', 'combine blue display with red screw\n',
+        'take white transistor\n', 'inc white transistor\n',
+        'take green transistor\n', 'combine blue display with green transistor\n',
+        'combine downloader with blue display\n']
+    assert bot.simulation_count == 1
+
+
+def test_search_is_memoized():
+    colors = ['red', 'orange', 'yellow', 'green', 'cyan', 'blue', 'violet', 'black']
+    room = make_room(('blue display', ('display', 'screw', 'screw', 'transistor')),
+                     *((color + ' screw', 'screw') for color in colors),
+                     *((color + ' transistor', 'transistor') for color in colors))
+    search = AssemblySearch(room, 4)
+    trees = list(search.trees('downloader', 'downloader', ('downloader', 'display')))
+    assert len(trees) == 8 * 7 // 2 * 8
+    # a transistor is searched for once, not for every pair of screws
+    assert search.nodes == 1 + 1 + 8 + 1
+
+    bot = make_bot(room)
+    commands = bot.find_commands(room, 'downloader', 'display')
+    assert commands[-1] == 'combine downloader with blue display\n'
+    assert bot.simulation_count == 1
+
+
+def test_inventory_limit_prunes():
+    # five screws must be held until the display is taken
+    colors = ['red', 'orange', 'yellow', 'green', 'cyan']
+    room = make_room(*((color + ' screw', 'screw') for color in colors),
+                     ('blue display', ('display', 'screw', 'screw', 'screw', 'screw', 'screw')))
+    bot = make_bot(room)
+    assert bot.find_commands(room, 'downloader', 'display') is None
+    assert bot.simulation_count == 0
+
+    bot.INVENTORY_LIMIT = 7
+    assert bot.find_commands(room, 'downloader', 'display') is not None
+
+
+def test_incremental_simulation():
+    room = make_room(('blue display', ('display', 'screw', ('transistor', 'cache'))),
+                     ('white transistor', ('transistor', 'cache', 'cache')),
+                     ('plain A-1234-XYZ', 'A-1234-XYZ'),
+                     ('green transistor', ('transistor', 'cache')),
+                     ('red cache', 'cache'),
+                     ('blue cache', 'cache'),
+                     ('red screw', 'screw'),
+                     ('green screw', 'screw'))
+    trees = list(AssemblySearch(room, 4).trees('downloader', 'downloader', ('downloader', 'display')))
+    assert len(trees) == 3 * 2
+
+    replay = AssemblySimulation(room.pile, ['downloader'], 3, incremental=False)
+    incremental = AssemblySimulation(room.pile, ['downloader'], 3)
+    results = [replay.run(tree) for tree in trees]
+    assert [incremental.run(tree) for tree in trees] == results
+    # white transistor waits for a cache with the display already taken
+    assert results.count(None) == 2 * 2
+    assert incremental.takes < replay.takes
+    assert incremental.inventory == replay.inventory
+
+
+def test_parse_directions():
+    bot = ExplorerBot()
+    room = bot.rooms[bot.position]
+    bot.parse_directions('From here, you can go north or east', room)
+    assert bot.graph.neighbours[0j] == {-1j, 1}
+    bot.position = 1
+    bot.parse_directions('From here, you can go north or west', bot.rooms[1])
+    bot.position = 1 - 1j
+    bot.parse_directions('From here, you can go south or west', bot.rooms[1 - 1j])
+    assert bot.find_path(-1j) == [-1]
+    bot.position = 0
+    assert bot.find_path(1 - 1j) in ([-1j, 1], [1, -1j])
+    assert bot.plan_tour([1 - 1j, 1, -1j]) in ([1, 1 - 1j, -1j], [-1j, 1 - 1j, 1])
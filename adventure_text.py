@@ -0,0 +1,153 @@
+# Parser of the adventure game text for adventure_bot: sentences, lines
+# of room descriptions, item descriptions and conditions of broken items.
+#
+# Patterns are compiled once. A sentence is matched by one alternation
+# of everything it may be; a condition is read in one pass of a
+# tokenizer, with a stack for brackets:
+#   'a radio missing (a transistor missing a cache) and a USB cable'
+#   -> ('radio', ('transistor', 'cache'), 'USB cable')
+
+from collections import namedtuple
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+DOTTED_WORDS = re.compile(r'(incl|construction|Bus 2)\.')
+PROMPT = re.compile(r'>:.*')
+ANSWER_END = re.compile(r'>: ?')
+SENTENCE_END = re.compile(r'\.|\n\n')
+
+ROOM_LINE = re.compile(r'''
+      (?P<ignore> You\ are\ standing | A\ sign\ reads | There\ are\ more )
+    | .+here\ is\ an?\ (?:\(broken\)\ )? (?P<item> .+?) (?:\ here)?$
+    | (?P<directions> From\ here,)
+    ''', re.VERBOSE)
+
+STANDARD_NAME = re.compile(r'.*\w\-(\w){4}\-(\w){3}')    # X-XXXX-XXX
+
+ITEM_LINE = re.compile(r'''
+      .*?The\ (?P<basetype> .*?)\ is.*
+    | Interestingly,\ this\ one\ is\ (?P<adjective> .*)
+    | Also,\ it\ is\ broken:\ it\ is\ (?P<condition> .*)
+    ''', re.VERBOSE)
+
+CONDITION_TOKEN = re.compile(r'''\s*(?:
+      (?P<open> \( )
+    | (?P<close> \) )
+    | (?P<separator> (?:missing|and|an?)(?![^\s(),]) | , )
+    | (?P<word> [^\s(),]+ )
+    )''', re.VERBOSE)
+
+INVENTORY_LINE = re.compile(r'^an? (?:\(broken\) )?(.+)(?:[.,]| and)$')
+
+ItemText = namedtuple('ItemText', 'basetype adj condition')
+
+
+# -----------------------------------------------------------------------#
+# Given "English" text, convert it into list of sentences.
+# Delete the first line (command) and '>: ' (command prompts).
+# Hope there are no unexpected dots in the text.
+# -----------------------------------------------------------------------#
+def split_sentences(text):
+    text = DOTTED_WORDS.sub(r'\1', text)
+    text = PROMPT.sub('', text.partition('\n')[2] if '\n' in text else text)
+    sentences = []
+    for line in SENTENCE_END.split(text):
+        line = line.replace('\n', ' ').lstrip(' ')
+        if line:
+            sentences.append(line)
+    return sentences
+
+
+# -----------------------------------------------------------------------#
+# Answers to a batch of commands: the text up to and including each
+# prompt, so that every answer reads as if its command was sent alone
+# (the next command is echoed on the prompt line).
+# -----------------------------------------------------------------------#
+def split_answers(text):
+    answers = []
+    start = 0
+    for match in ANSWER_END.finditer(text):
+        answers.append(text[start:match.end()])
+        start = match.end()
+    if text[start:].strip():
+        answers.append(text[start:])
+    return answers
+
+
+# -----------------------------------------------------------------------#
+# Kind of a room description sentence with its value:
+# ('item', fullname), ('directions', line), ('ignore', line) or
+# ('strange', line) for anything unexpected.
+# -----------------------------------------------------------------------#
+def room_line(line):
+    match = ROOM_LINE.match(line)
+    if match is None:
+        return 'strange', line
+    if match.lastgroup == 'item':
+        return 'item', match.group('item')
+    return match.lastgroup, line
+
+
+# -----------------------------------------------------------------------#
+# Basetype, adjective (with a trailing space, '' if none) and condition
+# from the sentences of an item description; None for what is not there.
+# The condition is [basetype] for a pristine item, as Item.set_condition
+# takes it.
+# -----------------------------------------------------------------------#
+def parse_item_text(sentences):
+    basetype = adj = condition = None
+    for line in sentences:
+        match = ITEM_LINE.match(line)
+        if match is None:
+            continue
+        if match.lastgroup == 'basetype':
+            basetype = match.group('basetype')
+            condition = [basetype]      # default - item is pristine.
+        elif match.lastgroup == 'adjective':
+            adj = match.group('adjective') + ' '
+        else:
+            condition = parse_condition(match.group('condition'))
+    return ItemText(basetype, adj or '', condition)
+
+
+# -----------------------------------------------------------------------#
+# Name of the item on a line of 'inventory' output, None if no item.
+# -----------------------------------------------------------------------#
+def inventory_line(line):
+    match = INVENTORY_LINE.match(line)
+    return match.group(1) if match else None
+
+
+# -----------------------------------------------------------------------#
+# Condition tuple out of its text; names are the words between
+# separators ('missing', 'and', articles, commas) and brackets.
+# -----------------------------------------------------------------------#
+def parse_condition(text):
+    stack = [[]]
+    name = []
+    for token in CONDITION_TOKEN.finditer(text):
+        kind = token.lastgroup
+        if kind == 'word':
+            name.append(token.group('word'))
+            continue
+        if name:
+            stack[-1].append(' '.join(name))
+            name = []
+        if kind == 'open':
+            stack.append([])
+        elif kind == 'close':
+            if len(stack) == 1:
+                logger.error('Unexpected closing bracket in ' + text)
+                break
+            group = tuple(stack.pop())
+            stack[-1].append(group)
+    if name:
+        stack[-1].append(' '.join(name))
+    if len(stack) > 1:
+        logger.error('Missing closing bracket in ' + text)
+        while len(stack) > 1:
+            group = tuple(stack.pop())
+            stack[-1].append(group)
+    return tuple(stack[0])
@@ -0,0 +1,47 @@
+from adventure_text import split_sentences, split_answers, room_line, parse_item_text, parse_condition, inventory_line
+
+
+def test_split_sentences():
+    text = ('go north\nJunk Room\n\nYou are standing in a room.\n'
+            'There is a red X-1234-ABC of the incl. construction set here.\n\n>: ')
+    assert split_sentences(text) == [
+        'Junk Room', 'You are standing in a room',
+        'There is a red X-1234-ABC of the incl construction set here']
+
+
+def test_split_answers():
+    text = 'x a\nThe a is here.\n\n>: x b\nThe b is here.\n\n>: '
+    assert split_answers(text) == ['x a\nThe a is here.\n\n>: ', 'x b\nThe b is here.\n\n>: ']
+    assert split_answers(text + 'quit\nBye.\n') == split_answers(text) + ['quit\nBye.\n']
+    assert split_answers('') == []
+
+
+def test_room_line():
+    assert room_line('There is a (broken) red X-1234-ABC here') == ('item', 'red X-1234-ABC')
+    assert room_line('Also here is an orange display') == ('item', 'orange display')
+    assert room_line('From here, you can go east') == ('directions', 'From here, you can go east')
+    assert room_line('A sign reads: here is a joke')[0] == 'ignore'
+    assert room_line('Something moves') == ('strange', 'Something moves')
+
+
+def test_parse_item_text():
+    assert parse_item_text(['The display is a screen', 'Interestingly, this one is red']) == (
+        'display', 'red ', ['display'])
+    assert parse_item_text(['The display is a screen',
+                            'Also, it is broken: it is a display missing a screw']) == (
+        'display', '', ('display', 'screw'))
+
+
+def test_parse_condition():
+    assert parse_condition('a radio missing a (transistor missing a cache) and an USB cable') == (
+        'radio', ('transistor', 'cache'), 'USB cable')
+    assert parse_condition('a (X-1234-ABC missing a screw) missing a Y-0000-AAA, a nut') == (
+        ('X-1234-ABC', 'screw'), 'Y-0000-AAA', 'nut')
+    assert parse_condition('a radio missing a (transistor missing a cache') == (
+        'radio', ('transistor', 'cache'))
+
+
+def test_inventory_line():
+    assert inventory_line('a (broken) red X-1234-ABC and') == 'red X-1234-ABC'
+    assert inventory_line('an orange display.') == 'orange display'
+    assert inventory_line('You are carrying:') is None
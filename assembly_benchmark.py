@@ -0,0 +1,135 @@
+# Benchmark of instruction tree search and simulation of adventure_bot
+# on generated rooms, one room per downloader detail.
+# For every detail the first trees made by AssemblySearch (all of them
+# are too many with several copies of a part) are simulated twice:
+# replaying the pile from the top for each tree, and incrementally;
+# then the bot looks for the commands as it does in the game.
+#
+# usage:
+# assembly_benchmark                    5 rooms, seed 0
+# assembly_benchmark --seed 3 --depth 3
+
+import argparse
+import random
+from itertools import islice
+from time import perf_counter
+
+from adventure_bot import ExplorerBot, Room, Item, AssemblySearch, AssemblySimulation
+
+COLORS = ['red', 'orange', 'yellow', 'green', 'cyan', 'blue', 'violet', 'black',
+          'white', 'gray', 'pink', 'brown', 'sepia', 'magenta', 'beige', 'indigo']
+MISSING = 'Z-0000-ZZZ'      # part that is nowhere in the room
+
+
+def standard_name(rng: random.Random) -> str:
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return '%s-%04d-%s' % (rng.choice(letters), rng.randrange(10000),
+                           ''.join(rng.choice(letters) for _ in range(3)))
+
+
+# Room with a broken detail, items to repair it (`copies` of every part,
+# broken `depth` levels deep at most), decoys that cannot be repaired
+# and junk, in random pile order.
+def random_room(rng: random.Random, detail: str, *,
+                types: int = 4, depth: int = 2, copies: int = 3, junk: int = 10) -> Room:
+    pool = [standard_name(rng) for _ in range(types)]
+    items = []
+    colors = {}
+
+    def add(basetype, condition):
+        n = colors.get(basetype, 0)
+        colors[basetype] = n + 1
+        adj = COLORS[n % len(COLORS)] + (str(n // len(COLORS)) if n >= len(COLORS) else '')
+        items.append((adj, basetype, condition))
+
+    def broken(basetype, level):
+        if level == 0 or rng.random() < 0.4:
+            return basetype
+        parts = [rng.choice(pool) for _ in range(rng.randint(1, 2))]
+        for part in parts:
+            for _ in range(rng.randint(1, copies)):
+                add(part, broken(part, level - 1))
+        return (basetype, *parts)
+
+    parts = [rng.choice(pool) for _ in range(3)]
+    add(detail, (detail, *parts))
+    for part in parts:
+        for _ in range(rng.randint(1, copies)):
+            add(part, broken(part, depth))
+    for basetype in pool:
+        add(basetype, (basetype, MISSING))
+    for _ in range(junk):
+        add(standard_name(rng), None)
+
+    rng.shuffle(items)
+    room = Room(complex(0, 0))
+    for adj, basetype, condition in items:
+        item = Item(basetype, adj + ' ')
+        item.set_condition(condition if isinstance(condition, tuple) else [basetype])
+        room.trash.setdefault(basetype, []).append(item)
+        room.pile.append(item.fullname())
+    return room
+
+
+# simulates every tree, returns (seconds, positions taken, results)
+def simulate_all(room: Room, trees: list, inventory: list, limit: int, incremental: bool):
+    simulation = AssemblySimulation(room.pile, inventory, limit, incremental=incremental)
+    start = perf_counter()
+    results = [simulation.run(tree) for tree in trees]
+    return perf_counter() - start, simulation.takes, results
+
+
+def benchmark(room: Room, target: str, detail: str, trees: int = 300) -> dict:
+    bot = ExplorerBot()
+    bot.rooms[bot.position] = room
+    bot.basic_inventory = [target]
+    slots = bot.INVENTORY_LIMIT - len(bot.basic_inventory) - 1
+
+    start = perf_counter()
+    search = AssemblySearch(room, slots)
+    trees = list(islice(search.trees(target, target, (target, detail)), trees))
+    search_time = perf_counter() - start
+
+    replay = simulate_all(room, trees, bot.basic_inventory, bot.INVENTORY_LIMIT, False)
+    incremental = simulate_all(room, trees, bot.basic_inventory, bot.INVENTORY_LIMIT, True)
+    if replay[2] != incremental[2]:
+        raise RuntimeError(f'{detail}: incremental simulation disagrees with replay')
+
+    start = perf_counter()
+    commands = bot.find_commands(room, target, detail)
+    return {'detail': detail,
+            'pile': len(room.pile),
+            'trees': len(trees),
+            'working': sum(result is not None for result in replay[2]),
+            'nodes': search.nodes,
+            'search': search_time,
+            'replay': replay[0],
+            'replay_takes': replay[1],
+            'incremental': incremental[0],
+            'incremental_takes': incremental[1],
+            'find_commands': perf_counter() - start,
+            'simulations': bot.simulation_count,
+            'found': commands is not None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', default='downloader')
+    parser.add_argument('--types', type=int, default=4, help='part types per room')
+    parser.add_argument('--depth', type=int, default=2, help='nesting of broken parts')
+    parser.add_argument('--copies', type=int, default=3, help='most items per part')
+    parser.add_argument('--junk', type=int, default=10, help='useless items per room')
+    parser.add_argument('--trees', type=int, default=300, help='most trees to simulate per detail')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f'{"detail":14} {"pile":>4} {"trees":>6} {"work":>5} {"nodes":>6} {"search":>8} '
+          f'{"replay":>8} {"takes":>7} {"increm.":>8} {"takes":>7} {"find":>8}')
+    for detail in ExplorerBot().targets[args.target]:
+        room = random_room(rng, detail, types=args.types, depth=args.depth,
+                           copies=args.copies, junk=args.junk)
+        r = benchmark(room, args.target, detail, args.trees)
+        print(f'{r["detail"]:14} {r["pile"]:4} {r["trees"]:6} {r["working"]:5} {r["nodes"]:6} '
+              f'{r["search"]:8.4f} {r["replay"]:8.4f} {r["replay_takes"]:7} '
+              f'{r["incremental"]:8.4f} {r["incremental_takes"]:7} {r["find_commands"]:8.4f}')
@@ -0,0 +1,11 @@
+from assembly_benchmark import random_room, benchmark
+
+import random
+
+
+def test_benchmark():
+    room = random_room(random.Random(1), 'display', types=3, depth=1, copies=2, junk=3)
+    result = benchmark(room, 'downloader', 'display', trees=50)
+    assert 0 < result['trees'] <= 50
+    assert result['incremental_takes'] <= result['replay_takes']
+    assert result['found'] or not result['working']
@@ -1,48 +1,159 @@
 import io
+import re
+import codecs
+from collections import deque, defaultdict
+from pathlib import Path
+from enum import Enum, auto
 from typing import List, Optional
 from abc import abstractmethod
 
+CHUNK_SIZE = 4096
+
+
+# Circular byte queue, readers keep data read from stream
+# but not consumed yet here. Grows if a chunk does not fit.
+class RingBuffer:
+    def __init__(self, capacity: int = CHUNK_SIZE):
+        self.data = bytearray(max(capacity, 1))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def put(self, chunk: bytes):
+        if self.size + len(chunk) > len(self.data):
+            self.grow(self.size + len(chunk))
+        end = (self.start + self.size) % len(self.data)
+        first = min(len(chunk), len(self.data) - end)
+        self.data[end:end + first] = chunk[:first]
+        self.data[:len(chunk) - first] = chunk[first:]
+        self.size += len(chunk)
+
+    def get(self, n: int) -> bytes:
+        n = min(n, self.size)
+        end = self.start + n
+        if end <= len(self.data):
+            chunk = bytes(self.data[self.start:end])
+        else:
+            chunk = bytes(self.data[self.start:]) + bytes(self.data[:end - len(self.data)])
+        self.start = end % len(self.data)
+        self.size -= n
+        return chunk
+
+    # position of byte counting from the head, -1 if not found
+    def find(self, byte: int) -> int:
+        capacity = len(self.data)
+        end = self.start + self.size
+        if end <= capacity:
+            i = self.data.find(byte, self.start, end)
+            return i if i < 0 else i - self.start
+        i = self.data.find(byte, self.start)
+        if i >= 0:
+            return i - self.start
+        i = self.data.find(byte, 0, end - capacity)
+        return i if i < 0 else i + capacity - self.start
+
+    def grow(self, needed: int):
+        capacity = len(self.data)
+        while capacity < needed:
+            capacity *= 2
+        size = self.size
+        chunk = self.get(size)
+        self.data = bytearray(capacity)
+        self.data[:size] = chunk
+        self.start = 0
+        self.size = size
+
+# ------------------------------------------------- #
+
+# subclasses override read() and readline()
 class BaseReader:
 
     # returns one byte from stream or None if EOF
     def readbyte(self) -> Optional[int]:
-        return None
+        data = self.read(1)
+        return data[0] if data else None
+
+    # returns up to n bytes, b'' only if EOF
+    def read(self, n: int = CHUNK_SIZE) -> bytes:
+        return b''
+
+    # returns bytes up to newline (inclusive) or limit, b'' only if EOF
+    def readline(self, limit: int = CHUNK_SIZE) -> bytes:
+        return b''
+
+    # fills buffer from the beginning, returns number of bytes read
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
 
+# reader over a stream, reads it by chunks into RingBuffer
+class StreamReader(BaseReader):
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.buffer = RingBuffer(chunk_size)
 
-class TextReader(BaseReader):
+    # reads the next chunk from stream into buffer, False if EOF
+    def fill(self) -> bool:
+        raise NotImplementedError()
+
+    def read(self, n: int = CHUNK_SIZE) -> bytes:
+        if len(self.buffer) == 0 and not self.fill():
+            return b''
+        return self.buffer.get(n)
+
+    def readline(self, limit: int = CHUNK_SIZE) -> bytes:
+        line = bytearray()
+        while len(line) < limit:
+            if len(self.buffer) == 0 and not self.fill():
+                break
+            i = self.buffer.find(ord('\n'))
+            if i >= 0:
+                line += self.buffer.get(min(i + 1, limit - len(line)))
+                if line[-1] == ord('\n'):
+                    break
+            else:
+                line += self.buffer.get(limit - len(line))
+        return bytes(line)
+
+
+class TextReader(StreamReader):
     # stream is fileobject, opened for reading as text
-    def __init__(self, stream, *, encoding='ascii', errors='strict'):
+    def __init__(self, stream, *, encoding='ascii', errors='strict',
+                 chunk_size: int = CHUNK_SIZE):
         assert stream.readable()
+        super().__init__(chunk_size)
         self.stream = stream
         self.encoding = encoding
         self.errors = errors
-        self.buffer = bytearray()
     
-    def readbyte(self) -> Optional[int]:
-        if len(self.buffer) > 0:
-            return self.buffer.pop(0)
-
-        c = self.stream.read(1)
-        if len(c) == 0:
-            return None
-        assert len(c) == 1
-        c = c.encode(encoding=self.encoding, errors=self.errors)
-        self.buffer = c[1:]
-        return c[0]
+    # reads by lines not to block on interactive input
+    def fill(self) -> bool:
+        text = self.stream.readline(self.chunk_size)
+        if len(text) == 0:
+            return False
+        self.buffer.put(text.encode(encoding=self.encoding, errors=self.errors))
+        return True
 
 
-class ByteReader(BaseReader):
+class ByteReader(StreamReader):
     # stream is fileobject, opened for reading as binary
-    def __init__(self, stream):
+    def __init__(self, stream, *, chunk_size: int = CHUNK_SIZE):
         assert stream.readable()
+        super().__init__(chunk_size)
         self.stream = stream
+        # read1 returns what is available instead of waiting for the whole chunk
+        self.read_chunk = getattr(stream, 'read1', stream.read)
     
-    def readbyte(self) -> Optional[int]:
-        c = self.stream.read(1)
-        if len(c) == 0:
-            return None
-        assert len(c) == 1
-        return c[0]
+    def fill(self) -> bool:
+        data = self.read_chunk(self.chunk_size)
+        if len(data) == 0:
+            return False
+        self.buffer.put(data)
+        return True
 
 
 class ForkReader(BaseReader):
@@ -50,59 +161,103 @@ class ForkReader(BaseReader):
         self.reader = reader
         self.writers = writers
     
-    def readbyte(self) -> Optional[int]:
-        byte = self.reader.readbyte()
-        if byte is None:
-            return None
+    def read(self, n: int = CHUNK_SIZE) -> bytes:
+        return self.fork(self.reader.read(n))
+
+    def readline(self, limit: int = CHUNK_SIZE) -> bytes:
+        return self.fork(self.reader.readline(limit))
 
-        for writer in self.writers:
-            writer.writebyte(byte)
-        return byte
+    def fork(self, data: bytes) -> bytes:
+        if data:
+            for writer in self.writers:
+                writer.write(data)
+        return data
 
 
 class SequentialReader(BaseReader):
     def __init__(self, *readers):
-        self.readers = list(readers)
+        self.readers = deque(readers)
     
-    def readbyte(self) -> Optional[int]:
+    def read(self, n: int = CHUNK_SIZE) -> bytes:
         while len(self.readers) > 0:
-            c = self.readers[0].readbyte()
-            if c is None:
-                self.readers.pop(0)
-                continue
-            return c
-        return None
+            data = self.readers[0].read(n)
+            if data:
+                return data
+            self.readers.popleft()
+        return b''
+
+    def readline(self, limit: int = CHUNK_SIZE) -> bytes:
+        while len(self.readers) > 0:
+            data = self.readers[0].readline(limit)
+            if data:
+                return data
+            self.readers.popleft()
+        return b''
 
 # ------------------------------------------------- #
 
+class FlushPolicy(Enum):
+    CHUNK = auto()      # after every write
+    LINE = auto()       # after write that contains newline
+    INPUT = auto()      # only on flush(), run() calls it before waiting for input
+
+
+def flush_needed(policy: FlushPolicy, data: bytes) -> bool:
+    if policy == FlushPolicy.CHUNK:
+        return True
+    if policy == FlushPolicy.LINE:
+        return b'\n' in data
+    return False
+
+# ------------------------------------------------- #
+
+# subclasses override write(), writebyte() is a one-byte write
 class BaseWriter:
 
     def writebyte(self, byte: int):
+        self.write(bytes([byte]))
+
+    def write(self, data: bytes):
+        pass
+
+    def flush(self):
         pass
 
 
 class TextWriter(BaseWriter):
     # stream is fileobject, opened for writing as text
-    def __init__(self, stream, *, encoding='ascii', errors='strict'):
+    def __init__(self, stream, *, encoding='ascii', errors='strict',
+                 flush=FlushPolicy.CHUNK):
         assert stream.writable()
         self.stream = stream
         self.encoding = encoding
         self.errors = errors
+        self.flush_policy = flush
+        # keeps incomplete multibyte characters between writes
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
     
-    def writebyte(self, byte: int):
-        b = bytes([byte]).decode(encoding=self.encoding, errors=self.errors)
-        self.stream.write(b)
+    def write(self, data: bytes):
+        self.stream.write(self.decoder.decode(data))
+        if flush_needed(self.flush_policy, data):
+            self.stream.flush()
+
+    def flush(self):
         self.stream.flush()
 
 
 class ByteWriter(BaseWriter):
     # stream is fileobject, opened for writing as binary
-    def __init__(self, stream):
+    def __init__(self, stream, *, flush=FlushPolicy.CHUNK):
         assert stream.writable()
         self.stream = stream
+        self.flush_policy = flush
     
-    def writebyte(self, byte: int):
-        self.stream.write(bytes([byte]))
+    def write(self, data: bytes):
+        self.stream.write(data)
+        if flush_needed(self.flush_policy, data):
+            self.stream.flush()
+
+    def flush(self):
         self.stream.flush()
 
 
@@ -110,9 +265,94 @@ class ForkWriter(BaseWriter):
     def __init__(self, *writers):
         self.writers = writers
     
-    def writebyte(self, byte: int):
+    def write(self, data: bytes):
         for stream in self.writers:
-            stream.writebyte(byte)
+            stream.write(data)
+
+    def flush(self):
+        for stream in self.writers:
+            stream.flush()
+
+# ------------------------------------------------- #
+
+# PUZZL.TSK=100@1001|14370747643c6d2db0a40ecb4b0bb65
+# | 1 |     |2|
+# problem   score
+SCORE_REGEX = re.compile(rb'(\w*?)\.\w*?=(\d*)@\d*\|\w*')
+SCORE_LINE_LIMIT = 1024     # bytes, longer unfinished lines are not kept for score
+
+
+# every score line has '@', regex is run only on lines around it
+def find_scores(data: bytes, lines):
+    at = data.find(b'@')
+    while at >= 0:
+        start = data.rfind(b'\n', 0, at) + 1
+        end = data.find(b'\n', at)
+        end = len(data) if end < 0 else end
+        m = SCORE_REGEX.search(data, start, end)
+        if m is not None:
+            lines[m[1].decode('ascii')].add(m[0].decode('ascii'))
+        at = data.find(b'@', end)
+
+
+def total_score(scorelines) -> int:
+    return sum(int(SCORE_REGEX.search(line.encode('ascii'))[2])
+               for lines in scorelines.values() for line in lines)
+
+
+# writes total and all score lines by task, returns total
+def write_score(path: Path, scorelines) -> int:
+    score = total_score(scorelines)
+    with path.open('w') as f:
+        f.write(f'Total score: {score}\n')
+        for task in scorelines.keys():
+            f.write('\n' + task + '\n')
+            for line in scorelines[task]:
+                f.write(line + '\n')
+    return score
+
+
+# Matches score lines in output as the machine produces it.
+# Lines split between writes are matched when complete; a line that
+# grows longer than SCORE_LINE_LIMIT is skipped up to its end.
+# On a new score line rewrites score file, if given.
+class ScoreWriter(BaseWriter):
+    def __init__(self, path: Optional[Path] = None, scorelines=None):
+        self.path = path
+        self.scorelines = defaultdict(set)
+        for task, lines in (scorelines or {}).items():
+            self.scorelines[task] |= set(lines)
+        self.line = bytearray()     # unfinished line
+        self.overlong = False       # skipping the rest of a long line
+
+    def write(self, data: bytes):
+        if self.overlong:
+            newline = data.find(b'\n')
+            if newline < 0:
+                return
+            data = data[newline + 1:]
+            self.overlong = False
+        self.line += data
+        end = self.line.rfind(b'\n') + 1
+        if len(self.line) - end > SCORE_LINE_LIMIT:
+            del self.line[end:]
+            self.overlong = True
+        if end == 0:
+            return
+        found = defaultdict(set)
+        find_scores(bytes(self.line[:end]), found)
+        del self.line[:end]
+
+        new = False
+        for task, lines in found.items():
+            new = new or not lines <= self.scorelines[task]
+            self.scorelines[task] |= lines
+        if new and self.path is not None:
+            write_score(self.path, self.scorelines)
+
+    @property
+    def score(self) -> int:
+        return total_score(self.scorelines)
 
 
 __all__ = ['BaseReader', 
@@ -123,4 +363,13 @@ __all__ = ['BaseReader',
            'ForkReader',
            'SequentialReader',
            'ByteReader',
-           'ByteWriter']
\ No newline at end of file
+           'ByteWriter',
+           'FlushPolicy',
+           'RingBuffer',
+           'StreamReader',
+           'ScoreWriter',
+           'SCORE_REGEX',
+           'SCORE_LINE_LIMIT',
+           'find_scores',
+           'total_score',
+           'write_score']
\ No newline at end of file
@@ -33,5 +33,90 @@ def test_io_sequential():
     assert outstring.getvalue() == 'hello world!\n'
 
 
+def test_ring_buffer():
+    buffer = RingBuffer(8)
+    buffer.put(b'abcdef')
+    assert buffer.get(4) == b'abcd'
+    buffer.put(b'ghij')                 # wraps around
+    assert len(buffer) == 6
+    assert buffer.find(ord('i')) == 4
+    assert buffer.find(ord('z')) == -1
+    buffer.put(b'klmnopq')              # grows
+    assert buffer.get(100) == b'efghijklmnopq'
+    assert len(buffer) == 0
+
+
+def test_reader_chunks():
+    stream = io.BytesIO(b'guest\nls -l\nexit')
+    copy = io.BytesIO()
+    reader = ForkReader(ByteReader(stream, chunk_size=4), [ByteWriter(copy)])
+    assert reader.readline() == b'guest\n'
+    assert reader.readline(3) == b'ls '
+    buffer = bytearray(10)
+    assert reader.readinto(buffer) == 3
+    assert buffer[:3] == b'-l\n'
+    assert reader.read() == b'exit'
+    assert reader.read() == b''
+    assert reader.readbyte() is None
+    assert copy.getvalue() == stream.getvalue()
+
+    reader = TextReader(io.StringIO('κόσμε\n'), encoding='utf-8', chunk_size=2)
+    assert reader.readline() == 'κόσμε\n'.encode('utf-8')
+
+
+
+def test_score_writer(tmp_path):
+    path = tmp_path / 'score.txt'
+    scores = ScoreWriter(path, {'ADVTR': {'ADVTR.CMB=5@999999|a0b1'}})
+    scores.write(b'ok\nPUZZL.TSK=10')
+    assert scores.score == 5
+    assert not path.exists()
+    scores.write(b'0@1001|1437')
+    scores.write(b'\n% ')
+    assert scores.score == 105
+    assert path.read_text().startswith('Total score: 105\n')
+    scores.write(b'PUZZL.TSK=100@1001|1437\n')
+    assert scores.score == 105
+
+    # output with no newline is not kept, the line after it is matched
+    for _ in range(100):
+        scores.write(b'.' * 100)
+        assert len(scores.line) <= SCORE_LINE_LIMIT
+    scores.write(b'ANTWO.TSK=1@1001|1437\nADVTR.KEY=20@999999|b1c2\n')
+    assert scores.score == 125
+
+
+class FlushCounter(io.BytesIO):
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_writer_flush_policy():
+    streams = {policy: FlushCounter() for policy in FlushPolicy}
+    output = ForkWriter(*[ByteWriter(stream, flush=policy)
+                          for policy, stream in streams.items()])
+    output.write(b'ls\n')
+    output.write(b'README ')
+    output.writebyte(ord('\n'))
+    output.flush()
+
+    for stream in streams.values():
+        assert stream.getvalue() == b'ls\nREADME \n'
+    assert streams[FlushPolicy.CHUNK].flushes == 4
+    assert streams[FlushPolicy.LINE].flushes == 3
+    assert streams[FlushPolicy.INPUT].flushes == 1
+
+
+def test_text_writer_multibyte():
+    outstring = io.StringIO()
+    output = TextWriter(outstring, encoding='utf-8')
+    data = 'κόσμε'.encode('utf-8')
+    output.write(data[:3])
+    output.write(data[3:])
+    assert outstring.getvalue() == 'κόσμε'
+
+
 if __name__ == '__main__':
     test_io_smoke()
@@ -1,11 +1,29 @@
 # Recompiles um_emulator if outdated.
+#
+# Windows: cl builds cpp/um_emulator.pyd when it is older than the sources.
+# Elsewhere: the system C++ compiler ($CXX, c++ by default) builds
+# cpp/build/<key>/um_emulator<ext>, where key is a hash of the sources,
+# the flags, the Python ABI and the CPU (the code is -march=native).
+# A build is never modified, changed sources get a new key.
+# UM_EMULATOR_PGO=1 adds a pass with profile collected on sandmark.umz.
+# If the build fails or does not import (or with UM_EMULATOR_PYTHON=1),
+# cpp.um_emulator is the pure-Python um_python: same API, ~50x slower.
 
 import os
+import sys
 import time
+import shutil
+import hashlib
+import platform
+import sysconfig
+import tempfile
 import subprocess
 import pathlib
 import contextlib
 
+CXXFLAGS = ['-O3', '-march=native', '-shared', '-fPIC', '-std=c++17']
+PGO_TRAINING = 'sandmark.umz'
+
 
 @contextlib.contextmanager
 def changed_cur_dir(path):
@@ -18,7 +36,7 @@ def changed_cur_dir(path):
 
 
 
-def check_updates():
+def check_updates_msvc():
     project_dir = pathlib.Path(__file__).parent.parent.absolute()
     command = r'cl /std:c++17 /EHsc /LD /O2 um_emulator.cpp C:\Python37\libs\python37.lib /Feum_emulator.pyd /I C:\Python37\include'
 
@@ -36,4 +54,123 @@ def check_updates():
         os.remove('um_emulator.lib')
         os.remove('um_emulator.obj')
 
-check_updates()
+
+# ----------------------- Linux / POSIX ------------------------- #
+
+def cpu_model() -> str:
+    with contextlib.suppress(OSError):
+        for line in pathlib.Path('/proc/cpuinfo').read_text().splitlines():
+            if line.startswith('model name'):
+                return line.split(':', 1)[1].strip()
+    return platform.machine()
+
+
+def build_key(cxx: str, pgo: bool) -> str:
+    cpp_dir = pathlib.Path(__file__).parent
+    h = hashlib.sha256()
+    for part in [(cpp_dir / 'um_emulator.cpp').read_bytes(),
+                 (cpp_dir / '__init__.py').read_bytes(),
+                 cxx, *CXXFLAGS, f'pgo={pgo}',
+                 sysconfig.get_config_var('EXT_SUFFIX'), sys.version, cpu_model()]:
+        h.update(part if isinstance(part, bytes) else part.encode())
+        h.update(b'\0')
+    return h.hexdigest()[:16]
+
+
+def is_clang(cxx: str) -> bool:
+    version = subprocess.run([cxx, '--version'], capture_output=True, text=True).stdout
+    return 'clang' in version
+
+
+def compile_command(cxx: str, source: pathlib.Path, target: pathlib.Path, *extra) -> list:
+    import pybind11
+    return [cxx, *CXXFLAGS, *extra,
+            '-I', pybind11.get_include(),
+            '-I', sysconfig.get_paths()['include'],
+            str(source), '-o', str(target)]
+
+
+# runs the instrumented build on sandmark with every engine
+def train(module_dir: pathlib.Path, program: pathlib.Path):
+    script = ('import sys; sys.path.insert(0, sys.argv[1])\n'
+              'from um_emulator import UniversalMachine\n'
+              'for engine in UniversalMachine.Engine.__members__.values():\n'
+              '    um = UniversalMachine(sys.argv[2], engine=engine)\n'
+              '    while um.state != UniversalMachine.State.HALT: um.run()\n')
+    subprocess.check_call([sys.executable, '-c', script, str(module_dir), str(program)],
+                          stdout=subprocess.DEVNULL)
+
+
+def build(target: pathlib.Path, cxx: str, pgo: bool):
+    cpp_dir = pathlib.Path(__file__).parent
+    source = cpp_dir / 'um_emulator.cpp'
+    training = cpp_dir.parent / PGO_TRAINING
+    if pgo and not training.exists():
+        print(f'um_emulator: no {PGO_TRAINING}, building without PGO', file=sys.stderr)
+        pgo = False
+
+    print(f'um_emulator: building {target}', file=sys.stderr)
+    t = time.time()
+    # built in a temporary directory and moved, so that concurrent
+    # imports never see a half-written module
+    with tempfile.TemporaryDirectory(dir=target.parent.parent) as tmp:
+        tmp = pathlib.Path(tmp)
+        module = tmp / target.name
+        if pgo:
+            profile_dir = tmp / 'profile'
+            subprocess.check_call(compile_command(cxx, source, module,
+                                                  f'-fprofile-generate={profile_dir}'))
+            train(tmp, training)
+            module.unlink()
+            profile = profile_dir
+            if is_clang(cxx):
+                # clang leaves raw profiles to be merged
+                profile = profile_dir / 'default.profdata'
+                subprocess.check_call(['llvm-profdata', 'merge', f'-output={profile}', str(profile_dir)])
+            subprocess.check_call(compile_command(cxx, source, module,
+                                                  f'-fprofile-use={profile}',
+                                                  '-fprofile-correction', '-Wno-missing-profile'))
+        else:
+            subprocess.check_call(compile_command(cxx, source, module))
+        target.parent.mkdir(exist_ok=True)
+        os.replace(module, target)
+    print(f'um_emulator: built in {time.time() - t:.1f}s', file=sys.stderr)
+
+
+# builds the module if there is no build for current sources,
+# returns the directory it is in
+def check_updates_posix() -> pathlib.Path:
+    cxx = os.environ.get('CXX') or shutil.which('c++') or 'g++'
+    pgo = os.environ.get('UM_EMULATOR_PGO') == '1'
+    build_dir = pathlib.Path(__file__).parent / 'build' / build_key(cxx, pgo)
+    target = build_dir / ('um_emulator' + sysconfig.get_config_var('EXT_SUFFIX'))
+    if not target.exists():
+        build_dir.parent.mkdir(exist_ok=True)
+        build(target, cxx, pgo)
+    return build_dir
+
+
+def use_fallback(reason: str):
+    global um_emulator
+    print(f'um_emulator: {reason}, using pure-Python fallback', file=sys.stderr)
+    from . import um_python
+    um_emulator = sys.modules[__name__ + '.um_emulator'] = um_python
+
+
+if os.environ.get('UM_EMULATOR_PYTHON') == '1':
+    use_fallback('UM_EMULATOR_PYTHON=1')
+else:
+    try:
+        if sys.platform == 'win32':
+            check_updates_msvc()
+        else:
+            # cpp.um_emulator is found in the build directory
+            __path__.insert(0, str(check_updates_posix()))
+    except (OSError, ImportError, subprocess.CalledProcessError) as e:
+        use_fallback(f'no build ({e})')
+    else:
+        # a build may still not load: stale, or for another Python ABI
+        try:
+            from . import um_emulator
+        except ImportError as e:
+            use_fallback(f'build does not load ({e})')
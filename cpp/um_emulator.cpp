@@ -1,5 +1,6 @@
 #include <pybind11/stl.h>
 #include <pybind11/pybind11.h>
+#include <pybind11/stl/filesystem.h>
 #include <iostream>
 #include <fstream>
 #include <vector>
@@ -7,12 +8,302 @@
 #include <sstream>
 #include <cassert>
 #include <optional>
+#include <deque>
+#include <memory>
+#include <unordered_map>
+#include <stdexcept>
+#include <filesystem>
+#include <atomic>
+#include <algorithm>
+#include <cerrno>
 
 using std::vector;
 using std::string;
 
 typedef uint32_t uint32;
 
+// Arrays are shared between machine copies and between array 0 and
+// the array it was loaded from. Segment is copied on the first write
+// while shared (see UMEmulator::writable).
+typedef std::shared_ptr<vector<uint32>> Segment;
+
+/**-----------------------------------------------------
+  Arrays abandoned by the machine, kept for reuse by the
+  next allocations. Small arrays are allocated with the
+  capacity of their size class (power of 2), so that any
+  array of the class can reuse them; reuse zeroes only
+  the requested size.
+
+  Only segments not shared with other arrays or machines
+  are pooled. Pool is not a part of machine state: copies
+  of the machine start with an empty one.
+  ----------------------------------------------------*/
+class SegmentPool {
+public:
+	static constexpr unsigned MAX_CLASS = 16;			// arrays up to 64K words
+	static constexpr size_t MAX_POOLED_WORDS = 1 << 22;	// 16 MB per machine
+
+	struct Stats {
+		unsigned long long allocations = 0;
+		unsigned long long reused = 0;		// of allocations, taken from the pool
+		unsigned long long abandonments = 0;
+		unsigned long long pooled = 0;		// of abandonments, kept in the pool
+	};
+
+	Stats stats;
+
+	SegmentPool() = default;
+	SegmentPool(const SegmentPool&) {}
+	SegmentPool& operator=(const SegmentPool&) { return *this; }
+
+	Segment get(uint32 size) {
+		stats.allocations++;
+		unsigned k = capacity_class(size);
+		if (k > MAX_CLASS) return std::make_shared<vector<uint32>>(size);
+
+		vector<Segment>& free = segments[k];
+		if (!free.empty()) {
+			Segment segment = std::move(free.back());
+			free.pop_back();
+			pooled_words -= segment->capacity();
+			stats.reused++;
+			segment->assign(size, 0);
+			return segment;
+		}
+		Segment segment = std::make_shared<vector<uint32>>();
+		segment->reserve(size_t(1) << k);
+		segment->resize(size);
+		return segment;
+	}
+
+	void put(Segment&& segment) {
+		stats.abandonments++;
+		if (segment.use_count() > 1) return;
+		size_t capacity = segment->capacity();
+		unsigned k = capacity_class(segment->size());
+		if (k > MAX_CLASS || capacity != size_t(1) << k
+		    || pooled_words + capacity > MAX_POOLED_WORDS) return;
+		// as in UMEmulator::writable, other owner may have just dropped it
+		std::atomic_thread_fence(std::memory_order_acquire);
+		pooled_words += capacity;
+		segments[k].push_back(std::move(segment));
+		stats.pooled++;
+	}
+
+	size_t words() const { return pooled_words; }
+
+	// smallest k with size <= 2^k
+	static unsigned capacity_class(uint32 size) {
+		unsigned k = 0;
+		while ((size_t(1) << k) < size) k++;
+		return k;
+	}
+
+private:
+	vector<Segment> segments[MAX_CLASS + 1];
+	size_t pooled_words = 0;
+};
+
+// native code needs x86-64 and mmap, elsewhere JIT engine runs as DECODED.
+#if defined(__x86_64__) && defined(__linux__)
+#define UM_JIT
+#include <sys/mman.h>
+#endif
+
+/**-----------------------------------------------------
+  Native code for hot blocks of array 0.
+
+  Jump targets (load_program with any B) are counted;
+  once a target is hit HOT times, the run of arithmetic
+  instructions starting there (conditional move,
+  addition, multiplication, not-and, orthography) is
+  translated to x86-64 code working on the registers
+  in memory. Next jumps there run the native block and
+  continue interpreting at its end. Blocks never fail,
+  output or jump, so no interpreter state but the finger
+  and the instruction count is touched.
+
+  Any write to an address covered by a block drops all
+  the blocks and counters, as does replacing array 0.
+  Code is per machine: copies start without it.
+  ----------------------------------------------------*/
+class Jit {
+public:
+	static constexpr uint32 HOT = 64;			// jumps to compile the target
+	static constexpr uint32 MIN_LENGTH = 2;		// shorter runs stay interpreted
+	static constexpr uint32 MAX_LENGTH = 256;
+	static constexpr size_t CHUNK = 1 << 16;	// executable memory is taken by chunks
+	static constexpr size_t MAX_CODE = 1 << 24;
+
+	typedef void (*Code)(uint32* regs);
+	struct Block {
+		uint32 start, length;
+		Code code;
+	};
+
+	struct Stats {
+		unsigned long long blocks = 0;			// compiled
+		unsigned long long flushes = 0;
+		unsigned long long instructions = 0;	// executed natively
+	};
+
+	Stats stats;
+
+	Jit() = default;
+	Jit(const Jit&) {}
+	Jit& operator=(const Jit&) { reset(); return *this; }
+	~Jit() { reset(); }
+
+	// block to run at jump target, if it is compiled or just got hot
+	const Block* enter(uint32 target, const vector<uint32>& program) {
+		if (hits.empty()) {
+			hits.assign(program.size(), 0);
+			entry.assign(program.size(), 0);
+			cover.assign(program.size(), 0);
+		}
+		if (uint32 b = entry[target]) return &blocks[b - 1];
+		if (hits[target] >= HOT || ++hits[target] < HOT) return nullptr;
+		return compile(target, program);
+	}
+
+	// array 0 is written at address
+	void written(uint32 address) {
+		if (address < cover.size() && cover[address]) {
+			reset();
+			stats.flushes++;
+		}
+	}
+
+	// drops all blocks, keeps stats
+	void reset() {
+		hits.clear();
+		entry.clear();
+		cover.clear();
+		blocks.clear();
+#ifdef UM_JIT
+		for (auto& [memory, used] : chunks) munmap(memory, CHUNK);
+#endif
+		chunks.clear();
+		code_size = 0;
+	}
+
+	size_t code_bytes() const { return code_size; }
+
+private:
+	vector<uint32> hits;		// jumps to address
+	vector<uint32> entry;		// 1 + index of the block starting at address
+	vector<uint8_t> cover;		// address is in some block
+	vector<Block> blocks;
+	vector<std::pair<uint8_t*, size_t>> chunks;	// memory, bytes used
+	size_t code_size = 0;
+
+	static bool compiled(uint32 op) {
+		return op == 0 || op == 3 || op == 4 || op == 6 || op == 13;
+	}
+
+	const Block* compile(uint32 start, const vector<uint32>& program) {
+		uint32 length = 0;
+		while (start + length < program.size() && length < MAX_LENGTH
+		       && compiled(program[start + length] >> 28)) {
+			length++;
+		}
+		if (length < MIN_LENGTH) return nullptr;
+
+		vector<uint8_t> bytes;
+		for (uint32 i = start; i < start + length; i++) translate(program[i], bytes);
+		bytes.push_back(0xc3);						// ret
+		Code code = install(bytes);
+		if (!code) return nullptr;
+
+		blocks.push_back(Block{start, length, code});
+		entry[start] = blocks.size();
+		for (uint32 i = start; i < start + length; i++) cover[i] = 1;
+		stats.blocks++;
+		return &blocks.back();
+	}
+
+	/**-----------------------------------------------------
+	  Registers are at [rdi + 4 * index], every instruction
+	  loads its operands to eax / ecx, computes and stores
+	  the result: A may be the same register as B or C.
+	  ----------------------------------------------------*/
+	enum : uint8_t { EAX = 0, ECX = 1 };
+
+	static void load(vector<uint8_t>& bytes, uint8_t reg, uint32 index) {
+		bytes.insert(bytes.end(), {0x8b, uint8_t(0x47 | reg << 3), uint8_t(4 * index)});
+	}
+
+	static void store(vector<uint8_t>& bytes, uint8_t reg, uint32 index) {
+		bytes.insert(bytes.end(), {0x89, uint8_t(0x47 | reg << 3), uint8_t(4 * index)});
+	}
+
+	static void translate(uint32 p, vector<uint8_t>& bytes) {
+		uint32 a = (p >> 6) & 7, b = (p >> 3) & 7, c = p & 7;
+		switch (p >> 28) {
+		case 0:
+			load(bytes, ECX, c);
+			bytes.insert(bytes.end(), {0x85, 0xc9, 0x74, 0x06});	// test ecx, ecx; je +6
+			load(bytes, EAX, b);
+			store(bytes, EAX, a);
+			break;
+		case 3:
+			load(bytes, EAX, b);
+			load(bytes, ECX, c);
+			bytes.insert(bytes.end(), {0x01, 0xc8});				// add eax, ecx
+			store(bytes, EAX, a);
+			break;
+		case 4:
+			load(bytes, EAX, b);
+			load(bytes, ECX, c);
+			bytes.insert(bytes.end(), {0x0f, 0xaf, 0xc1});			// imul eax, ecx
+			store(bytes, EAX, a);
+			break;
+		case 6:
+			load(bytes, EAX, b);
+			load(bytes, ECX, c);
+			bytes.insert(bytes.end(), {0x21, 0xc8, 0xf7, 0xd0});	// and eax, ecx; not eax
+			store(bytes, EAX, a);
+			break;
+		case 13: {
+			uint32 value = p & ((1 << 25) - 1);
+			bytes.insert(bytes.end(), {0xc7, 0x47, uint8_t(4 * ((p >> 25) & 7)),	// mov [rdi+d], imm
+			                           uint8_t(value), uint8_t(value >> 8),
+			                           uint8_t(value >> 16), uint8_t(value >> 24)});
+			break;
+		}
+		}
+	}
+
+	// copies code to executable memory, nullptr if there is none
+	Code install(const vector<uint8_t>& bytes) {
+#ifdef UM_JIT
+		if (bytes.size() > CHUNK || code_size + bytes.size() > MAX_CODE) return nullptr;
+		if (chunks.empty() || chunks.back().second + bytes.size() > CHUNK) {
+			void* memory = mmap(nullptr, CHUNK, PROT_READ | PROT_EXEC,
+			                    MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+			if (memory == MAP_FAILED) return nullptr;
+			chunks.emplace_back(static_cast<uint8_t*>(memory), 0);
+		}
+		auto& [memory, used] = chunks.back();
+		// chunk is writable only while the code is copied
+		if (mprotect(memory, CHUNK, PROT_READ | PROT_WRITE) != 0) return nullptr;
+		std::copy(bytes.begin(), bytes.end(), memory + used);
+		mprotect(memory, CHUNK, PROT_READ | PROT_EXEC);
+		Code code = reinterpret_cast<Code>(memory + used);
+		used += bytes.size();
+		code_size += bytes.size();
+		return code;
+#else
+		return nullptr;
+#endif
+	}
+};
+
+// computed goto is a GCC/Clang extension, others dispatch with switch.
+#if defined(__GNUC__)
+#define UM_COMPUTED_GOTO
+#endif
+
 class UMEmulator {
 
 	/**-----------------------------------------------------
@@ -23,11 +314,17 @@ class UMEmulator {
 	  Runs machine from file.
 	  Runs in chunks from input request to input request /
 	  halt.
+
+	  Thread safety: one instance must not be used from two
+	  threads at once (run() releases the GIL, so Python
+	  does not serialize the calls). Different instances,
+	  including copies sharing segments, run in parallel.
 	  ----------------------------------------------------*/
 
 public:
-	vector<vector<uint32>> arrays;
+	vector<Segment> arrays;
 	vector<uint32> abandoned;
+	SegmentPool pool;			// segments of abandoned arrays
 	uint32 exec_finger;
 	uint32 regs[8];
 
@@ -35,46 +332,141 @@ public:
 	// ------> IDLE <-----+------+
 	//          |         ^      |
 	//          | run     |      | write_input
-	//  +-------+---------+      |
+	//  +-------+---------+      | write_input_bytes
 	//  V                 V      |
 	// HALT            WAITING --+
 	//
 	// RUNNING is an internal state, never to be seen by user.
+	// Machine goes WAITING only when input queue is exhausted.
 	
 	enum class State {
 		IDLE, RUNNING, WAITING, HALT
 	} state;
 
-	std::optional<int> in;					// accepts input only when requested
+	std::deque<int> in;						// input queue, consumed by _11_input
 	string out;
 	std::optional<unsigned> output_buffer_limit;
 	std::optional<unsigned> command_limit;
 	string error_message;
+	unsigned long long instructions_executed;	// by all runs of this machine
+	// machine goes IDLE when instructions_executed reaches it, and
+	// run() returns right away until the budget is raised.
+	std::optional<unsigned long long> instruction_budget;
+
+	// TABLE dispatches every platter through operationlist,
+	// DECODED runs pre-decoded copy of array 0 (see run_decoded),
+	// JIT is DECODED that runs hot blocks as native code (see Jit).
+	enum class Engine {
+		TABLE, DECODED, JIT
+	} engine;
 
 	/**-----------------------------------------------------
-	  Universal machine, gets the text of the program.
+	  Pre-decoded instruction. Mirrors arrays[0] word by word
+	  with one extra END entry past the last word, so that
+	  running out of program needs no bounds check.
+	  ----------------------------------------------------*/
+	struct Insn {
+		uint8_t op;
+		uint8_t a, b, c;	// register indices
+		uint32 value;		// orthography value, platter otherwise
+	};
+
+	enum : uint8_t {
+		OP_UNDECODED = 16,	// decoded lazily on first execution
+		OP_END = 17
+	};
+
+	/**-----------------------------------------------------
+	  Decoded instructions are a cache of the machine:
+	  copies start without it, as they do without Jit code,
+	  so that copying a machine stays O(number of arrays).
+	  run_decoded fills it again on the first run.
 	  ----------------------------------------------------*/
-	UMEmulator(const string& program) {
+	struct DecodedCache : vector<Insn> {
+		DecodedCache() = default;
+		DecodedCache(const DecodedCache&) {}
+		DecodedCache(DecodedCache&&) = default;
+		DecodedCache& operator=(const DecodedCache&) { clear(); return *this; }
+		DecodedCache& operator=(DecodedCache&&) = default;
+	};
+
+	DecodedCache decoded;		// empty until the first decoded run
+	Jit jit;					// used by JIT engine only
+
+	/**-----------------------------------------------------
+	  Execution counts, collected while profiling is on.
+	  Addresses are offsets in array 0 at the time, so
+	  after load_program with B != 0 they refer to the
+	  new program.
+	  ----------------------------------------------------*/
+	struct Profile {
+		unsigned long long opcodes[15] = {};		// 14 and 15 together
+		std::unordered_map<uint32, unsigned long long> fingers;
+		std::unordered_map<uint32, unsigned long long> jumps;	// load_program, B == 0
+		std::unordered_map<uint32, unsigned long long> loads;	// load_program, B != 0
+		unsigned long long allocations = 0;
+		unsigned long long abandonments = 0;
+		unsigned long long allocation_sizes[33] = {};	// by size_class
+	};
+
+	bool profiling;				// run() goes through run_table while on
+	Profile profile;
+
+	/**-----------------------------------------------------
+	  Machine without arrays, to be filled by load().
+	  ----------------------------------------------------*/
+	explicit UMEmulator(Engine engine) {
+		this->engine = engine;
 		for (uint32& x : regs) x = 0;
-		arrays.emplace_back();
 		exec_finger = 0;
 		state = State::IDLE;
-		in = std::nullopt;
 		output_buffer_limit = std::nullopt;
 		command_limit = std::nullopt;
+		instruction_budget = std::nullopt;
 		error_message = "";
 		out = "";
-	
-		assert (program.size() % 4 == 0);	// file had 4x bytes
-
-		uint32 word = 0;
-		for (int i = 0; i < program.size(); i++) {
-			word = (word << 8) + static_cast<uint8_t>(program[i]);
-			if (i % 4 == 3) {
-				arrays[0].push_back(word);
-				word = 0;
-			}
+		instructions_executed = 0;
+		profiling = false;
+	}
+
+	/**-----------------------------------------------------
+	  Universal machine, gets the text of the program.
+	  Big-endian words go straight into pre-sized array 0.
+	  ----------------------------------------------------*/
+	UMEmulator(const char* program, size_t size, Engine engine = Engine::TABLE)
+			: UMEmulator(engine) {
+		check_program_size(size);
+		arrays.push_back(std::make_shared<vector<uint32>>(size / 4));
+		uint32* words = arrays[0]->data();
+		for (size_t i = 0; i < size / 4; i++) {
+			words[i] = from_big_endian(program + 4 * i);
+		}
+		reset_decoded();
+	}
+
+	/**-----------------------------------------------------
+	  Universal machine, reads the program from file.
+	  File is read in place and byte-swapped there.
+	  ----------------------------------------------------*/
+	UMEmulator(std::istream& file, size_t size, Engine engine = Engine::TABLE)
+			: UMEmulator(engine) {
+		check_program_size(size);
+		arrays.push_back(std::make_shared<vector<uint32>>(size / 4));
+		char* bytes = reinterpret_cast<char*>(arrays[0]->data());
+		if (!file.read(bytes, size)) throw std::runtime_error("Program file is truncated");
+		for (size_t i = 0; i < size / 4; i++) {
+			(*arrays[0])[i] = from_big_endian(bytes + 4 * i);
 		}
+		reset_decoded();
+	}
+
+	static void check_program_size(size_t size) {
+		if (size % 4 != 0) throw std::invalid_argument("Program size is not a multiple of 4");
+	}
+
+	static uint32 from_big_endian(const char* bytes) {
+		const uint8_t* b = reinterpret_cast<const uint8_t*>(bytes);
+		return (uint32(b[0]) << 24) | (uint32(b[1]) << 16) | (uint32(b[2]) << 8) | b[3];
 	}
 
 
@@ -101,6 +493,40 @@ public:
 
 
 
+	/**-----------------------------------------------------
+	  Array access. Reading goes through arrays directly,
+	  writing only through writable(), that unshares the
+	  segment first.
+	  ----------------------------------------------------*/
+
+	vector<uint32>& writable(uint32 index) {
+		Segment& segment = arrays[index];
+		if (segment.use_count() > 1) {
+			segment = std::make_shared<vector<uint32>>(*segment);
+		}
+		else {
+			// last owner may have dropped the segment in another
+			// thread right after copying it: see its reads first.
+			std::atomic_thread_fence(std::memory_order_acquire);
+		}
+		return *segment;
+	}
+
+	// shared by all abandoned arrays, never written as it is empty.
+	static const Segment& empty_segment() {
+		static const Segment empty = std::make_shared<vector<uint32>>();
+		return empty;
+	}
+
+
+	// number of bits in size: class k holds sizes in [2^(k-1), 2^k).
+	static unsigned size_class(uint32 size) {
+		unsigned k = 0;
+		while (size) { size >>= 1; k++; }
+		return k;
+	}
+
+
 	/**=============== LIST OF COMMANDS ===================*/
 	
 	void _0_conditional_move(uint32 p) {
@@ -108,17 +534,21 @@ public:
 	}
 
 	void _1_array_index(uint32 p) {
-		if (B(p) >= arrays.size() || C(p) >= arrays[B(p)].size()) {
+		if (B(p) >= arrays.size() || C(p) >= arrays[B(p)]->size()) {
 			return fail_operation("Index out of bounds");
 		}
-		A(p) = arrays[B(p)][C(p)];
+		A(p) = (*arrays[B(p)])[C(p)];
 	}
 
 	void _2_array_amendment(uint32 p) {
-		if (A(p) >= arrays.size() || B(p) >= arrays[A(p)].size()) {
+		if (A(p) >= arrays.size() || B(p) >= arrays[A(p)]->size()) {
 			return fail_operation("Index out of bounds");
 		}
-		arrays[A(p)][B(p)] = C(p);
+		writable(A(p))[B(p)] = C(p);
+		if (A(p) == 0 && !decoded.empty()) {
+			decoded[B(p)].op = OP_UNDECODED;
+			jit.written(B(p));
+		}
 	}
 
 	void _3_addition(uint32 p) {
@@ -146,21 +576,23 @@ public:
 		// don't use B(p) instead of index! B(p) and C(p) may be same register.
 		if (abandoned.empty()) {
 			uint32 index = arrays.size();
-			arrays.push_back(vector<uint32>(C(p)));
+			arrays.push_back(pool.get(C(p)));
 			B(p) = index;
 		}
 		else {
 			uint32 index = abandoned.back();
 			abandoned.pop_back();
-			arrays[index] = vector<uint32>(C(p));
+			arrays[index] = pool.get(C(p));
 			B(p) = index;
 		}
 	}
 
 	void _9_abandonment(uint32 p) {
 		if (C(p) == 0) return fail_operation("Abandoning working program");
-		arrays[C(p)] = vector<uint32>();
+		Segment segment = std::move(arrays[C(p)]);
+		arrays[C(p)] = empty_segment();
 		abandoned.push_back(C(p));
+		pool.put(std::move(segment));
 	}
 
 	void _10_output(uint32 p) {
@@ -170,20 +602,24 @@ public:
 	
 	void _11_input(uint32 p) {
 		assert (state == State::RUNNING);
-		if (in == std::nullopt) {
+		if (in.empty()) {
 			state = State::WAITING;
 			exec_finger--;
 			return;
 		}
 
-		if (in < -1 || in > 255) return fail_operation("Not-ASCII output");
-		C(p) = (uint32)in.value();
-		in = std::nullopt;
+		int c = in.front();
+		in.pop_front();
+		if (c < -1 || c > 255) return fail_operation("Not-ASCII input");
+		C(p) = (uint32)c;
 	}
 	
 	void _12_load_program(uint32 p) {
-		if (B(p)) arrays[0] = arrays[B(p)];
-		if (C(p) >= arrays[0].size()) return fail_operation("Finger out of bounds");
+		if (B(p)) {
+			arrays[0] = arrays[B(p)];
+			reset_decoded();
+		}
+		if (C(p) >= arrays[0]->size()) return fail_operation("Finger out of bounds");
 		exec_finger = C(p);
 	}
 	
@@ -224,6 +660,340 @@ public:
 								};
 	
 
+	/**================= DECODED ENGINE ===================*/
+
+	static Insn decode(uint32 p) {
+		Insn insn;
+		insn.op = p >> 28;
+		if (insn.op == 13) {
+			insn.a = (p >> 25) & 7;
+			insn.b = insn.c = 0;
+			insn.value = p & ((1 << 25) - 1);
+		}
+		else {
+			insn.a = (p >> 6) & 7;
+			insn.b = (p >> 3) & 7;
+			insn.c = p & 7;
+			insn.value = p;
+		}
+		return insn;
+	}
+
+	// drops all decoded instructions, when array 0 is replaced.
+	void reset_decoded() {
+		if (engine == Engine::TABLE) return;
+		jit.reset();
+		decoded.assign(arrays[0]->size() + 1, Insn{OP_UNDECODED, 0, 0, 0, 0});
+		decoded.back().op = OP_END;
+	}
+
+	/**-----------------------------------------------------
+	 * Same semantics as run_table, but dispatches
+	 * pre-decoded instructions, checks output limit only
+	 * after output and finger bounds only on jumps.
+	 * ---------------------------------------------------*/
+	void run_decoded() {
+		if (decoded.empty()) reset_decoded();
+		Insn* code = decoded.data();
+		const Insn* insn;
+		uint32 finger = exec_finger;
+		unsigned long long budget = run_limit();
+		unsigned long long remaining = budget;
+		size_t out_limit = output_buffer_limit ? *output_buffer_limit : string::npos;
+
+#ifdef UM_COMPUTED_GOTO
+		static void* const labels[] = {
+			&&op_0, &&op_1, &&op_2, &&op_3, &&op_4, &&op_5, &&op_6, &&op_7,
+			&&op_8, &&op_9, &&op_10, &&op_11, &&op_12, &&op_13, &&op_14, &&op_14,
+			&&op_OP_UNDECODED, &&op_OP_END
+		};
+#define TARGET(name) op_##name:
+#define DISPATCH() goto *labels[insn->op]
+#else
+#define TARGET(name) case name:
+#define DISPATCH() goto dispatch
+#endif
+
+#define NEXT() do {								\
+			if (remaining == 0) goto limit;		\
+			remaining--;						\
+			insn = &code[finger++];				\
+			DISPATCH();							\
+		} while (0)
+
+#define A (regs[insn->a])
+#define B (regs[insn->b])
+#define C (regs[insn->c])
+
+		if (out.size() >= out_limit) goto limit;
+		NEXT();
+
+#ifndef UM_COMPUTED_GOTO
+	dispatch:
+		switch (insn->op) {
+#endif
+		TARGET(0)
+			if (C) A = B;
+			NEXT();
+		TARGET(1)
+			if (B >= arrays.size() || C >= arrays[B]->size()) {
+				fail_operation("Index out of bounds");
+				goto done;
+			}
+			A = (*arrays[B])[C];
+			NEXT();
+		TARGET(2)
+			if (A >= arrays.size() || B >= arrays[A]->size()) {
+				fail_operation("Index out of bounds");
+				goto done;
+			}
+			writable(A)[B] = C;
+			if (A == 0) {
+				code[B].op = OP_UNDECODED;
+				jit.written(B);
+			}
+			NEXT();
+		TARGET(3)
+			A = B + C;
+			NEXT();
+		TARGET(4)
+			A = B * C;
+			NEXT();
+		TARGET(5)
+			if (!C) {
+				fail_operation("Zero division");
+				goto done;
+			}
+			A = B / C;
+			NEXT();
+		TARGET(6)
+			A = ~(B & C);
+			NEXT();
+		TARGET(7)
+			state = State::HALT;
+			goto done;
+		TARGET(8)
+			_8_allocation(insn->value);
+			NEXT();
+		TARGET(9)
+			_9_abandonment(insn->value);
+			if (state != State::RUNNING) goto done;
+			NEXT();
+		TARGET(10)
+			if (C > 255) {
+				fail_operation("Not-ASCII output");
+				goto done;
+			}
+			out.push_back((char)C);
+			if (out.size() >= out_limit) goto limit;
+			NEXT();
+		TARGET(11)
+			if (in.empty()) {
+				state = State::WAITING;
+				finger--;
+				remaining++;		// to be executed again
+				goto done;
+			}
+			{
+				int c = in.front();
+				in.pop_front();
+				if (c < -1 || c > 255) {
+					fail_operation("Not-ASCII input");
+					goto done;
+				}
+				C = (uint32)c;
+			}
+			NEXT();
+		TARGET(12)
+			exec_finger = finger;
+			_12_load_program(insn->value);
+			if (state != State::RUNNING) goto done;
+			code = decoded.data();
+			finger = exec_finger;
+#ifdef UM_JIT
+			if (engine == Engine::JIT) {
+				const Jit::Block* block = jit.enter(finger, *arrays[0]);
+				if (block && block->length <= remaining) {
+					block->code(regs);
+					finger += block->length;
+					remaining -= block->length;
+					jit.stats.instructions += block->length;
+				}
+			}
+#endif
+			NEXT();
+		TARGET(13)
+			A = insn->value;
+			NEXT();
+		TARGET(14)
+			fail_operation("Illegal operation");
+			goto done;
+		TARGET(OP_UNDECODED)
+			code[finger - 1] = decode((*arrays[0])[finger - 1]);
+			DISPATCH();
+		TARGET(OP_END)
+			remaining++;			// not an instruction
+			fail_operation("Finger out of bounds");
+			goto done;
+#ifndef UM_COMPUTED_GOTO
+		TARGET(15)
+			fail_operation("Illegal operation");
+			goto done;
+		}
+#endif
+
+#undef A
+#undef B
+#undef C
+#undef NEXT
+#undef DISPATCH
+#undef TARGET
+
+	limit:
+		state = State::IDLE;
+	done:
+		exec_finger = finger;
+		instructions_executed += budget - remaining;
+	}
+
+
+	/**==================== SNAPSHOTS =====================*/
+
+	/**-----------------------------------------------------
+	 * Snapshot is a sequence of native-endian 32-bit words:
+	 *
+	 *   magic, state, exec_finger, regs[8],
+	 *   #abandoned, #input, #arrays, #error_message bytes,
+	 *   abandoned indices, input values,
+	 *   arrays: size, words... or SHARED, index of the
+	 *           previous array with the same segment,
+	 *   error message padded to a word.
+	 * ---------------------------------------------------*/
+	static constexpr uint32 SNAPSHOT_MAGIC = 0x31534d55;	// "UMS1"
+	static constexpr uint32 SHARED = 0xffffffff;
+
+	static void write_words(std::ostream& f, const uint32* data, size_t count) {
+		f.write(reinterpret_cast<const char*>(data), count * sizeof(uint32));
+	}
+
+	// reads count words of the left ones; sizes from the file are checked
+	// against what is left before anything is allocated for them
+	static void read_words(std::istream& f, uint64_t& left, uint32* data, uint64_t count) {
+		if (count > left) throw std::runtime_error("Snapshot is truncated");
+		f.read(reinterpret_cast<char*>(data), count * sizeof(uint32));
+		if (!f) throw std::runtime_error("Snapshot is truncated");
+		left -= count;
+	}
+
+	static uint32 read_word(std::istream& f, uint64_t& left) {
+		uint32 word;
+		read_words(f, left, &word, 1);
+		return word;
+	}
+
+	// words from the current position to the end of f
+	static uint64_t words_left(std::istream& f) {
+		auto position = f.tellg();
+		f.seekg(0, std::ios::end);
+		auto end = f.tellg();
+		f.seekg(position);
+		if (position < 0 || end < position || !f) throw std::runtime_error("Snapshot is not seekable");
+		return (uint64_t)(end - position) / sizeof(uint32);
+	}
+
+	void save(std::ostream& f) const {
+		assert (state != State::RUNNING);
+		vector<uint32> header = {SNAPSHOT_MAGIC, (uint32)state, exec_finger};
+		header.insert(header.end(), regs, regs + 8);
+		header.push_back(abandoned.size());
+		header.push_back(in.size());
+		header.push_back(arrays.size());
+		header.push_back(error_message.size());
+		header.insert(header.end(), abandoned.begin(), abandoned.end());
+		for (int c : in) header.push_back((uint32)c);
+		write_words(f, header.data(), header.size());
+
+		std::unordered_map<const vector<uint32>*, uint32> seen;
+		for (uint32 i = 0; i < arrays.size(); i++) {
+			const vector<uint32>* array = arrays[i].get();
+			auto [it, first] = seen.emplace(array, i);
+			if (!first && !array->empty()) {
+				uint32 shared[] = {SHARED, it->second};
+				write_words(f, shared, 2);
+				continue;
+			}
+			uint32 size = array->size();
+			write_words(f, &size, 1);
+			write_words(f, array->data(), size);
+		}
+
+		string message = error_message;
+		message.resize((message.size() + 3) / 4 * 4, '\0');
+		f.write(message.data(), message.size());
+	}
+
+	static UMEmulator load(std::istream& f, Engine engine) {
+		UMEmulator um(engine);
+		uint64_t left = words_left(f);
+		if (read_word(f, left) != SNAPSHOT_MAGIC) throw std::runtime_error("Not a snapshot");
+		uint32 state = read_word(f, left);
+		if (state != (uint32)State::IDLE && state != (uint32)State::WAITING &&
+				state != (uint32)State::HALT) {
+			throw std::runtime_error("Broken snapshot");
+		}
+		um.state = (State)state;
+		um.exec_finger = read_word(f, left);
+		read_words(f, left, um.regs, 8);
+		uint32 abandoned_count = read_word(f, left);
+		uint32 input_count = read_word(f, left);
+		uint32 array_count = read_word(f, left);
+		uint32 message_size = read_word(f, left);
+
+		if ((uint64_t)abandoned_count + input_count > left) throw std::runtime_error("Snapshot is truncated");
+		um.abandoned.resize(abandoned_count);
+		read_words(f, left, um.abandoned.data(), abandoned_count);
+		for (uint32 index : um.abandoned) {
+			// array 0 is the program, it is never abandoned
+			if (index == 0 || index >= array_count) throw std::runtime_error("Broken snapshot");
+		}
+		for (uint32 i = 0; i < input_count; i++) um.in.push_back((int)read_word(f, left));
+
+		// every array takes a word at least
+		if (array_count > left) throw std::runtime_error("Snapshot is truncated");
+		um.arrays.reserve(array_count);
+		for (uint32 i = 0; i < array_count; i++) {
+			uint32 size = read_word(f, left);
+			if (size == SHARED) {
+				uint32 index = read_word(f, left);
+				if (index >= i) throw std::runtime_error("Broken snapshot");
+				um.arrays.push_back(um.arrays[index]);
+			}
+			else if (size == 0) {
+				um.arrays.push_back(empty_segment());
+			}
+			else {
+				if (size > left) throw std::runtime_error("Snapshot is truncated");
+				um.arrays.push_back(std::make_shared<vector<uint32>>(size));
+				read_words(f, left, um.arrays.back()->data(), size);
+			}
+		}
+		// a machine to resume needs an instruction at the finger
+		if (um.arrays.empty() || um.exec_finger > um.arrays[0]->size() ||
+				(um.state != State::HALT && um.exec_finger == um.arrays[0]->size())) {
+			throw std::runtime_error("Broken snapshot");
+		}
+
+		if (((uint64_t)message_size + 3) / 4 > left) throw std::runtime_error("Snapshot is truncated");
+		string message((message_size + 3) / 4 * 4, '\0');
+		f.read(message.data(), message.size());
+		if (!f) throw std::runtime_error("Snapshot is truncated");
+		um.error_message = message.substr(0, message_size);
+
+		um.reset_decoded();
+		return um;
+	}
+
+
 	/**================= RUNS & RESULTS ===================*/
 	
 	/**-----------------------------------------------------
@@ -239,35 +1009,291 @@ public:
 		assert (state == State::IDLE);
 		state = State::RUNNING;
 
-		unsigned command_count = 0;
+		if (engine != Engine::TABLE && !profiling) run_decoded();
+		else run_table();
+
+		string result;
+		result.swap(out);
+		return result;
+	}
+
+	// instructions this run may execute: command_limit,
+	// or what is left of instruction_budget, if less.
+	unsigned long long run_limit() const {
+		unsigned long long limit = command_limit ? *command_limit : ~0ull;
+		if (instruction_budget) {
+			unsigned long long left = budget_exhausted() ? 0 : *instruction_budget - instructions_executed;
+			limit = std::min(limit, left);
+		}
+		return limit;
+	}
+
+	bool budget_exhausted() const {
+		return instruction_budget && instructions_executed >= *instruction_budget;
+	}
+
+	void run_table() {
+		unsigned long long command_count = 0;
+		unsigned long long limit = run_limit();
 		while (state == State::RUNNING) {
 			if (output_buffer_limit && out.size() >= output_buffer_limit
-			    || command_limit && command_count >= command_limit) {
+			    || command_count >= limit) {
 				state = State::IDLE;
 				break;
 			}
-			uint32 platter = arrays[0][exec_finger++];
+			uint32 finger = exec_finger++;
+			uint32 platter = (*arrays[0])[finger];
 			uint32 cmd = get_command(platter);
 			std::invoke(operationlist[cmd], this, platter);
-			if (exec_finger >= arrays[0].size()) {
+			if (state != State::WAITING) {
+				command_count ++;
+				if (profiling) count_profile(finger, platter);
+			}
+			if (state == State::RUNNING && exec_finger >= arrays[0]->size()) {
 				fail_operation("Finger out of bounds");
 				break;
 			}
-			command_count ++;
 		}
-		
-		string result;
-		result.swap(out);
-		return result;
+		instructions_executed += command_count;
 	}
 
+	// called after the platter is executed: registers B and C
+	// still hold the operands of allocation and load_program.
+	void count_profile(uint32 finger, uint32 platter) {
+		uint32 cmd = get_command(platter);
+		profile.opcodes[std::min(cmd, 14u)]++;
+		profile.fingers[finger]++;
+		switch (cmd) {
+		case 8:
+			profile.allocations++;
+			profile.allocation_sizes[size_class(arrays[B(platter)]->size())]++;
+			break;
+		case 9:
+			profile.abandonments++;
+			break;
+		case 12:
+			if (B(platter)) profile.loads[C(platter)]++;
+			else profile.jumps[C(platter)]++;
+			break;
+		}
+	}
+
+	/**-----------------------------------------------------
+	 * Appends input to the queue. Machine consumes it
+	 * on the next run() without returning to the caller
+	 * until the queue is exhausted.
+	 * ---------------------------------------------------*/
 	void write_input(int c) {
-		assert (state == State::WAITING);
-		assert (in == std::nullopt);
-		in = c;
-		state = State::IDLE;
+		assert (state == State::WAITING || state == State::IDLE);
+		in.push_back(c);
+		if (state == State::WAITING) state = State::IDLE;
+	}
+
+	void write_input_bytes(const char* buffer, size_t size) {
+		assert (state == State::WAITING || state == State::IDLE);
+		for (size_t i = 0; i < size; i++) in.push_back(static_cast<uint8_t>(buffer[i]));
+		if (state == State::WAITING && size > 0) state = State::IDLE;
+	}
+
+};
+
+
+// branches are child processes where there is fork(), in-process copies elsewhere.
+#if defined(__unix__) || defined(__APPLE__)
+#define UM_FORK
+#include <unistd.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <dirent.h>
+#include <sys/wait.h>
+#endif
+
+/**-----------------------------------------------------
+  Branch of a machine: a copy to try input on and throw
+  away, never touching the original.
+
+  With fork() the branch is a child process that has
+  the machine in its copy of the parent memory (copied
+  by the OS page by page, on write) and serves run
+  requests from a pipe; it never returns to Python.
+  Otherwise, or if asked, branch is an in-process copy,
+  which shares arrays until they are written anyway.
+  ----------------------------------------------------*/
+class Branch {
+public:
+	UMEmulator::State state;
+	unsigned long long instructions_executed;
+	string error_message;
+
+	Branch(const UMEmulator& um, bool process) {
+		state = um.state;
+		instructions_executed = um.instructions_executed;
+		error_message = um.error_message;
+#ifdef UM_FORK
+		if (process) {
+			start(um);
+			return;
+		}
+#endif
+		local.emplace(um);
+	}
+
+	Branch(const Branch&) = delete;
+	Branch& operator=(const Branch&) = delete;
+	~Branch() { close(); }
+
+	bool is_process() const { return pid > 0; }
+
+	// feeds input, runs until the machine waits for more, halts
+	// or spends its budget; returns the output
+	string run(const char* input, size_t size) {
+		if (local) {
+			string output = advance(*local, input, size);
+			state = local->state;
+			instructions_executed = local->instructions_executed;
+			error_message = local->error_message;
+			return output;
+		}
+#ifdef UM_FORK
+		if (pid <= 0) throw std::runtime_error("Branch is closed");
+		uint32 length = size;
+		if (!write_all(to_child, &length, sizeof length) || !write_all(to_child, input, size)) {
+			throw std::runtime_error("Branch process has exited");
+		}
+		uint32 header[4];	// state, instructions (2 words), error size, output size
+		uint32 output_size;
+		if (!read_all(from_child, header, sizeof header)
+		    || !read_all(from_child, &output_size, sizeof output_size)) {
+			throw std::runtime_error("Branch process has exited");
+		}
+		state = (UMEmulator::State)header[0];
+		instructions_executed = (unsigned long long)header[2] << 32 | header[1];
+		error_message.resize(header[3]);
+		string output(output_size, '\0');
+		if (!read_all(from_child, error_message.data(), header[3])
+		    || !read_all(from_child, output.data(), output_size)) {
+			throw std::runtime_error("Branch process has exited");
+		}
+		return output;
+#else
+		throw std::runtime_error("Branch is closed");
+#endif
+	}
+
+	// kills the child: it may be in the middle of a run
+	void close() {
+		local.reset();
+#ifdef UM_FORK
+		if (pid <= 0) return;
+		::close(to_child);
+		::close(from_child);
+		kill(pid, SIGKILL);
+		while (waitpid(pid, nullptr, 0) < 0 && errno == EINTR) {}
+		pid = -1;
+#endif
+	}
+
+private:
+	std::optional<UMEmulator> local;
+#ifdef UM_FORK
+	pid_t pid = -1;
+	int to_child = -1, from_child = -1;
+#endif
+
+	static string advance(UMEmulator& um, const char* input, size_t size) {
+		if (um.state == UMEmulator::State::HALT) return "";
+		um.write_input_bytes(input, size);
+		string output;
+		while (um.state == UMEmulator::State::IDLE && !um.budget_exhausted()) output += um.run();
+		return output;
+	}
+
+#ifdef UM_FORK
+	static bool write_all(int fd, const void* data, size_t size) {
+		const char* p = static_cast<const char*>(data);
+		while (size > 0) {
+			ssize_t n = write(fd, p, size);
+			if (n < 0 && errno == EINTR) continue;
+			if (n <= 0) return false;
+			p += n;
+			size -= n;
+		}
+		return true;
+	}
+
+	static bool read_all(int fd, void* data, size_t size) {
+		char* p = static_cast<char*>(data);
+		while (size > 0) {
+			ssize_t n = read(fd, p, size);
+			if (n < 0 && errno == EINTR) continue;
+			if (n <= 0) return false;
+			p += n;
+			size -= n;
+		}
+		return true;
 	}
 
+	void start(const UMEmulator& um) {
+		int request[2], response[2];
+		if (pipe(request) != 0) throw std::runtime_error("Cannot create pipe");
+		if (pipe(response) != 0) {
+			::close(request[0]);
+			::close(request[1]);
+			throw std::runtime_error("Cannot create pipe");
+		}
+		pid = fork();
+		if (pid < 0) {
+			for (int fd : {request[0], request[1], response[0], response[1]}) ::close(fd);
+			throw std::runtime_error("Cannot fork");
+		}
+		if (pid == 0) {
+			// the copy of the machine in this process is ours
+			serve(const_cast<UMEmulator&>(um), request[0], response[1]);
+		}
+		::close(request[0]);
+		::close(response[1]);
+		to_child = request[1];
+		from_child = response[0];
+		fcntl(to_child, F_SETFD, FD_CLOEXEC);
+		fcntl(from_child, F_SETFD, FD_CLOEXEC);
+	}
+
+	// child process: no Python from here, only the machine and the pipes
+	[[noreturn]] static void serve(UMEmulator& um, int in, int out) {
+		close_other_files(in, out);
+		string input;
+		while (true) {
+			uint32 size;
+			if (!read_all(in, &size, sizeof size)) break;
+			input.resize(size);
+			if (!read_all(in, input.data(), size)) break;
+			string output = advance(um, input.data(), size);
+			uint32 header[5] = {(uint32)um.state,
+			                    (uint32)um.instructions_executed,
+			                    (uint32)(um.instructions_executed >> 32),
+			                    (uint32)um.error_message.size(),
+			                    (uint32)output.size()};
+			if (!write_all(out, header, sizeof header)
+			    || !write_all(out, um.error_message.data(), um.error_message.size())
+			    || !write_all(out, output.data(), output.size())) break;
+		}
+		_exit(0);
+	}
+
+	// sockets and files of the parent must not stay open in the child
+	static void close_other_files(int in, int out) {
+		DIR* dir = opendir("/proc/self/fd");
+		if (!dir) dir = opendir("/dev/fd");
+		if (!dir) return;
+		vector<int> fds;
+		while (dirent* entry = readdir(dir)) {
+			int fd = atoi(entry->d_name);
+			if (fd > 2 && fd != in && fd != out && fd != dirfd(dir)) fds.push_back(fd);
+		}
+		closedir(dir);
+		for (int fd : fds) ::close(fd);
+	}
+#endif
 };
 
 
@@ -276,27 +1302,180 @@ public:
 
 namespace py = pybind11;
 
+// sets OSError with errno, like built-in open() does.
+[[noreturn]] void raise_os_error(const std::filesystem::path& path) {
+	PyErr_SetFromErrnoWithFilename(PyExc_OSError, path.string().c_str());
+	throw py::error_already_set();
+}
+
+// bytes of a program or input buffer. Strided views (memoryview(b)[::2])
+// are refused: ptr and size would give the bytes they span, not show.
+std::pair<const char*, size_t> contiguous_bytes(const py::buffer_info& info, const char* what) {
+	if (info.ndim > 1 || (info.ndim == 1 && info.strides[0] != info.itemsize)) {
+		throw std::invalid_argument(string(what) + " buffer is not contiguous");
+	}
+	return {static_cast<const char*>(info.ptr), info.size * info.itemsize};
+}
+
+// opcode names in profile(), as in the list of commands.
+const char* const opcode_names[] = {
+	"conditional_move", "array_index", "array_amendment", "addition",
+	"multiplication", "division", "not_and", "halt", "allocation",
+	"abandonment", "output", "input", "load_program", "orthography",
+	"illegal",
+};
+
+py::dict profile_dict(const UMEmulator& u) {
+	const UMEmulator::Profile& p = u.profile;
+	py::dict opcodes;
+	for (size_t i = 0; i < std::size(opcode_names); i++) opcodes[opcode_names[i]] = p.opcodes[i];
+	py::dict allocation_sizes, array_sizes;
+	for (unsigned k = 0; k < std::size(p.allocation_sizes); k++) {
+		if (p.allocation_sizes[k]) allocation_sizes[py::int_(k)] = p.allocation_sizes[k];
+	}
+	// live arrays at the moment, abandoned ones excluded
+	unsigned long long live[33] = {};
+	vector<bool> is_abandoned(u.arrays.size());
+	for (uint32 i : u.abandoned) is_abandoned[i] = true;
+	for (size_t i = 0; i < u.arrays.size(); i++) {
+		if (!is_abandoned[i]) live[UMEmulator::size_class(u.arrays[i]->size())]++;
+	}
+	for (unsigned k = 0; k < std::size(live); k++) {
+		if (live[k]) array_sizes[py::int_(k)] = live[k];
+	}
+
+	py::dict result;
+	result["opcodes"] = opcodes;
+	result["fingers"] = p.fingers;
+	result["jumps"] = p.jumps;
+	result["loads"] = p.loads;
+	result["allocations"] = p.allocations;
+	result["abandonments"] = p.abandonments;
+	result["allocation_sizes"] = allocation_sizes;
+	result["array_sizes"] = array_sizes;
+	return result;
+}
+
 PYBIND11_MODULE(um_emulator, m) {
 	m.doc() = "Universal Machine Emulator";
 
 	py::class_<UMEmulator> UMclass(m, "UniversalMachine");
+
+	py::class_<Branch>(m, "Branch")
+		.def_readonly("state", &Branch::state)
+		.def_readonly("instructions_executed", &Branch::instructions_executed)
+		.def_readonly("error_message", &Branch::error_message)
+		.def_property_readonly("is_process", &Branch::is_process)
+		.def("run", [](Branch& b, py::buffer input) {
+			py::buffer_info info = input.request();
+			auto [data, size] = contiguous_bytes(info, "Input");
+			string output;
+			{
+				py::gil_scoped_release release;
+				output = b.run(data, size);
+			}
+			return py::bytes(output);
+		}, py::arg("input") = py::bytes())
+		.def("close", &Branch::close)
+		.def("__enter__", [](Branch& b) -> Branch& { return b; }, py::return_value_policy::reference)
+		.def("__exit__", [](Branch& b, py::args) { b.close(); })
+	;
+
+	py::enum_<UMEmulator::State>(UMclass, "State")
+	    .value("IDLE", UMEmulator::State::IDLE)
+		.value("WAITING", UMEmulator::State::WAITING)
+		.value("HALT", UMEmulator::State::HALT)
+		.export_values()
+	;
+
+	py::enum_<UMEmulator::Engine>(UMclass, "Engine")
+		.value("TABLE", UMEmulator::Engine::TABLE)
+		.value("DECODED", UMEmulator::Engine::DECODED)
+		.value("JIT", UMEmulator::Engine::JIT)
+		.export_values()
+	;
+
 	UMclass
-		.def(py::init([](py::bytes b) { return UMEmulator(b); }))
+		// program as bytes, bytearray, mmap, memoryview...
+		.def(py::init([](py::buffer b, UMEmulator::Engine engine) {
+			py::buffer_info info = b.request();
+			auto [data, size] = contiguous_bytes(info, "Program");
+			return UMEmulator(data, size, engine);
+		  }),
+		  py::arg("program"), py::arg("engine") = UMEmulator::Engine::TABLE)
+		// ...or as path to .umz file
+		.def(py::init([](const std::filesystem::path& path, UMEmulator::Engine engine) {
+			std::ifstream f(path, std::ios::binary | std::ios::ate);
+			if (!f) raise_os_error(path);
+			size_t size = f.tellg();
+			f.seekg(0);
+			return UMEmulator(f, size, engine);
+		  }),
+		  py::arg("program"), py::arg("engine") = UMEmulator::Engine::TABLE)
 		.def(py::init<const UMEmulator&>())
 		.def_readonly("error_message", &UMEmulator::error_message)
 		.def_readonly("state", &UMEmulator::state)
+		.def_readonly("engine", &UMEmulator::engine)
+		.def_readonly("instructions_executed", &UMEmulator::instructions_executed)
 
 		.def_readwrite("output_buffer_limit", &UMEmulator::output_buffer_limit)
 		.def_readwrite("command_limit", &UMEmulator::command_limit)
+		.def_readwrite("instruction_budget", &UMEmulator::instruction_budget)
+		.def_property_readonly("budget_exhausted", &UMEmulator::budget_exhausted)
+		// DECODED engine runs as TABLE while profiling
+		.def_readwrite("profiling", &UMEmulator::profiling)
+		.def("profile", &profile_dict)
+		.def("reset_profile", [](UMEmulator& u) { u.profile = UMEmulator::Profile(); })
+		.def("jit_stats", [](const UMEmulator& u) {
+			py::dict result;
+			result["blocks"] = u.jit.stats.blocks;
+			result["flushes"] = u.jit.stats.flushes;
+			result["instructions"] = u.jit.stats.instructions;
+			result["code_bytes"] = u.jit.code_bytes();
+			return result;
+		})
+		.def("allocator_stats", [](const UMEmulator& u) {
+			const SegmentPool::Stats& stats = u.pool.stats;
+			py::dict result;
+			result["allocations"] = stats.allocations;
+			result["reused"] = stats.reused;
+			result["abandonments"] = stats.abandonments;
+			result["pooled"] = stats.pooled;
+			result["pooled_words"] = u.pool.words();
+			return result;
+		})
 
-		.def("run", [](UMEmulator& u) { return py::bytes(u.run()); })
+		// GIL is released while the machine runs, see thread safety above.
+		.def("run", [](UMEmulator& u) {
+			string out;
+			{
+				py::gil_scoped_release release;
+				out = u.run();
+			}
+			return py::bytes(out);
+		})
 		.def("write_input", &UMEmulator::write_input)
-	;
+		.def("write_input_bytes", [](UMEmulator& u, py::buffer b) {
+			py::buffer_info info = b.request();		// keeps buffer alive without GIL
+			auto [data, size] = contiguous_bytes(info, "Input");
+			py::gil_scoped_release release;
+			u.write_input_bytes(data, size);
+		})
+		.def_property_readonly("input_pending", [](const UMEmulator& u) { return u.in.size(); })
+		.def("fork", [](const UMEmulator& u, bool process) {
+			return std::make_unique<Branch>(u, process);
+		}, py::arg("process") = true)
 
-	py::enum_<UMEmulator::State>(UMclass, "State")
-	    .value("IDLE", UMEmulator::State::IDLE)
-		.value("WAITING", UMEmulator::State::WAITING)
-		.value("HALT", UMEmulator::State::HALT)
-		.export_values()
+		.def("save", [](const UMEmulator& u, const std::filesystem::path& path) {
+			std::ofstream f(path, std::ios::binary);
+			if (!f) raise_os_error(path);
+			u.save(f);
+			if (!f.flush()) raise_os_error(path);
+		}, py::arg("path"))
+		.def_static("load", [](const std::filesystem::path& path, UMEmulator::Engine engine) {
+			std::ifstream f(path, std::ios::binary);
+			if (!f) raise_os_error(path);
+			return UMEmulator::load(f, engine);
+		}, py::arg("path"), py::arg("engine") = UMEmulator::Engine::TABLE)
 	;
-}
+}
\ No newline at end of file
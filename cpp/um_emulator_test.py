@@ -0,0 +1,521 @@
+from .um_emulator import UniversalMachine
+from . import um_python
+from compiler import asm
+
+from array import array
+import mmap
+import threading
+import pytest
+
+engines = [UniversalMachine.Engine.TABLE, UniversalMachine.Engine.DECODED, UniversalMachine.Engine.JIT]
+
+# pure-Python fallback has no allocation pool
+extension_only = pytest.mark.skipif(UniversalMachine is um_python.UniversalMachine,
+                                    reason='C++ extension is not built')
+
+
+# reads bytes and prints them back until EOF
+def echo_program():
+    return asm.encode_instructions([
+        asm.OrthographyInsn(0, 0),
+        asm.OrthographyInsn(5, 1),
+        asm.OrthographyInsn(7, 10),
+        asm.InputInsn(1),                   # 3: loop
+        asm.AdditionInsn(2, 1, 5),          # EOF + 1 == 0
+        asm.OrthographyInsn(3, 9),
+        asm.ConditionalMoveInsn(3, 7, 2),
+        asm.LoadProgramInsn(0, 3),
+        asm.HaltInsn(),                     # 8: halt is behind the jump
+        asm.HaltInsn(),                     # 9
+        asm.OutputInsn(1),                  # 10
+        asm.OrthographyInsn(3, 3),
+        asm.LoadProgramInsn(0, 3)])
+
+
+# adds every input byte to a sum kept in array 1 and prints the sum
+def accumulator_program():
+    return asm.encode_instructions([
+        asm.OrthographyInsn(0, 0),
+        asm.OrthographyInsn(6, 1),
+        asm.AllocationInsn(5, 6),
+        asm.InputInsn(1),                   # 3: loop
+        asm.ArrayIndexInsn(2, 5, 0),
+        asm.AdditionInsn(2, 2, 1),
+        asm.ArrayAmendmentInsn(5, 0, 2),
+        asm.OutputInsn(2),
+        asm.OrthographyInsn(3, 3),
+        asm.LoadProgramInsn(0, 3)])
+
+
+# runs loop n times and halts
+def countdown_program(n):
+    return asm.encode_instructions([
+        asm.OrthographyInsn(1, n),
+        asm.OrthographyInsn(0, 0),
+        asm.NotAndInsn(7, 0, 0),            # -1
+        asm.OrthographyInsn(4, 4),
+        asm.AdditionInsn(1, 1, 7),          # 4: loop
+        asm.OrthographyInsn(6, 8),
+        asm.ConditionalMoveInsn(6, 4, 1),
+        asm.LoadProgramInsn(0, 6),
+        asm.HaltInsn()])
+
+
+# platter of instruction, built in register :A: from :D: = 2^24 and :E: = 16
+def load_platter(insn):
+    code = int.from_bytes(insn.encode(), byteorder='big')
+    return [asm.OrthographyInsn(0, code >> 28),
+            asm.MultiplicationInsn(0, 0, 3),
+            asm.MultiplicationInsn(0, 0, 4),
+            asm.OrthographyInsn(7, code & ((1 << 25) - 1)),
+            asm.AdditionInsn(0, 0, 7)]
+
+
+# overwrites instruction at address 23 after it was executed once
+def self_modifying_program():
+    return asm.encode_instructions([
+        asm.OrthographyInsn(3, 1 << 24),
+        asm.OrthographyInsn(4, 16),
+        *load_platter(asm.OutputInsn(1)),   # 2..6
+        asm.OrthographyInsn(1, ord('A')),
+        asm.OrthographyInsn(2, 0),
+        asm.OrthographyInsn(5, 0),          # pass flag
+        asm.OrthographyInsn(6, 23),
+        asm.LoadProgramInsn(2, 6),          # 11: first pass
+        asm.ArrayAmendmentInsn(2, 6, 0),    # 12
+        asm.LoadProgramInsn(2, 6),          # second pass
+        *[asm.HaltInsn()] * 9,
+        asm.OrthographyInsn(7, 0),          # 23: replaced by output
+        asm.OrthographyInsn(3, 29),
+        asm.OrthographyInsn(4, 31),
+        asm.ConditionalMoveInsn(3, 4, 5),
+        asm.OrthographyInsn(5, 1),
+        asm.LoadProgramInsn(2, 3),
+        asm.OrthographyInsn(3, 12),         # 29
+        asm.LoadProgramInsn(2, 3),
+        asm.HaltInsn()])                    # 31
+
+
+# copies output + halt into new array and loads it as a program
+def load_program_program():
+    return asm.encode_instructions([
+        asm.OrthographyInsn(3, 1 << 24),
+        asm.OrthographyInsn(4, 16),
+        asm.OrthographyInsn(1, 2),
+        asm.AllocationInsn(2, 1),
+        *load_platter(asm.OutputInsn(1)),
+        asm.OrthographyInsn(6, 0),
+        asm.ArrayAmendmentInsn(2, 6, 0),
+        *load_platter(asm.HaltInsn()),
+        asm.OrthographyInsn(6, 1),
+        asm.ArrayAmendmentInsn(2, 6, 0),
+        asm.OrthographyInsn(1, ord('B')),
+        asm.OrthographyInsn(6, 0),
+        asm.LoadProgramInsn(2, 6)])
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_engines(engine):
+    um = UniversalMachine(self_modifying_program(), engine=engine)
+    assert um.engine == engine
+    assert um.run() == b'A'
+    assert um.state == UniversalMachine.State.HALT
+    assert um.error_message == ''
+
+    um = UniversalMachine(load_program_program(), engine=engine)
+    assert um.run() == b'B'
+    assert um.state == UniversalMachine.State.HALT
+    assert um.error_message == ''
+
+
+# sums 1 (n times), then rewrites the summing instruction of the hot
+# loop to add the counter, runs the loop again and prints the sum & 255
+def hot_rewrite_program(n):
+    loop, rewrite, finish = 7, 12, 18
+    return asm.encode_instructions([
+        asm.OrthographyInsn(0, 0),
+        asm.OrthographyInsn(1, n),
+        asm.OrthographyInsn(2, 0),
+        asm.OrthographyInsn(5, 1),
+        asm.NotAndInsn(7, 0, 0),            # -1
+        asm.OrthographyInsn(4, loop),
+        asm.OrthographyInsn(6, rewrite),    # exit of the loop
+        asm.AdditionInsn(2, 2, 5),          # 7: loop, rewritten
+        asm.AdditionInsn(1, 1, 7),
+        asm.AdditionInsn(3, 6, 0),
+        asm.ConditionalMoveInsn(3, 4, 1),
+        asm.LoadProgramInsn(0, 3),
+        asm.OrthographyInsn(3, 24),         # 12: rewrite
+        asm.ArrayIndexInsn(3, 0, 3),
+        asm.ArrayAmendmentInsn(0, 4, 3),
+        asm.OrthographyInsn(1, n),
+        asm.OrthographyInsn(6, finish),
+        asm.LoadProgramInsn(0, 4),
+        asm.OrthographyInsn(5, 255),        # 18: finish
+        asm.NotAndInsn(2, 2, 5),
+        asm.NotAndInsn(2, 2, 2),
+        asm.OutputInsn(2),
+        asm.HaltInsn(),
+        asm.HaltInsn(),
+        asm.AdditionInsn(2, 2, 1)])         # 24: new loop instruction
+
+
+def test_jit():
+    results = {}
+    for engine in engines:
+        for program in [countdown_program(1000), hot_rewrite_program(200)]:
+            um = UniversalMachine(program, engine=engine)
+            output = um.run()
+            assert um.state == UniversalMachine.State.HALT and um.error_message == ''
+            results.setdefault(engine, []).append((output, um.instructions_executed))
+
+    assert results[UniversalMachine.Engine.TABLE][1][0] == bytes([(200 + 200 * 201 // 2) & 255])
+    assert results[UniversalMachine.Engine.JIT] == results[UniversalMachine.Engine.TABLE]
+
+    um = UniversalMachine(hot_rewrite_program(200), engine=UniversalMachine.Engine.JIT)
+    um.run()
+    stats = um.jit_stats()
+    if stats['blocks']:             # native code is x86-64 only
+        assert stats['blocks'] == 2
+        assert stats['flushes'] == 1
+        assert stats['instructions'] > um.instructions_executed / 2
+    assert UniversalMachine(um).jit_stats()['blocks'] == 0
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_command_limit(engine):
+    um = UniversalMachine(echo_program(), engine=engine)
+    um.command_limit = 3
+    um.write_input_bytes(b'xyz')
+    assert um.run() == b''
+    assert um.state == UniversalMachine.State.IDLE
+    um.command_limit = None
+    assert um.run() == b'xyz'
+    assert um.state == UniversalMachine.State.WAITING
+
+
+def test_program_sources(tmp_path):
+    program = echo_program()
+    (tmp_path / 'echo.umz').write_bytes(program)
+    with (tmp_path / 'echo.umz').open('rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    sources = [program, bytearray(program), memoryview(program), mapped,
+               tmp_path / 'echo.umz', str(tmp_path / 'echo.umz')]
+    for source in sources:
+        um = UniversalMachine(source)
+        um.write_input_bytes(b'ok')
+        assert um.run() == b'ok'
+    mapped.close()
+
+    with pytest.raises(ValueError):
+        UniversalMachine(program[:-1])
+    with pytest.raises(FileNotFoundError):
+        UniversalMachine(tmp_path / 'missing.umz')
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_copy(engine):
+    um = UniversalMachine(accumulator_program(), engine=engine)
+    um.write_input_bytes(b'A')
+    assert um.run() == b'A'
+
+    clone = UniversalMachine(um)
+    clone.write_input(2)
+    assert clone.run() == b'C'
+    um.write_input(1)
+    assert um.run() == b'B'
+    clone.write_input(1)
+    assert clone.run() == b'D'
+    um.write_input(1)
+    assert um.run() == b'C'
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_snapshot(engine, tmp_path):
+    um = UniversalMachine(accumulator_program())
+    um.write_input_bytes(b'A')
+    assert um.run() == b'A'
+    um.write_input_bytes(b'\x01\x02')
+    um.save(tmp_path / 'um.snap')
+
+    loaded = UniversalMachine.load(tmp_path / 'um.snap', engine=engine)
+    assert loaded.engine == engine
+    assert loaded.state == UniversalMachine.State.IDLE
+    assert loaded.input_pending == 2
+    assert loaded.run() == b'BD'
+    assert um.run() == b'BD'
+
+    um = UniversalMachine(load_program_program())
+    um.run()
+    um.save(tmp_path / 'halt.snap')
+    loaded = UniversalMachine.load(str(tmp_path / 'halt.snap'))
+    assert loaded.state == UniversalMachine.State.HALT
+    assert loaded.run() == b''
+
+    with pytest.raises(FileNotFoundError):
+        UniversalMachine.load(tmp_path / 'missing.snap')
+    (tmp_path / 'broken.snap').write_bytes(b'UMS')
+    with pytest.raises(RuntimeError):
+        UniversalMachine.load(tmp_path / 'broken.snap')
+
+
+# strided views are refused, not read as the bytes they span
+@pytest.mark.parametrize('machine', [UniversalMachine, um_python.UniversalMachine])
+def test_strided_buffers(machine):
+    strided = memoryview(b'AxBy')[::2]
+    um = machine(echo_program())
+    with pytest.raises(ValueError):
+        um.write_input_bytes(strided)
+    assert um.input_pending == 0
+    um.write_input_bytes(memoryview(b'xAB')[1:])
+    um.write_input_bytes(bytes(strided))
+    assert um.run() == b'ABAB'
+
+    with um.fork(process=False) as branch:
+        with pytest.raises(ValueError):
+            branch.run(strided)
+        assert branch.run(memoryview(b'xCD')[1:]) == b'CD'
+
+    with pytest.raises(ValueError):
+        machine(memoryview(echo_program() * 2)[::2])
+
+
+# copies decode the program again; before and after it is rewritten
+@pytest.mark.parametrize('engine', engines)
+@pytest.mark.parametrize('budget', [500, 1500])
+def test_copy_of_rewritten_program(engine, budget):
+    expected = bytes([(200 + 200 * 201 // 2) & 255])
+    um = UniversalMachine(hot_rewrite_program(200), engine=engine)
+    um.instruction_budget = budget
+    assert um.run() == b''
+    clone = UniversalMachine(um)
+    um.instruction_budget = clone.instruction_budget = None
+    assert clone.run() == expected
+    assert um.run() == expected
+    assert clone.instructions_executed == um.instructions_executed
+
+
+# edits of the words of a snapshot that leave no machine to load;
+# header: magic, state, finger, regs[8], #abandoned, #input, #arrays, #message
+def broken_state(words, state):
+    words[1] = state
+    return words
+
+
+def abandoned_out_of_range(words):
+    words[11] += 1
+    return words[:15] + [words[13]] + words[15:]
+
+
+def huge_program(words):
+    words[15 + words[11] + words[12]] = 1 << 30     # 4 GB
+    return words
+
+
+def finger_past_program(words):
+    words[2] = words[15 + words[11] + words[12]]
+    return words
+
+
+@pytest.mark.parametrize('machine', [UniversalMachine, um_python.UniversalMachine])
+@pytest.mark.parametrize('edit', [lambda words: broken_state(words, 1),
+                                  lambda words: broken_state(words, 7),
+                                  abandoned_out_of_range, huge_program, finger_past_program])
+def test_broken_snapshot(machine, edit, tmp_path):
+    um = UniversalMachine(accumulator_program())
+    um.run()
+    um.write_input_bytes(b'\x01')
+    um.save(tmp_path / 'um.snap')
+    words = edit(array('I', (tmp_path / 'um.snap').read_bytes()).tolist())
+    (tmp_path / 'um.snap').write_bytes(array('I', words).tobytes())
+    with pytest.raises(RuntimeError):
+        machine.load(tmp_path / 'um.snap')
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_instructions_executed(engine):
+    um = UniversalMachine(countdown_program(10), engine=engine)
+    um.command_limit = 5
+    um.run()
+    assert um.instructions_executed == 5
+    um.command_limit = None
+    um.run()
+    assert um.state == UniversalMachine.State.HALT
+    assert um.instructions_executed == 4 + 4 * 10 + 1
+
+    um = UniversalMachine(echo_program(), engine=engine)
+    um.run()
+    assert um.instructions_executed == 3
+    um.write_input_bytes(b'ab')
+    um.run()
+    assert um.instructions_executed == 3 + 2 * 8
+
+
+def test_run_releases_gil():
+    um = UniversalMachine(countdown_program(1 << 22), engine=UniversalMachine.Engine.DECODED)
+    thread = threading.Thread(target=um.run)
+    thread.start()
+    steps = 0
+    while thread.is_alive():
+        steps += 1
+    assert um.state == UniversalMachine.State.HALT
+    assert steps > 100
+
+
+def test_input_bytes():
+    um = UniversalMachine(echo_program())
+    assert um.run() == b''
+    assert um.state == UniversalMachine.State.WAITING
+
+    um.write_input_bytes(b'hello, ')
+    um.write_input_bytes(bytearray(b'world'))
+    assert um.input_pending == 12
+    assert um.run() == b'hello, world'
+    assert um.state == UniversalMachine.State.WAITING
+    assert um.input_pending == 0
+
+    um.write_input(ord('!'))
+    um.write_input(-1)
+    assert um.run() == b'!'
+    assert um.state == UniversalMachine.State.HALT
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_input_bytes_output_limit(engine):
+    um = UniversalMachine(echo_program(), engine=engine)
+    um.output_buffer_limit = 4
+    um.write_input_bytes(b'0123456789')
+    output = []
+    while um.state == UniversalMachine.State.IDLE:
+        output.append(um.run())
+    assert output == [b'0123', b'4567', b'89']
+    assert um.state == UniversalMachine.State.WAITING
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_profile(engine):
+    um = UniversalMachine(countdown_program(5), engine=engine)
+    um.profiling = True
+    um.run()
+    assert um.state == UniversalMachine.State.HALT
+    profile = um.profile()
+    assert sum(profile['opcodes'].values()) == um.instructions_executed
+    assert profile['opcodes']['orthography'] == 3 + 5
+    assert profile['opcodes']['load_program'] == 5
+    assert profile['opcodes']['halt'] == 1
+    assert profile['fingers'][4] == 5
+    assert profile['fingers'][8] == 1
+    assert profile['jumps'] == {4: 4, 8: 1}
+    assert profile['loads'] == {}
+    assert profile['array_sizes'] == {4: 1}     # 9 words
+
+    um = UniversalMachine(accumulator_program(), engine=engine)
+    um.profiling = True
+    um.run()
+    um.write_input_bytes(b'ab')
+    um.run()
+    profile = um.profile()
+    assert profile['opcodes']['input'] == 2    # waiting is not counted
+    assert profile['allocations'] == 1
+    assert profile['abandonments'] == 0
+    assert profile['allocation_sizes'] == {1: 1}
+    assert profile['array_sizes'] == {1: 1, 4: 1}
+
+    um.reset_profile()
+    assert sum(um.profile()['opcodes'].values()) == 0
+    assert um.profile()['fingers'] == {}
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_instruction_budget(engine):
+    um = UniversalMachine(countdown_program(100), engine=engine)
+    um.instruction_budget = 50
+    um.command_limit = 20
+    for executed in [20, 40, 50, 50]:
+        um.run()
+        assert um.state == UniversalMachine.State.IDLE
+        assert um.instructions_executed == executed
+    assert um.budget_exhausted
+
+    um.instruction_budget += 100
+    assert not um.budget_exhausted
+    um.command_limit = None
+    um.run()
+    assert um.instructions_executed == 150
+    um.instruction_budget = None
+    um.run()
+    assert um.state == UniversalMachine.State.HALT
+    assert um.instructions_executed == 4 + 4 * 100 + 1
+    assert not um.budget_exhausted
+
+
+# allocates an array of 5, prints 'A' + its first word, dirties it
+# and abandons it, three times over
+def reuse_program():
+    step = [asm.AllocationInsn(2, 1),
+            asm.ArrayIndexInsn(4, 2, 0),
+            asm.AdditionInsn(6, 4, 5),
+            asm.OutputInsn(6),
+            asm.ArrayAmendmentInsn(2, 0, 1),
+            asm.AbandonmentInsn(2)]
+    return asm.encode_instructions([
+        asm.OrthographyInsn(0, 0),
+        asm.OrthographyInsn(1, 5),
+        asm.OrthographyInsn(5, ord('A')),
+        *step, *step, *step,
+        asm.HaltInsn()])
+
+
+@extension_only
+@pytest.mark.parametrize('engine', engines)
+def test_allocator_reuse(engine):
+    um = UniversalMachine(reuse_program(), engine=engine)
+    assert um.run() == b'AAA'
+    stats = um.allocator_stats()
+    assert stats['allocations'] == 3
+    assert stats['reused'] == 2
+    assert stats['abandonments'] == stats['pooled'] == 3
+    assert stats['pooled_words'] == 8
+
+    # copy starts with an empty pool
+    assert UniversalMachine(um).allocator_stats()['pooled_words'] == 0
+
+
+@pytest.mark.parametrize('process', [True, False])
+@pytest.mark.parametrize('engine', engines)
+def test_fork(engine, process):
+    um = UniversalMachine(accumulator_program(), engine=engine)
+    um.write_input_bytes(b'A')
+    assert um.run() == b'A'
+    executed = um.instructions_executed
+
+    with um.fork(process=process) as branch:
+        assert branch.run(b'\2\1') == b'CD'
+        assert branch.state == UniversalMachine.State.WAITING
+        assert branch.instructions_executed == executed + 2 * 7
+        # the parent is where it was
+        assert um.instructions_executed == executed
+        um.write_input(1)
+        assert um.run() == b'B'
+        assert branch.run(b'\1') == b'E'
+
+    with pytest.raises(RuntimeError):
+        branch.run(b'\1')
+
+    # halted branch stays halted
+    branch = um.fork(process=process)
+    assert branch.run(b'\xff') == b''
+    assert branch.state == UniversalMachine.State.HALT
+    assert branch.error_message
+    assert branch.run(b'\1') == b''
+    branch.close()
+
+
+def test_fork_budget():
+    um = UniversalMachine(countdown_program(1000))
+    um.instruction_budget = 100
+    branch = um.fork()
+    assert branch.run() == b''
+    assert branch.state == UniversalMachine.State.IDLE
+    assert branch.instructions_executed == 100
+    assert um.instructions_executed == 0
@@ -0,0 +1,466 @@
+# Pure-Python Universal Machine with the API of um_emulator.UniversalMachine.
+# cpp/__init__.py puts it in place of cpp.um_emulator when the extension
+# cannot be built (or with UM_EMULATOR_PYTHON=1).
+#
+# Arrays are array('I'), array 0 is decoded lazily into a list of
+# (op, a, b, c) tuples and run by one loop with locals only.
+# Engines are accepted and all run the same loop; there is no JIT
+# and no allocation pool.
+# About 6 MIPS on CPython 3.11 (countdown loop), ~50x slower than
+# the DECODED engine of the extension.
+
+from array import array
+from collections import Counter, deque
+from enum import Enum
+from itertools import repeat
+from pathlib import Path
+import os
+import sys
+
+MASK = 0xffffffff
+END = 17            # past the last word of array 0
+
+assert array('I').itemsize == 4
+
+OPCODE_NAMES = ['conditional_move', 'array_index', 'array_amendment', 'addition',
+                'multiplication', 'division', 'not_and', 'halt', 'allocation',
+                'abandonment', 'output', 'input', 'load_program', 'orthography',
+                'illegal']
+
+SNAPSHOT_MAGIC = 0x31534d55     # "UMS1", same format as the extension
+SHARED = 0xffffffff
+
+
+# (op, A, B, C), orthography keeps its value in place of B
+def decode(platter: int) -> tuple:
+    op = platter >> 28
+    if op == 13:
+        return (13, (platter >> 25) & 7, platter & 0x1ffffff, 0)
+    return (op, (platter >> 6) & 7, (platter >> 3) & 7, platter & 7)
+
+
+# bytes of a program or input buffer, strided views are refused as in the extension
+def contiguous_bytes(data, what: str) -> memoryview:
+    data = memoryview(data)
+    if not data.contiguous:
+        raise ValueError(what + ' buffer is not contiguous')
+    return data.cast('B')
+
+
+# program words from big-endian bytes
+def words_from_bytes(data) -> array:
+    data = contiguous_bytes(data, 'Program')
+    if len(data) % 4 != 0:
+        raise ValueError('Program size is not a multiple of 4')
+    words = array('I')
+    words.frombytes(data)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words
+
+
+class UniversalMachine:
+    class State(Enum):
+        IDLE = 0
+        RUNNING = 1
+        WAITING = 2
+        HALT = 3
+
+    class Engine(Enum):
+        TABLE = 0
+        DECODED = 1
+        JIT = 2
+
+    EMPTY = array('I')      # all abandoned arrays, never written as it is empty
+
+    def __init__(self, program, engine: Engine = Engine.TABLE):
+        if isinstance(program, UniversalMachine):
+            self._copy_from(program)
+            return
+        if isinstance(program, (str, os.PathLike)):
+            program = Path(program).read_bytes()
+        self._init_empty(engine)
+        self.arrays.append(words_from_bytes(program))
+        self._reset_code()
+
+    def _init_empty(self, engine: Engine):
+        self.engine = engine
+        self.arrays = []
+        self.abandoned = []
+        self.exec_finger = 0
+        self.regs = [0] * 8
+        self.state = UniversalMachine.State.IDLE
+        self.error_message = ''
+        self.output_buffer_limit = None
+        self.command_limit = None
+        self.instruction_budget = None
+        self.instructions_executed = 0
+        self.profiling = False
+        self._in = deque()
+        self._out = bytearray()
+        self._code = []
+        self._allocations = 0
+        self._abandonments = 0
+        self.reset_profile()
+
+    def _copy_from(self, other: 'UniversalMachine'):
+        self._init_empty(other.engine)
+        self.arrays = [a if a is self.EMPTY else a[:] for a in other.arrays]
+        self.abandoned = other.abandoned[:]
+        self.exec_finger = other.exec_finger
+        self.regs = other.regs[:]
+        self.state = other.state
+        self.error_message = other.error_message
+        self.output_buffer_limit = other.output_buffer_limit
+        self.command_limit = other.command_limit
+        self.instruction_budget = other.instruction_budget
+        self.instructions_executed = other.instructions_executed
+        self.profiling = other.profiling
+        self._in = deque(other._in)
+        self._reset_code()
+
+    # drops decoded instructions, when array 0 is replaced
+    def _reset_code(self) -> list:
+        self._code = [None] * len(self.arrays[0]) + [(END, 0, 0, 0)]
+        return self._code
+
+    # --------------------------- input ------------------------------ #
+
+    def write_input(self, c: int):
+        assert self.state in (UniversalMachine.State.WAITING, UniversalMachine.State.IDLE)
+        self._in.append(c)
+        if self.state == UniversalMachine.State.WAITING:
+            self.state = UniversalMachine.State.IDLE
+
+    def write_input_bytes(self, data):
+        assert self.state in (UniversalMachine.State.WAITING, UniversalMachine.State.IDLE)
+        data = contiguous_bytes(data, 'Input')
+        self._in.extend(data)
+        if self.state == UniversalMachine.State.WAITING and len(data) > 0:
+            self.state = UniversalMachine.State.IDLE
+
+    @property
+    def input_pending(self) -> int:
+        return len(self._in)
+
+    # ---------------------------- run ------------------------------- #
+
+    @property
+    def budget_exhausted(self) -> bool:
+        return (self.instruction_budget is not None
+                and self.instructions_executed >= self.instruction_budget)
+
+    # instructions this run may execute, as in the extension
+    def _run_limit(self) -> int:
+        limit = self.command_limit if self.command_limit is not None else 1 << 64
+        if self.instruction_budget is not None:
+            limit = min(limit, max(0, self.instruction_budget - self.instructions_executed))
+        return limit
+
+    # runs until halt, input request or a limit; returns the new output
+    def run(self) -> bytes:
+        assert not self._out
+        if self.state == UniversalMachine.State.HALT:
+            return b''
+        assert self.state == UniversalMachine.State.IDLE
+        self.state = UniversalMachine.State.RUNNING
+
+        limit = self._run_limit()
+        run = self._run_profiled if self.profiling else self._run_decoded
+        self.instructions_executed += run(limit)
+
+        result = bytes(self._out)
+        self._out.clear()
+        return result
+
+    def _fail(self, message: str):
+        self.error_message = message
+        self.state = UniversalMachine.State.HALT
+
+    # the loop; returns the number of executed instructions
+    def _run_decoded(self, limit: int) -> int:
+        regs = self.regs
+        arrays = self.arrays
+        abandoned = self.abandoned
+        program = arrays[0]
+        code = self._code
+        out = self._out
+        inq = self._in
+        empty = self.EMPTY
+        out_limit = self.output_buffer_limit if self.output_buffer_limit is not None else 1 << 64
+        finger = self.exec_finger
+        uncounted = 0           # instruction that stopped the loop, if it is not one
+        state = UniversalMachine.State.IDLE
+
+        # repeat() is the cheapest loop, its length hint tells what is left
+        steps = repeat(None, min(limit, sys.maxsize) if len(out) < out_limit else 0)
+        for _ in steps:
+            op, a, b, c = code[finger] or self._decode_at(finger)
+            finger += 1
+
+            if op == 13:
+                regs[a] = b
+            elif op == 3:
+                regs[a] = (regs[b] + regs[c]) & MASK
+            elif op == 12:
+                if regs[b]:
+                    program = arrays[0] = arrays[regs[b]][:]
+                    code = self._reset_code()
+                if regs[c] >= len(program):
+                    self._fail('Finger out of bounds')
+                    break
+                finger = regs[c]
+            elif op == 0:
+                if regs[c]:
+                    regs[a] = regs[b]
+            elif op == 1:
+                try:
+                    regs[a] = arrays[regs[b]][regs[c]]
+                except IndexError:
+                    self._fail('Index out of bounds')
+                    break
+            elif op == 2:
+                try:
+                    arrays[regs[a]][regs[b]] = regs[c]
+                except IndexError:
+                    self._fail('Index out of bounds')
+                    break
+                if regs[a] == 0:
+                    code[regs[b]] = None
+            elif op == 6:
+                regs[a] = ~(regs[b] & regs[c]) & MASK
+            elif op == 4:
+                regs[a] = (regs[b] * regs[c]) & MASK
+            elif op == 5:
+                if not regs[c]:
+                    self._fail('Zero division')
+                    break
+                regs[a] = regs[b] // regs[c]
+            elif op == 10:
+                if regs[c] > 255:
+                    self._fail('Not-ASCII output')
+                    break
+                out.append(regs[c])
+                if len(out) >= out_limit:
+                    break
+            elif op == 11:
+                if not inq:
+                    state = UniversalMachine.State.WAITING
+                    finger -= 1
+                    uncounted = 1       # to be executed again
+                    break
+                x = inq.popleft()
+                if x < -1 or x > 255:
+                    self._fail('Not-ASCII input')
+                    break
+                regs[c] = x & MASK
+            elif op == 8:
+                self._allocations += 1
+                new = array('I', bytes(4 * regs[c]))
+                if abandoned:
+                    index = abandoned.pop()
+                    arrays[index] = new
+                else:
+                    index = len(arrays)
+                    arrays.append(new)
+                regs[b] = index
+            elif op == 9:
+                if regs[c] == 0:
+                    self._fail('Abandoning working program')
+                    break
+                self._abandonments += 1
+                arrays[regs[c]] = empty
+                abandoned.append(regs[c])
+            elif op == 7:
+                self.state = UniversalMachine.State.HALT
+                break
+            elif op == END:
+                uncounted = 1           # not an instruction
+                self._fail('Finger out of bounds')
+                break
+            else:
+                self._fail('Illegal operation')
+                break
+
+        if self.state == UniversalMachine.State.RUNNING:
+            self.state = state
+        self.exec_finger = finger
+        return min(limit, sys.maxsize) - steps.__length_hint__() - uncounted
+
+    def _decode_at(self, finger: int) -> tuple:
+        insn = self._code[finger] = decode(self.arrays[0][finger])
+        return insn
+
+    # ------------------------- profiling ---------------------------- #
+
+    def reset_profile(self):
+        self._opcodes = [0] * len(OPCODE_NAMES)
+        self._fingers = Counter()
+        self._jumps = Counter()
+        self._loads = Counter()
+        self._allocation_sizes = Counter()
+        self._profile_allocations = 0
+        self._profile_abandonments = 0
+
+    # one instruction at a time, counted as by the extension
+    def _run_profiled(self, limit: int) -> int:
+        out_limit = self.output_buffer_limit if self.output_buffer_limit is not None else 1 << 64
+        executed = 0
+        while executed < limit:
+            finger = self.exec_finger
+            program = self.arrays[0]
+            platter = program[finger] if finger < len(program) else None
+            self.state = UniversalMachine.State.RUNNING
+            n = self._run_decoded(1)
+            if n:
+                executed += 1
+                self._count_profile(finger, platter)
+            if self.state != UniversalMachine.State.IDLE or len(self._out) >= out_limit:
+                return executed
+        self.state = UniversalMachine.State.IDLE
+        return executed
+
+    # after the platter is executed: B and C still hold the operands
+    def _count_profile(self, finger: int, platter: int):
+        op = platter >> 28
+        b, c = self.regs[(platter >> 3) & 7], self.regs[platter & 7]
+        self._opcodes[min(op, 14)] += 1
+        self._fingers[finger] += 1
+        if op == 8:
+            self._profile_allocations += 1
+            self._allocation_sizes[len(self.arrays[b]).bit_length()] += 1
+        elif op == 9:
+            self._profile_abandonments += 1
+        elif op == 12:
+            (self._loads if b else self._jumps)[c] += 1
+
+    def profile(self) -> dict:
+        abandoned = set(self.abandoned)
+        array_sizes = Counter(len(a).bit_length()
+                              for i, a in enumerate(self.arrays) if i not in abandoned)
+        return {'opcodes': dict(zip(OPCODE_NAMES, self._opcodes)),
+                'fingers': dict(self._fingers),
+                'jumps': dict(self._jumps),
+                'loads': dict(self._loads),
+                'allocations': self._profile_allocations,
+                'abandonments': self._profile_abandonments,
+                'allocation_sizes': dict(self._allocation_sizes),
+                'array_sizes': dict(array_sizes)}
+
+    def allocator_stats(self) -> dict:
+        return {'allocations': self._allocations, 'reused': 0,
+                'abandonments': self._abandonments, 'pooled': 0, 'pooled_words': 0}
+
+    def jit_stats(self) -> dict:
+        return {'blocks': 0, 'flushes': 0, 'instructions': 0, 'code_bytes': 0}
+
+    # a copy to try input on, see Branch; never a separate process here
+    def fork(self, process: bool = True) -> 'Branch':
+        return Branch(self)
+
+    # -------------------------- snapshots --------------------------- #
+
+    # same format as the extension: native-endian words, see um_emulator.cpp
+    def save(self, path):
+        assert self.state != UniversalMachine.State.RUNNING
+        message = self.error_message.encode()
+        header = array('I', [SNAPSHOT_MAGIC, self.state.value, self.exec_finger, *self.regs,
+                             len(self.abandoned), len(self._in), len(self.arrays), len(message),
+                             *self.abandoned, *(c & MASK for c in self._in)])
+        with open(path, 'wb') as f:
+            f.write(header.tobytes())
+            for a in self.arrays:
+                f.write(array('I', [len(a)]).tobytes())
+                f.write(a.tobytes())
+            f.write(message + b'\0' * (-len(message) % 4))
+
+    @staticmethod
+    def load(path, engine: Engine = Engine.TABLE) -> 'UniversalMachine':
+        data = memoryview(Path(path).read_bytes())
+        offset = 0
+
+        def read_words(count: int) -> array:
+            nonlocal offset
+            if offset + 4 * count > len(data):
+                raise RuntimeError('Snapshot is truncated')
+            words = array('I')
+            words.frombytes(data[offset:offset + 4 * count])
+            offset += 4 * count
+            return words
+
+        um = UniversalMachine.__new__(UniversalMachine)
+        um._init_empty(engine)
+        if read_words(1)[0] != SNAPSHOT_MAGIC:
+            raise RuntimeError('Not a snapshot')
+        state, um.exec_finger = read_words(2)
+        if not state in {s.value for s in (UniversalMachine.State.IDLE, UniversalMachine.State.WAITING,
+                                           UniversalMachine.State.HALT)}:
+            raise RuntimeError('Broken snapshot')
+        um.state = UniversalMachine.State(state)
+        um.regs = read_words(8).tolist()
+        abandoned_count, input_count, array_count, message_size = read_words(4)
+        um.abandoned = read_words(abandoned_count).tolist()
+        if any(index == 0 or index >= array_count for index in um.abandoned):
+            raise RuntimeError('Broken snapshot')
+        um._in = deque(c if c != MASK else -1 for c in read_words(input_count))
+        for i in range(array_count):
+            size = read_words(1)[0]
+            if size == SHARED:
+                index = read_words(1)[0]
+                if index >= i:
+                    raise RuntimeError('Broken snapshot')
+                um.arrays.append(um.arrays[index][:] if um.arrays[index] is not um.EMPTY else um.EMPTY)
+            elif size == 0:
+                um.arrays.append(um.EMPTY)
+            else:
+                um.arrays.append(read_words(size))
+        # a machine to resume needs an instruction at the finger
+        if (not um.arrays or um.exec_finger > len(um.arrays[0]) or
+                um.state != UniversalMachine.State.HALT and um.exec_finger == len(um.arrays[0])):
+            raise RuntimeError('Broken snapshot')
+
+        message = bytes(data[offset:offset + (message_size + 3) // 4 * 4])
+        if len(message) < message_size:
+            raise RuntimeError('Snapshot is truncated')
+        um.error_message = message[:message_size].decode()
+        um._reset_code()
+        return um
+
+
+
+# Branch of a machine, as in the extension. The extension forks a process
+# for it; here it is always a copy, process or not.
+class Branch:
+    is_process = False
+
+    def __init__(self, um: UniversalMachine):
+        self._um = UniversalMachine(um)
+        self.state = self._um.state
+        self.instructions_executed = self._um.instructions_executed
+        self.error_message = self._um.error_message
+
+    # feeds input, runs until the machine waits for more, halts
+    # or spends its budget; returns the output
+    def run(self, input=b'') -> bytes:
+        um = self._um
+        if um is None:
+            raise RuntimeError('Branch is closed')
+        input = contiguous_bytes(input, 'Input')
+        output = bytearray()
+        if um.state != UniversalMachine.State.HALT:
+            um.write_input_bytes(input)
+            while um.state == UniversalMachine.State.IDLE and not um.budget_exhausted:
+                output += um.run()
+        self.state = um.state
+        self.instructions_executed = um.instructions_executed
+        self.error_message = um.error_message
+        return bytes(output)
+
+    def close(self):
+        self._um = None
+
+    def __enter__(self) -> 'Branch':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,107 @@
+from . import um_python, build_key
+from .um_emulator import UniversalMachine
+from .um_emulator_test import (echo_program, accumulator_program, countdown_program,
+                               self_modifying_program, load_program_program,
+                               hot_rewrite_program, reuse_program)
+
+from pathlib import Path
+import os
+import shutil
+import subprocess
+import sys
+import sysconfig
+import pytest
+
+programs = [
+    (echo_program(), b'hello\nworld\n'),
+    (accumulator_program(), b'\x01\x02\x03'),
+    (countdown_program(100), b''),
+    (self_modifying_program(), b''),
+    (load_program_program(), b''),
+    (hot_rewrite_program(200), b''),
+    (reuse_program(), b''),
+]
+
+
+# feeds input by bytes, runs in steps of limits, records everything seen
+def transcript(Machine, program, input, **limits):
+    um = Machine(program)
+    for name, value in limits.items():
+        setattr(um, name, value)
+    seen = []
+    for _ in range(10000):
+        output = um.run()
+        seen.append((output, um.state.name, um.instructions_executed, um.input_pending))
+        if um.state.name == 'HALT':
+            break
+        if um.state.name == 'WAITING':
+            if not input:
+                break
+            um.write_input(input[0])
+            input = input[1:]
+    return seen, um.error_message, um.allocator_stats()['allocations']
+
+
+@pytest.mark.parametrize('program,input', programs)
+@pytest.mark.parametrize('limits', [{}, {'command_limit': 7}, {'output_buffer_limit': 1},
+                                    {'instruction_budget': 50}])
+def test_same_as_extension(program, input, limits):
+    assert (transcript(um_python.UniversalMachine, program, input, **limits)
+            == transcript(UniversalMachine, program, input, **limits))
+
+
+def test_snapshot_compatible(tmp_path):
+    um = um_python.UniversalMachine(accumulator_program())
+    um.run()
+    um.write_input_bytes(b'\x01\x02')
+    um.save(tmp_path / 'py.snap')
+    native = UniversalMachine.load(tmp_path / 'py.snap')
+    assert native.run() == b'\x01\x03'
+
+    native.write_input(-1)
+    native.save(tmp_path / 'native.snap')
+    um = um_python.UniversalMachine.load(tmp_path / 'native.snap')
+    assert um.input_pending == 1
+    assert um.run() == b'\x02'
+    assert um.state == um_python.UniversalMachine.State.WAITING
+
+
+def test_profile():
+    machines = [um_python.UniversalMachine(accumulator_program()),
+                UniversalMachine(accumulator_program())]
+    for um in machines:
+        um.profiling = True
+        um.run()
+        um.write_input_bytes(b'abc')
+        um.run()
+    assert machines[0].profile() == machines[1].profile()
+
+
+def test_copy():
+    um = um_python.UniversalMachine(accumulator_program())
+    um.write_input_bytes(b'A')
+    assert um.run() == b'A'
+    copy = um_python.UniversalMachine(um)
+    um.write_input(1)
+    assert um.run() == b'B'
+    copy.write_input(2)
+    assert copy.run() == b'C'
+
+
+# a build that is there but does not import (stale, other ABI) falls back too
+def test_fallback_on_broken_build(tmp_path):
+    package = tmp_path / 'cpp'
+    package.mkdir()
+    for name in ['__init__.py', 'um_emulator.cpp', 'um_python.py']:
+        shutil.copy(Path(um_python.__file__).parent / name, package / name)
+    cxx = os.environ.get('CXX') or shutil.which('c++') or 'g++'
+    build = package / 'build' / build_key(cxx, False)
+    build.mkdir(parents=True)
+    (build / ('um_emulator' + sysconfig.get_config_var('EXT_SUFFIX'))).write_bytes(b'not a module')
+
+    env = {k: v for k, v in os.environ.items() if not k.startswith('UM_EMULATOR')}
+    result = subprocess.run([sys.executable, '-c', 'import cpp.um_emulator as m; print(m.__name__)'],
+                            cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'cpp.um_python'
+    assert 'does not load' in result.stderr
@@ -0,0 +1,103 @@
+# Benchmark of map exploration by adventure_bot, items examined one by
+# one and in a batch per room (ExplorerBot.BATCH_EXAMINE).
+# There is no game to play here, so the bot plays FakeGame: a grid of
+# rooms with the items and answers of parser_benchmark's corpus, behind
+# the part of the UniversalMachine API that run() and makemove use.
+# A round trip is one write of input; --latency adds a delay to each,
+# as a game behind telnet would have.
+#
+# usage:
+# exploration_benchmark                     6x6 rooms, no latency
+# exploration_benchmark --latency 0.001 --width 8
+
+import argparse
+import random
+from time import perf_counter, sleep
+
+from cpp.um_emulator import UniversalMachine
+from adventure_bot import ExplorerBot, quarters, directions
+from parser_benchmark import corpus, room_texts
+
+
+class FakeGame:
+    def __init__(self, width: int, height: int, seed: int = 0, latency: float = 0.0):
+        rng = random.Random(seed)
+        names = [list(expected) for _, _, expected in corpus(seed)]
+        self.rooms = {}     # [ coord : (description, answers) ]
+        for i, coord in enumerate(complex(x, y) for y in range(height) for x in range(width)):
+            exits = [quarter for quarter, step in zip(quarters, directions)
+                     if 0 <= (coord + step).real < width and 0 <= (coord + step).imag < height]
+            text, answers, _ = room_texts(rng, names[i % len(names)], ' or '.join(exits))
+            self.rooms[coord] = (text.partition('\n')[2], answers)
+
+        self.position = complex(0, 0)
+        self.latency = latency
+        self.round_trips = 0
+        self.state = UniversalMachine.State.WAITING
+        self.instructions_executed = 0     # commands answered
+        self.instruction_budget = None
+        self.input = b''
+
+    @property
+    def budget_exhausted(self) -> bool:
+        return False
+
+    def write_input_bytes(self, data):
+        self.round_trips += 1
+        sleep(self.latency)
+        self.input += data
+        if data:
+            self.state = UniversalMachine.State.IDLE
+
+    # answers one command
+    def run(self) -> bytes:
+        line, _, self.input = self.input.partition(b'\n')
+        if not b'\n' in self.input:
+            self.state = UniversalMachine.State.WAITING
+        self.instructions_executed += 1
+        return (line.decode('ascii') + '\n' + self.answer(line.decode('ascii'))).encode('ascii')
+
+    def answer(self, command: str) -> str:
+        description, answers = self.rooms[self.position]
+        if command.startswith('go '):
+            step = directions[quarters.index(command[3:])]
+            if not self.position + step in self.rooms:
+                return 'You cannot go that way.\n\n>: '
+            self.position += step
+            return self.rooms[self.position][0]
+        if command == 'x':
+            return description
+        if command + '\n' in answers:
+            return answers[command + '\n'].partition('\n')[2]
+        return 'OK.\n\n>: '
+
+
+# explores the whole map, returns (seconds, round trips, rooms)
+def explore(width: int, height: int, batch: bool, seed: int = 0, latency: float = 0.0):
+    game = FakeGame(width, height, seed, latency)
+    bot = ExplorerBot()
+    bot.BATCH_EXAMINE = batch
+    bot.UM = game
+    start = perf_counter()
+    bot.explore()
+    return perf_counter() - start, game.round_trips, bot.rooms
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=6)
+    parser.add_argument('--height', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per round trip')
+    args = parser.parse_args()
+
+    results = {}
+    for batch in [False, True]:
+        elapsed, round_trips, rooms = explore(args.width, args.height, batch, args.seed, args.latency)
+        items = sum(len(room.pile) for room in rooms.values())
+        results[batch] = [[item.condition() for items in room.trash.values() for item in items]
+                          for room in rooms.values()]
+        print(f'{"batch" if batch else "one by one":10} {len(rooms)} rooms, {items} items, '
+              f'{round_trips} round trips, {elapsed:.3f} s')
+    if results[False] != results[True]:
+        raise RuntimeError('batch examine parsed other items')
@@ -0,0 +1,46 @@
+from exploration_benchmark import FakeGame, explore
+from parser_benchmark import CorpusBot, room_texts
+from adventure_bot import ExplorerBot
+import adventure_text
+
+import random
+
+
+def conditions(rooms):
+    return {coord: [(item.fullname(), item.condition()) for items in room.trash.values() for item in items]
+            for coord, room in rooms.items()}
+
+
+def test_batch_examine():
+    _, single_trips, single = explore(3, 2, batch=False, seed=1)
+    _, batch_trips, batch = explore(3, 2, batch=True, seed=1)
+    assert len(batch) == 6
+    assert conditions(batch) == conditions(single)
+    # one 'x' per room is left
+    assert single_trips - batch_trips == sum(max(0, len(room.pile) - 1) for room in batch.values())
+
+
+# prompts lost, answers are not split: items are examined one by one
+def test_batch_examine_fallback():
+    game = FakeGame(2, 1, seed=1)
+    for coord, (description, answers) in game.rooms.items():
+        game.rooms[coord] = (description, {cmd: answer.replace('>: ', '') for cmd, answer in answers.items()})
+    bot = ExplorerBot()
+    bot.UM = game
+    bot.explore()
+    _, _, expected = explore(2, 1, batch=False, seed=1)
+    assert conditions(bot.rooms) == conditions(expected)
+
+
+# answers of a batch come in wrong order: items are examined one by one
+def test_batch_examine_wrong_answers():
+    room_text, answers, expected = room_texts(random.Random(1), ['red A-1234-XYZ', 'blue B-1234-XYZ'])
+
+    class ShuffledBot(CorpusBot):
+        def makemove(self, cmd):
+            return ''.join(reversed(adventure_text.split_answers(super().makemove(cmd))))
+
+    room = ShuffledBot(answers).parse_room(room_text)
+    assert list(room.pile) == list(expected)
+    for name, (adj, basetype, condition) in expected.items():
+        assert room.trash[basetype][0].condition() == condition
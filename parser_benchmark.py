@@ -0,0 +1,144 @@
+# Benchmark of the adventure text parser on a corpus built from the
+# transcripts in logs/*.in.
+# Transcripts keep only the commands, so game answers are made up: every
+# 'go' starts a room, items named in take / x / inc / combine commands
+# lie there, and broken ones get random conditions of the other basetypes.
+# Rooms and 'x' answers are written the way the game writes them, then
+# parsed by ExplorerBot.parse_room and checked against what was generated.
+#
+# usage:
+# parser_benchmark                  corpus of logs/*.in, 20 rounds
+# parser_benchmark --rounds 100 --seed 1
+
+import argparse
+import random
+import re
+from pathlib import Path
+from time import perf_counter
+
+from adventure_bot import ExplorerBot
+
+ITEM_COMMAND = re.compile(r'^(?:take|x|inc|examine) (.+)$')
+COMBINE_COMMAND = re.compile(r'^combine (.+) with (.+)$')
+ROOM_NAMES = ['Junk Room', 'Museum Entrance', 'Rubble', 'Dead-End Alley', 'Storage Room']
+
+
+# item fullnames of each room of a transcript, one room per 'go'
+def transcript_rooms(lines):
+    rooms = [[]]
+    for line in lines:
+        line = line.strip()
+        if line.startswith('go '):
+            rooms.append([])
+            continue
+        match = COMBINE_COMMAND.match(line)
+        names = match.groups() if match else ITEM_COMMAND.findall(line)
+        for name in names:
+            if name and not name in rooms[-1]:
+                rooms[-1].append(name)
+    return [room for room in rooms if room]
+
+
+def random_condition(rng: random.Random, basetype: str, pool: list, depth: int = 2):
+    if depth == 0 or rng.random() < 0.5:
+        return basetype
+    parts = [random_condition(rng, rng.choice(pool), pool, depth - 1)
+             for _ in range(rng.randint(1, 3))]
+    if rng.random() < 0.3:
+        # broken in two stages
+        return ((basetype, *parts), random_condition(rng, rng.choice(pool), pool, depth - 1))
+    return (basetype, *parts)
+
+
+# 'a X missing a Y and a (Z missing a W) and a V'
+def condition_text(condition) -> str:
+    def part(c):
+        return 'a ' + c if isinstance(c, str) else 'a (' + condition_text(c) + ')'
+    return part(condition[0]) + ' missing ' + ' and '.join(part(c) for c in condition[1:])
+
+
+# commands and game answers of a made up room, with the items expected
+# to be parsed from them as {fullname: (adj, basetype, condition)}
+def room_texts(rng: random.Random, names: list, exits: str = 'north or south'):
+    items = {}
+    pool = [name.rsplit(' ', 1)[-1] for name in names]
+    for name in names:
+        adj, _, basetype = name.rpartition(' ')
+        condition = random_condition(rng, basetype, pool)
+        items[name] = (adj + ' ' if adj else '', basetype, condition)
+
+    described = []
+    answers = {}
+    for i, (name, (adj, basetype, condition)) in enumerate(items.items()):
+        broken = '(broken) ' if isinstance(condition, tuple) else ''
+        article = 'an' if broken or name[0] in 'aeiou' else 'a'
+        if i == 0:
+            described.append(f'There is {article} {broken}{name} here.')
+        else:
+            described.append(f'Also here is {article} {broken}{name}.')
+        answer = f'x {name}\nThe {basetype} is an item of the incl. construction set.'
+        if adj:
+            answer += f'\nInterestingly, this one is {adj.strip()}.'
+        if broken:
+            answer += f'\nAlso, it is broken: it is {condition_text(condition)}.'
+        answers['x ' + name + '\n'] = answer + '\n\n>: '
+    room = (f'go north\n{rng.choice(ROOM_NAMES)}\n\nYou are standing in a room.\n'
+            + '\n'.join(described)
+            + f'\nFrom here, you can go {exits}.\n\n>: ')
+    return room, answers, items
+
+
+# bot that reads answers from the corpus instead of the game
+class CorpusBot(ExplorerBot):
+    def __init__(self, answers):
+        super().__init__()
+        self.answers = answers
+
+    def makemove(self, cmd):
+        return ''.join(self.answers[line + '\n'] for line in cmd.splitlines())
+
+
+def corpus(seed: int = 0, paths=None):
+    rng = random.Random(seed)
+    paths = paths or sorted(Path('logs').glob('*.in'))
+    rooms = []
+    for path in paths:
+        with open(path) as f:
+            for names in transcript_rooms(f):
+                rooms.append(room_texts(rng, names))
+    return rooms
+
+
+# parses every room of the corpus, returns (seconds, rooms, items)
+def benchmark(rooms, rounds: int = 20):
+    items = 0
+    start = perf_counter()
+    for _ in range(rounds):
+        for room_text, answers, expected in rooms:
+            bot = CorpusBot(answers)
+            room = bot.parse_room(room_text)
+            items += len(room.pile)
+    elapsed = perf_counter() - start
+
+    for room_text, answers, expected in rooms:
+        room = CorpusBot(answers).parse_room(room_text)
+        if list(room.pile) != list(expected):
+            raise RuntimeError(f'{room.pile} parsed, {list(expected)} expected')
+        for name, (adj, basetype, condition) in expected.items():
+            item = next(item for item in room.trash[basetype] if item.fullname() == name)
+            if item.condition() != condition:
+                raise RuntimeError(f'{name}: {item.condition()} parsed, {condition} expected')
+    return elapsed, len(rooms) * rounds, items
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    rooms = corpus(args.seed)
+    elapsed, parsed, items = benchmark(rooms, args.rounds)
+    print(f'{len(rooms)} rooms, {sum(len(r[2]) for r in rooms)} items in corpus')
+    print(f'{parsed} rooms, {items} items parsed in {elapsed:.3f} s, '
+          f'{elapsed / items * 1e6:.1f} us per item')
@@ -0,0 +1,14 @@
+from parser_benchmark import corpus, benchmark, transcript_rooms
+
+
+def test_transcript_rooms():
+    lines = ['take red X-1234-ABC\n', 'go east\n', 'x blue screw\n',
+             'combine blue screw with red nut\n', 'go west\n']
+    assert transcript_rooms(lines) == [['red X-1234-ABC'], ['blue screw', 'red nut']]
+
+
+def test_benchmark():
+    rooms = corpus(seed=1)
+    elapsed, parsed, items = benchmark(rooms, rounds=1)
+    assert parsed == len(rooms) > 0
+    assert items == sum(len(expected) for _, _, expected in rooms)
@@ -0,0 +1,56 @@
+import argparse
+import json
+from pathlib import Path
+from cpp.um_emulator import UniversalMachine
+
+
+# profile of the machine as json. Keys of address tables
+# become strings there, load_profile() turns them back.
+def dump_profile(um: UniversalMachine, path: Path):
+    path.write_text(json.dumps(um.profile()))
+
+
+def load_profile(path: Path) -> dict:
+    profile = json.loads(path.read_text())
+    for table in ['fingers', 'jumps', 'loads', 'allocation_sizes', 'array_sizes']:
+        profile[table] = {int(key): count for key, count in profile[table].items()}
+    return profile
+
+
+# rows sorted by count, share of the total in percents
+def hot_spots(title: str, counts: dict, top: int, key_format='{}'):
+    total = sum(counts.values())
+    print(f'{title} ({len(counts)} distinct, {total:,} total)')
+    for key, count in sorted(counts.items(), key=lambda kv: -kv[1])[:top]:
+        print(f'  {key_format.format(key):>20} {count:15,} {100 * count / total:6.2f}%')
+    print()
+
+
+# size class k is [2^(k-1), 2^k), printed as its bounds
+def histogram(title: str, classes: dict):
+    print(title)
+    for k, count in sorted(classes.items()):
+        bounds = '0' if k == 0 else f'{1 << (k - 1)}..{(1 << k) - 1}'
+        print(f'  {bounds:>20} {count:15,}')
+    print()
+
+
+def report(profile: dict, top: int = 20):
+    hot_spots('Opcodes', {name: n for name, n in profile['opcodes'].items() if n}, top)
+    hot_spots('Addresses', profile['fingers'], top, '0x{:08x}')
+    hot_spots('Jump targets', profile['jumps'], top, '0x{:08x}')
+    hot_spots('Program load targets', profile['loads'], top, '0x{:08x}')
+    print(f'Allocations: {profile["allocations"]:,}, abandonments: {profile["abandonments"]:,}\n')
+    histogram('Allocated array sizes', profile['allocation_sizes'])
+    histogram('Live array sizes', profile['array_sizes'])
+
+
+if __name__ == '__main__':
+    # usage:
+    # run --profile logs/smb.prof smb
+    # profile_report logs/smb.prof [-n 40]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('profile', type=Path, help='file written by dump_profile()')
+    parser.add_argument('-n', '--top', type=int, default=20, help='rows per table')
+    args = parser.parse_args()
+    report(load_profile(args.profile), args.top)
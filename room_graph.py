@@ -0,0 +1,114 @@
+# Map of the rooms for adventure_bot: passages between rooms, shortest
+# paths and tours. Rooms are their coords (complex numbers, see
+# adventure_bot), a step is the difference of neighbour coords.
+#
+# Every passage has the same length, so shortest paths from a room are
+# a BFS tree. Trees are cached per source room and never rebuilt: rooms
+# are only added, and a new passage relaxes the cached trees from its
+# ends, touching only the rooms it brings closer.
+
+from collections import deque
+from typing import List, Optional
+
+INFINITY = float('inf')
+
+
+class RoomGraph:
+    def __init__(self):
+        self.neighbours = {}    # [ coord : set of coords ]
+        self.trees = {}         # [ source : (distance, parent) ]
+        self.relaxed = 0        # rooms updated in cached trees, just for infolog
+
+    def add_room(self, coord: complex):
+        self.neighbours.setdefault(coord, set())
+
+    # passage both ways between neighbour rooms
+    def connect(self, a: complex, b: complex):
+        self.add_room(a)
+        self.add_room(b)
+        if b in self.neighbours[a]:
+            return
+        self.neighbours[a].add(b)
+        self.neighbours[b].add(a)
+        for tree in self.trees.values():
+            self.relax(tree, a, b)
+            self.relax(tree, b, a)
+
+    # BFS from b, through the rooms reached sooner than they were
+    def relax(self, tree, a: complex, b: complex):
+        distance, parent = tree
+        if distance.get(a, INFINITY) + 1 >= distance.get(b, INFINITY):
+            return
+        distance[b] = distance[a] + 1
+        parent[b] = a
+        queue = deque([b])
+        while queue:
+            room = queue.popleft()
+            self.relaxed += 1
+            for neighbour in self.neighbours[room]:
+                if distance[room] + 1 < distance.get(neighbour, INFINITY):
+                    distance[neighbour] = distance[room] + 1
+                    parent[neighbour] = room
+                    queue.append(neighbour)
+
+    # (distance, parent) of the rooms reachable from source
+    def tree(self, source: complex):
+        if not source in self.trees:
+            distance, parent = {source: 0}, {source: None}
+            queue = deque([source])
+            while queue:
+                room = queue.popleft()
+                for neighbour in self.neighbours.get(room, ()):
+                    if not neighbour in distance:
+                        distance[neighbour] = distance[room] + 1
+                        parent[neighbour] = room
+                        queue.append(neighbour)
+            self.trees[source] = (distance, parent)
+        return self.trees[source]
+
+    def distance(self, a: complex, b: complex) -> float:
+        return self.tree(a)[0].get(b, INFINITY)
+
+    # steps from a to b, None if there is no way
+    def path(self, a: complex, b: complex) -> Optional[List[complex]]:
+        distance, parent = self.tree(a)
+        if not b in distance:
+            return None
+        steps = []
+        while b != a:
+            steps.append(b - parent[b])
+            b = parent[b]
+        steps.reverse()
+        return steps
+
+    # -------------------------------------------------------------------#
+    # Order to visit the stops from start in, for fewer steps: nearest
+    # neighbour, then 2-opt (reversing parts of the route while it gets
+    # shorter). The tour does not return to start; start comes first if
+    # it is a stop itself.
+    # -------------------------------------------------------------------#
+    def tour(self, start: complex, stops: List[complex]) -> List[complex]:
+        route = [start]
+        left = list(dict.fromkeys(stop for stop in stops if stop != start))
+        while left:
+            nearest = min(left, key=lambda stop: self.distance(route[-1], stop))
+            left.remove(nearest)
+            route.append(nearest)
+
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, len(route) - 1):
+                for j in range(i + 1, len(route)):
+                    before = self.distance(route[i - 1], route[i])
+                    after = self.distance(route[i - 1], route[j])
+                    if j + 1 < len(route):
+                        before += self.distance(route[j], route[j + 1])
+                        after += self.distance(route[i], route[j + 1])
+                    if after < before:
+                        route[i:j + 1] = reversed(route[i:j + 1])
+                        improved = True
+        return ([start] if start in stops else []) + route[1:]
+
+    def tour_length(self, start: complex, route: List[complex]) -> float:
+        return sum(self.distance(a, b) for a, b in zip([start] + route, route))
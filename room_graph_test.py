@@ -0,0 +1,64 @@
+from room_graph import RoomGraph
+
+from itertools import permutations
+import random
+
+
+# every passage of a width x height grid, in random order
+def grid_passages(width, height, seed=0):
+    passages = [(complex(x, y), complex(x + dx, y + dy))
+                for x in range(width) for y in range(height)
+                for dx, dy in [(1, 0), (0, 1)]
+                if x + dx < width and y + dy < height]
+    random.Random(seed).shuffle(passages)
+    return passages
+
+
+def test_path():
+    graph = RoomGraph()
+    for a, b in grid_passages(5, 4):
+        graph.connect(a, b)
+    steps = graph.path(0j, complex(4, 3))
+    assert len(steps) == 7
+    assert sum(steps) == complex(4, 3)
+    assert all(abs(step) == 1 for step in steps)
+    assert graph.path(0j, 0j) == []
+    assert graph.path(0j, complex(9, 9)) is None
+
+
+def test_cached_trees_are_relaxed():
+    # rooms of a corridor, then a shortcut
+    graph = RoomGraph()
+    for x in range(6):
+        graph.connect(complex(x, 0), complex(x + 1, 0))
+        graph.connect(complex(x, 1), complex(x + 1, 1))
+    graph.connect(complex(6, 0), complex(6, 1))
+    assert graph.distance(0j, 1j) == 13
+    assert graph.distance(1j, 0j) == 13
+
+    graph.connect(0j, 1j)
+    assert graph.distance(0j, 1j) == 1
+    assert graph.distance(1j, complex(3, 0)) == 4
+    assert graph.path(0j, complex(2, 1)) == [1j, 1, 1]
+    # relaxed in place, not rebuilt
+    assert set(graph.trees) == {0j, 1j}
+    assert 0 < graph.relaxed < 2 * 14
+
+    fresh = RoomGraph()
+    fresh.neighbours = graph.neighbours
+    for source in [0j, 1j]:
+        assert graph.tree(source)[0] == fresh.tree(source)[0]
+
+
+def test_tour():
+    graph = RoomGraph()
+    for a, b in grid_passages(8, 8, seed=1):
+        graph.connect(a, b)
+    rng = random.Random(2)
+    for _ in range(10):
+        stops = [complex(rng.randrange(8), rng.randrange(8)) for _ in range(6)]
+        route = graph.tour(0j, stops)
+        assert sorted(route, key=str) == sorted(set(stops), key=str)
+        best = min(graph.tour_length(0j, list(order)) for order in permutations(set(stops) - {0j}))
+        assert graph.tour_length(0j, route) <= best * 1.25
+        assert graph.tour_length(0j, route) <= graph.tour_length(0j, list(dict.fromkeys(stops)))
@@ -1,18 +1,32 @@
 from cpp.um_emulator import UniversalMachine
 from byteio import *
+from profile_report import dump_profile
 
 import io
 import argparse
 import sys
 import re
+import glob
+import json
+from time import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from abc import abstractmethod
-from typing import Optional
+from typing import List, Optional, Tuple
 
 
 # --------------- General Run UM method ---------------------- #
 
+class BudgetExhaustedError(Exception):
+    def __init__(self, budget):
+        self.message = f'Instruction budget of {budget:,} is exhausted'
+        super().__init__(self.message)
+
+
+# runs until halt or end of input.
+# Raises BudgetExhaustedError when um.instruction_budget is reached,
+# output up to that point is written and flushed.
 def run(um: UniversalMachine, *, umin: BaseReader, umout: BaseWriter):
     while True:
         # if um.state == UniversalMachine.State.ERROR:
@@ -21,50 +35,127 @@ def run(um: UniversalMachine, *, umin: BaseReader, umout: BaseWriter):
         #     return
 
         if um.state == UniversalMachine.State.IDLE:
-            out = um.run()
-            for byte in out:
-                umout.writebyte(byte)
+            if um.budget_exhausted:
+                umout.flush()
+                raise BudgetExhaustedError(um.instruction_budget)
+            umout.write(um.run())
             continue
 
+        umout.flush()
         if um.state == UniversalMachine.State.HALT:
             return
 
         assert um.state == UniversalMachine.State.WAITING
 
-        c = umin.readbyte()
-        if c is None: return
-        um.write_input(c)
+        # line by line, so that transcripts keep command / answer order
+        line = umin.readline()
+        if not line: return
+        um.write_input_bytes(line)
 
 
 # ------------ Different Run UM configurations --------------- #
 
-def run_user():
-    um = UniversalMachine(Path('umix.umz').read_bytes())
+# snapshots are kept next to the logs: logs/<name>.snap
+def snapshot_path(name: str) -> Path:
+    return Path('logs') / (name + '.snap')
+
+
+# boots umix from scratch or resumes the machine from snapshot
+def load_um(snapshot: Optional[str] = None) -> UniversalMachine:
+    if snapshot is None:
+        return UniversalMachine(Path('umix.umz'))
+    return UniversalMachine.load(snapshot_path(snapshot))
+
+
+# score found in output goes to logs/score.txt right away;
+# known score is taken from the index, nothing is printed or written yet
+def live_score() -> ScoreWriter:
+    return ScoreWriter(Path('logs/score.txt'), indexed_scores())
+
+
+# profile of the session is written to profile path after the run
+def run_user(snapshot: Optional[str] = None, profile: Optional[Path] = None):
+    um = load_um(snapshot)
+    um.profiling = profile is not None
     with Path('logs/default.out').open('wb') as f, \
          Path('logs/input.in').open('wb') as g:
-        logwriter = ByteWriter(f)
+        logwriter = ByteWriter(f, flush=FlushPolicy.INPUT)
         run(um,
-            umin=ForkReader(TextReader(sys.stdin), [logwriter, ByteWriter(g)]),
-            umout=ForkWriter(TextWriter(sys.stdout), logwriter))
+            umin=ForkReader(TextReader(sys.stdin),
+                            [logwriter, ByteWriter(g, flush=FlushPolicy.INPUT)]),
+            umout=ForkWriter(TextWriter(sys.stdout), logwriter, live_score()))
+    if profile is not None:
+        dump_profile(um, profile)
 
 
-def run_file(filename):
+# runs logs/<filename>.in, then keyboard.
+# Machine state after the file is saved to logs/<save_snapshot>.snap
+def run_file(filename, snapshot: Optional[str] = None, save_snapshot: Optional[str] = None,
+             profile: Optional[Path] = None):
     path = Path('logs')
-    um = UniversalMachine(Path('umix.umz').read_bytes())
+    um = load_um(snapshot)
+    um.profiling = profile is not None
     with (path / 'input.in').open('w') as keyboard, \
          (path / (filename + '.in')).open('r') as infile, \
          (path / (filename + '.out')).open('wb') as outfile:
-        logwriter = ByteWriter(outfile)
+        logwriter = ByteWriter(outfile, flush=FlushPolicy.INPUT)
         conswriter = TextWriter(sys.stdout)
         doublewriter = ForkWriter(logwriter, conswriter)
+        scorewriter = live_score()
         # run file
         run(um,
             umin=ForkReader(TextReader(infile), [doublewriter]),
-            umout=doublewriter)
+            umout=ForkWriter(doublewriter, scorewriter))
+        if save_snapshot is not None:
+            um.save(snapshot_path(save_snapshot))
         run(um,
             umin=ForkReader(TextReader(sys.stdin),
                             [logwriter, TextWriter(keyboard)]),
-            umout=doublewriter)
+            umout=ForkWriter(doublewriter, scorewriter))
+    if profile is not None:
+        dump_profile(um, profile)
+
+
+# ------------------ Batch replay ----------------------- #
+
+# runs one input script into <script>.out next to it,
+# returns script, wall time and number of instructions
+def replay_script(script: str, snapshot: Optional[str] = None) -> Tuple[str, float, int]:
+    um = load_um(snapshot)
+    t = time()
+    path = Path(script)
+    with path.open('r') as infile, path.with_suffix('.out').open('wb') as outfile:
+        logwriter = ByteWriter(outfile, flush=FlushPolicy.INPUT)
+        run(um,
+            umin=ForkReader(TextReader(infile), [logwriter]),
+            umout=logwriter)
+    return script, time() - t, um.instructions_executed
+
+
+# replays all scripts matching patterns, each on its own machine and process.
+# Returns results of the scripts that ran and (script, error) of the failed ones.
+def run_batch(patterns: List[str], snapshot: Optional[str] = None,
+              jobs: Optional[int] = None) -> Tuple[List[Tuple[str, float, int]], List[Tuple[str, str]]]:
+    scripts = sorted({script for pattern in patterns for script in glob.glob(pattern)})
+    results = []
+    failures = []
+    t = time()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(replay_script, script, snapshot): script for script in scripts}
+        for future in as_completed(futures):
+            try:
+                script, elapsed, instructions = future.result()
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                print(f'{futures[future]:40} FAILED {error}')
+                failures.append((futures[future], error))
+                continue
+            print(f'{script:40} {elapsed:8.2f}s {instructions:15,} insns '
+                  f'{instructions / elapsed / 1e6 if elapsed else 0:8.1f} MIPS')
+            results.append((script, elapsed, instructions))
+    print(f'{len(scripts)} scripts in {time() - t:.2f}s' +
+          (f', {len(failures)} failed' if failures else ''))
+    return results, failures
 
 
 def run_compiled(umcode: bytes, binary):
@@ -80,34 +171,76 @@ def run_compiled(umcode: bytes, binary):
 
 # ------------------ Scoring ------------------------ #
 
-# all lines that match score pattern are collected in logs/score.txt and summed up
+SCORE_INDEX = Path('logs/score_index.json')
+SCORE_CHUNK = 1 << 20
+TAIL_SIZE = 64      # bytes before offset, tell appended file from rewritten
+
+
+# all lines that match score pattern are collected in logs/score.txt and summed up.
 def collect_score():
-    # PUZZL.TSK=100@1001|14370747643c6d2db0a40ecb4b0bb65
-    # | 1 |     |2|
-    # problem   score
-    regex = re.compile(r'(\w*?)\.\w*?=(\d*)@\d*\|\w*')
-    score = 0
-    scorelines = defaultdict(set)
-    for p in Path('logs').glob('*.out'):
-        with p.open('rb') as f:
-            for line in f:
-                
-                line = line.decode('ascii', errors='ignore').strip()
-                m = regex.search(line)
-                if m is None:
-                    continue
-                if m[0] in scorelines[m[1]]:
-                    continue
-                scorelines[m[1]].add(m[0])
-                score += int(m[2])
-
-    with Path('logs/score.txt').open('w') as f:
-        f.write(f'Total score: {score}\n')
-        for task in scorelines.keys():
-            f.write('\n' + task + '\n')
-            for line in scorelines[task]:
-                f.write(line + '\n')
+    scorelines = indexed_scores()
+    score = write_score(Path('logs/score.txt'), scorelines)
     print(f'Total score: {score}. Result written to logs/score.txt')
+    return scorelines
+
+
+# score lines of all *.out by task.
+# logs/score_index.json keeps offset, mtime and found lines per *.out,
+# so only bytes appended since the last call are scanned.
+def indexed_scores():
+    index = json.loads(SCORE_INDEX.read_text()) if SCORE_INDEX.exists() else {}
+    index = {name: entry for name, entry in index.items() if (Path('logs') / name).exists()}
+    for p in Path('logs').glob('*.out'):
+        index[p.name] = scan_scores(p, index.get(p.name))
+    SCORE_INDEX.write_text(json.dumps(index))
+
+    scorelines = defaultdict(set)
+    for entry in index.values():
+        for task, lines in [*entry['lines'].items(), *entry['pending'].items()]:
+            scorelines[task].update(lines)
+    return scorelines
+
+
+# updates index entry of one file, scanning from the last offset if file was appended
+def scan_scores(path: Path, entry: Optional[dict]) -> dict:
+    stat = path.stat()
+    if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+        return entry
+
+    with path.open('rb') as f:
+        if entry is None or entry['offset'] > stat.st_size or read_tail(f, entry['offset']) != entry['tail']:
+            entry = {'offset': 0, 'lines': {}}
+        lines = defaultdict(set, {task: set(found) for task, found in entry['lines'].items()})
+
+        f.seek(entry['offset'])
+        offset = entry['offset']
+        rest = b''
+        while True:
+            chunk = f.read(SCORE_CHUNK)
+            if not chunk:
+                break
+            # match only complete lines, incomplete tail goes to the next chunk
+            data = rest + chunk
+            end = data.rfind(b'\n') + 1
+            find_scores(data[:end], lines)
+            rest = data[end:]
+            offset += end
+        # unfinished last line is counted, but not kept: it is scanned again next time
+        pending = defaultdict(set)
+        find_scores(rest, pending)
+
+        return {'offset': offset,
+                'tail': read_tail(f, offset),
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'lines': {task: sorted(found) for task, found in lines.items()},
+                'pending': {task: sorted(found) for task, found in pending.items()}}
+
+
+def read_tail(f, offset: int) -> str:
+    start = max(0, offset - TAIL_SIZE)
+    f.seek(start)
+    return f.read(offset - start).hex()
 
 
 if __name__ == '__main__':
@@ -117,17 +250,37 @@ if __name__ == '__main__':
     # run smb
     # run smb -s
     # run -s --no-run
+    # run howie_start --save-snapshot howie
+    # run --from-snapshot howie
+    # run smb --from-snapshot howie
+    # run --batch 'logs/*.in' [--from-snapshot howie] [-j 4] [-s]
+    # run smb --profile logs/smb.prof
     parser = argparse.ArgumentParser()
     parser.add_argument('name', nargs='?')
     parser.add_argument('-s', '--score', action='store_true', help='calculate score')
     parser.add_argument('--no-run', action='store_true', help='UM is not executed')
+    parser.add_argument('--from-snapshot', metavar='NAME',
+                        help='resume UM from logs/NAME.snap instead of booting umix')
+    parser.add_argument('--save-snapshot', metavar='NAME',
+                        help='save UM to logs/NAME.snap after running input file')
+    parser.add_argument('--batch', nargs='+', metavar='SCRIPT',
+                        help='replay input scripts (or globs) in parallel, no keyboard')
+    parser.add_argument('-j', '--jobs', type=int, help='processes for --batch')
+    parser.add_argument('--profile', type=Path, metavar='FILE',
+                        help='count executed instructions, write them to FILE (see profile_report)')
     args = parser.parse_args()
+    if args.save_snapshot is not None and args.name is None:
+        parser.error('--save-snapshot needs input file name')
 
     if not args.no_run:
-        if args.name is None:
-            run_user()
+        if args.batch is not None:
+            _, failures = run_batch(args.batch, args.from_snapshot, args.jobs)
+            if failures:
+                sys.exit(1)
+        elif args.name is None:
+            run_user(args.from_snapshot, args.profile)
         else:
-            run_file(args.name)
+            run_file(args.name, args.from_snapshot, args.save_snapshot, args.profile)
     if args.score:
         collect_score()
 
@@ -1,20 +1,194 @@
+import argparse
+import hashlib
+import json
 import logging
-from time import time
+import statistics
+import subprocess
+from time import time, perf_counter
+from datetime import datetime
 from pathlib import Path
+from typing import List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+import cpp.um_emulator
 from cpp.um_emulator import UniversalMachine
+from profile_report import dump_profile
 
+HISTORY = Path('logs/sandmark_history.json')
 
-def main():
-    um = UniversalMachine(Path('sandmark.umz').read_bytes())
+
+def main(program: Path, engine: UniversalMachine.Engine, profile: Optional[Path] = None):
+    um = UniversalMachine(program, engine=engine)
     um.output_buffer_limit = 1
+    um.profiling = profile is not None
     t = time()
     while um.state != UniversalMachine.State.HALT:
         assert um.state == UniversalMachine.State.IDLE
         output = um.run()
         print(output.decode('ascii'), end='', flush=True)
     print(f'\ntime elapsed:{time() - t:.4}')
-    
+    if profile is not None:
+        dump_profile(um, profile)
+
+
+def run_to_halt(um: UniversalMachine):
+    while um.state != UniversalMachine.State.HALT:
+        um.run()
+
+
+# ----------------------- Benchmark ------------------------- #
+
+# runs the program `repeat` times on fresh machines, until halt
+# or, with input (e.g. a umix login script), until it is consumed.
+# Only a hash of the output is kept; with the limits the machine returns to Python
+# every output_buffer_limit bytes / command_limit instructions,
+# as it does under run.py.
+def benchmark(program: Union[Path, bytes], engine: UniversalMachine.Engine, *,
+              input: bytes = b'',
+              output_buffer_limit: Optional[int] = None,
+              command_limit: Optional[int] = None,
+              repeat: int = 3) -> dict:
+    times = []
+    for _ in range(repeat):
+        um = UniversalMachine(program, engine=engine)
+        um.output_buffer_limit = output_buffer_limit
+        um.command_limit = command_limit
+        output = hashlib.sha1()
+        t = perf_counter()
+        um.write_input_bytes(input)
+        while um.state == UniversalMachine.State.IDLE:
+            output.update(um.run())
+        times.append(perf_counter() - t)
+        if um.error_message:
+            raise RuntimeError(f'{engine.name}: {um.error_message}')
+
+    best = min(times)
+    return {'engine': engine.name,
+            'output_buffer_limit': output_buffer_limit,
+            'command_limit': command_limit,
+            'repeat': repeat,
+            'min': best,
+            'median': statistics.median(times),
+            'output': output.hexdigest(),
+            'instructions': um.instructions_executed,
+            'ips': um.instructions_executed / best if best else 0,
+            'allocator': um.allocator_stats()}
+
+
+# identifies the emulator build the results belong to
+def build_id() -> dict:
+    binary = Path(cpp.um_emulator.__file__)
+    build = {'binary': hashlib.sha1(binary.read_bytes()).hexdigest()[:12]}
+    try:
+        build['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                         capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return build
+
+
+# last result with the same program, input, engine and limits
+def previous_result(history: List[dict], result: dict) -> Optional[dict]:
+    keys = ['program', 'input', 'engine', 'output_buffer_limit', 'command_limit']
+    for old in reversed(history):
+        if all(old.get(key) == result[key] for key in keys):
+            return old
+    return None
+
+
+# benchmarks every engine, prints them against the previous entries
+# of the history and appends the new results there.
+# Engines must agree on output and instruction count.
+def run_suite(program: Path, engines: List[UniversalMachine.Engine], *,
+              input: Optional[Path] = None,
+              output_buffer_limit: Optional[int] = None,
+              command_limit: Optional[int] = None,
+              repeat: int = 3,
+              history: Optional[Path] = HISTORY) -> List[dict]:
+    past = json.loads(history.read_text()) if history is not None and history.exists() else []
+    stamp = {'date': datetime.now().isoformat(timespec='seconds'),
+             'program': program.name,
+             'input': input and input.name,
+             **build_id()}
+
+    results = []
+    for engine in engines:
+        result = {**stamp, **benchmark(program, engine,
+                                       input=input.read_bytes() if input else b'',
+                                       output_buffer_limit=output_buffer_limit,
+                                       command_limit=command_limit,
+                                       repeat=repeat)}
+        old = previous_result(past, result)
+        change = f'{100 * (result["ips"] / old["ips"] - 1):+7.1f}%' if old and old['ips'] else ''
+        print(f'{engine.name:10} min {result["min"]:8.3f}s  median {result["median"]:8.3f}s  '
+              f'{result["ips"] / 1e6:8.1f} MIPS {change}')
+        allocator = result['allocator']
+        print(f'{"":10} {allocator["allocations"]:,} allocations, {allocator["reused"]:,} reused; '
+              f'{allocator["abandonments"]:,} abandonments, {allocator["pooled"]:,} pooled')
+        results.append(result)
+        if (result['output'], result['instructions']) != (results[0]['output'], results[0]['instructions']):
+            raise RuntimeError(f'{engine.name} disagrees with {results[0]["engine"]}')
+
+    if history is not None:
+        history.parent.mkdir(parents=True, exist_ok=True)
+        history.write_text(json.dumps(past + results, indent=1))
+    return results
+
+
+# N machines on N threads, compared to one machine on one thread.
+# Emulator releases GIL, so the time should stay about the same.
+def run_parallel(program: Path, engine: UniversalMachine.Engine, threads: int):
+    elapsed = {}
+    for n in sorted({1, threads}):
+        machines = [UniversalMachine(program, engine=engine) for _ in range(n)]
+        t = time()
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            list(executor.map(run_to_halt, machines))
+        elapsed[n] = time() - t
+        print(f'{n} machines on {n} threads: {elapsed[n]:.4}s')
+    print(f'speedup: {threads * elapsed[1] / elapsed[threads]:.3}x of {threads}')
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # usage:
+    # run_sandmark                          all engines, 3 runs each, logs/sandmark_history.json
+    # run_sandmark --engine decoded -r 5 --output-buffer-limit 1
+    # run_sandmark --program umix.umz --input logs/guest.in
+    # run_sandmark --show --engine table    print sandmark output as it goes
+    # run_sandmark --threads 4
+    engine_names = [name.lower() for name in UniversalMachine.Engine.__members__]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--program', type=Path, default=Path('sandmark.umz'))
+    parser.add_argument('--input', type=Path, metavar='FILE',
+                        help='input for the program, run stops when it is consumed')
+    parser.add_argument('--engine', choices=engine_names, action='append',
+                        help='engine to benchmark, may be repeated (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per engine')
+    parser.add_argument('--output-buffer-limit', type=int, metavar='BYTES',
+                        help='return to Python after BYTES of output')
+    parser.add_argument('--command-limit', type=int, metavar='N',
+                        help='return to Python after N instructions')
+    parser.add_argument('--history', type=Path, default=HISTORY,
+                        help='json file the results are appended to')
+    parser.add_argument('--no-history', action='store_true', help='do not save the results')
+    parser.add_argument('--show', action='store_true',
+                        help='run once, printing sandmark output byte by byte')
+    parser.add_argument('--threads', type=int,
+                        help='run sandmark on N threads in parallel, output is discarded')
+    parser.add_argument('--profile', type=Path, metavar='FILE',
+                        help='run as --show, count executed instructions, write them to FILE '
+                             '(see profile_report)')
+    args = parser.parse_args()
+
+    engines = [UniversalMachine.Engine.__members__[name.upper()]
+               for name in args.engine or engine_names]
+    if args.show or args.profile is not None:
+        main(args.program, engines[0], args.profile)
+    elif args.threads is not None:
+        run_parallel(args.program, engines[0], args.threads)
+    else:
+        run_suite(args.program, engines,
+                  input=args.input,
+                  output_buffer_limit=args.output_buffer_limit,
+                  command_limit=args.command_limit,
+                  repeat=args.repeat,
+                  history=None if args.no_history else args.history)
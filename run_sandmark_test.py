@@ -0,0 +1,23 @@
+from run_sandmark import run_suite
+from cpp.um_emulator import UniversalMachine
+from cpp.um_emulator_test import countdown_program
+
+from pathlib import Path
+import json
+
+
+def test_run_suite(tmp_path):
+    program = tmp_path / 'countdown.umz'
+    program.write_bytes(countdown_program(1000))
+    history = tmp_path / 'history.json'
+    engines = list(UniversalMachine.Engine.__members__.values())
+
+    results = run_suite(program, engines, command_limit=100, repeat=2, history=history)
+    assert [r['engine'] for r in results] == [e.name for e in engines]
+    assert all(r['instructions'] == 4 + 4 * 1000 + 1 for r in results)
+    assert all(r['min'] <= r['median'] and r['command_limit'] == 100 for r in results)
+
+    run_suite(program, engines[:1], repeat=1, history=history)
+    saved = json.loads(history.read_text())
+    assert len(saved) == len(engines) + 1
+    assert saved[-1]['program'] == 'countdown.umz'
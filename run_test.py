@@ -0,0 +1,91 @@
+from run import run, run_batch, collect_score, live_score, BudgetExhaustedError
+from cpp.um_emulator import UniversalMachine
+from cpp.um_emulator_test import echo_program
+from byteio import BaseReader, ByteWriter
+
+from pathlib import Path
+import io
+import json
+import os
+import pytest
+
+
+def test_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path('logs').mkdir()
+    UniversalMachine(echo_program()).save('logs/echo.snap')
+    Path('logs/a.in').write_text('hello\n')
+    Path('logs/b.in').write_text('world\nagain\n')
+
+    results, failures = run_batch(['logs/*.in'], snapshot='echo', jobs=2)
+    assert failures == []
+    assert sorted(script for script, _, _ in results) == ['logs/a.in', 'logs/b.in']
+    assert all(instructions > 0 for _, _, instructions in results)
+    assert Path('logs/a.out').read_bytes() == b'hello\nhello\n'
+    assert Path('logs/b.out').read_bytes() == b'world\nworld\nagain\nagain\n'
+
+
+# a failing script is reported, the others still run and are timed
+def test_batch_failure(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    Path('logs').mkdir()
+    UniversalMachine(echo_program()).save('logs/echo.snap')
+    Path('logs/a.in').write_text('hello\n')
+    Path('logs/bad.in').write_text('héllo\n', encoding='utf-8')   # not ASCII
+    Path('logs/c.in').write_text('world\n')
+
+    results, failures = run_batch(['logs/*.in'], snapshot='echo', jobs=2)
+    assert sorted(script for script, _, _ in results) == ['logs/a.in', 'logs/c.in']
+    assert [script for script, _ in failures] == ['logs/bad.in']
+    assert 'Error' in failures[0][1]
+    out = capsys.readouterr().out
+    assert 'logs/bad.in' in out and 'FAILED' in out
+    assert '3 scripts in' in out and '1 failed' in out
+
+
+def test_collect_score(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path('logs').mkdir()
+    Path('logs/a.out').write_bytes(b'% cat score\nPUZZL.TSK=100@1001|1437\n')
+    Path('logs/b.out').write_bytes(b'PUZZL.TSK=100@1001|1437\nADVTR.CMB=5@999999|a0b1')
+    collect_score()
+    assert Path('logs/score.txt').read_text().startswith('Total score: 105\n')
+    index = json.loads(Path('logs/score_index.json').read_text())
+    assert index['b.out']['offset'] == 24
+
+    with Path('logs/b.out').open('ab') as f:
+        f.write(b'f\nADVTR.KEY=20@999999|b1c2\n')
+    scorelines = collect_score()
+    assert scorelines['ADVTR'] == {'ADVTR.CMB=5@999999|a0b1f', 'ADVTR.KEY=20@999999|b1c2'}
+    assert Path('logs/score.txt').read_text().startswith('Total score: 125\n')
+
+    # rewritten, not appended
+    Path('logs/b.out').write_bytes(b'% logout\n' * 10)
+    os.utime('logs/b.out', (0, 0))
+    Path('logs/a.out').unlink()
+    scorelines = collect_score()
+    assert dict(scorelines) == {}
+    assert Path('logs/score.txt').read_text() == 'Total score: 0\n'
+
+
+def test_live_score(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    Path('logs').mkdir()
+    Path('logs/a.out').write_bytes(b'PUZZL.TSK=100@1001|1437\n')
+    scores = live_score()
+    assert scores.score == 100
+    assert capsys.readouterr().out == ''
+    assert not Path('logs/score.txt').exists()
+    scores.write(b'ADVTR.CMB=5@999999|a0b1\n')
+    assert Path('logs/score.txt').read_text().startswith('Total score: 105\n')
+
+
+def test_budget_exhausted():
+    um = UniversalMachine(echo_program())
+    um.instruction_budget = 1000
+    output = io.BytesIO()
+    um.write_input_bytes(b'x' * 1000)
+    with pytest.raises(BudgetExhaustedError):
+        run(um, umin=BaseReader(), umout=ByteWriter(output))
+    assert um.instructions_executed == 1000
+    assert 0 < len(output.getvalue()) < 2000
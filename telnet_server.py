@@ -1,17 +1,38 @@
 from byteio import *
-from run import run
+from run import run, BudgetExhaustedError
 from cpp.um_emulator import UniversalMachine
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 import sys
 import io
+import argparse
+import asyncio
+import contextlib
 import socketserver
 import threading
 import logging
 
 
+# instructions UMIX may spend on one request, None for no limit.
+# The default is for the --async server; threaded one has no limit
+# unless --budget is given.
+REQUEST_BUDGET = 5_000_000_000
+request_budget = None
+
 file_lock = threading.Lock()
 
+def log_exchange(request, response):
+    with file_lock:
+        with Path('logs/default.out').open('ab') as f:
+            f.write(request + response)
+
+    request_header = request[:request.find(b' HTTP')].decode('ascii')
+    response_header = response[response.find(b' ')+1:response.find(b'\n')].decode('ascii')
+    logging.info(f'{request_header} | {response_header} | {len(response)} bytes')
+
+
 class Handler(socketserver.StreamRequestHandler):
     def handle(self):
         request = []
@@ -22,18 +43,21 @@ class Handler(socketserver.StreamRequestHandler):
             request.append(line)
 
         request = b''.join(request)
-        response = proxy(request, BaseWriter())
+        response = proxy_or_unavailable(request, BaseWriter())
         self.wfile.write(response)
+        log_exchange(request, response)
 
-        with file_lock:
-            with Path('logs/default.out').open('ab') as f:
-                f.write(request + response)
+        self.wfile.close()
 
-        request_header = request[:request.find(b' HTTP')].decode('ascii')
-        response_header = response[response.find(b' ')+1:response.find(b'\n')].decode('ascii')
-        logging.info(f'{request_header} | {response_header} | {len(response)} bytes')
 
-        self.wfile.close()
+# logs in as guest and connects to local web server
+def boot_um() -> UniversalMachine:
+    logging.info('loading um...')
+    um = UniversalMachine(Path('umix.umz'))
+    um.write_input_bytes(b'guest\nmail\ntelnet 127.0.0.1 80\n')
+    run(um, umin=BaseReader(), umout=BaseWriter())
+    logging.info('done')
+    return um
 
 
 um = None
@@ -42,20 +66,23 @@ um_lock = threading.Lock()
 def get_um_copy():
     global um
     with um_lock:
-    
         if um is None:
-            logging.info('loading um...')
-            um = UniversalMachine(Path('umix.umz').read_bytes())
-            b = b'guest\nmail\ntelnet 127.0.0.1 80\n'
-            run(um, umin = ByteReader(io.BytesIO(b)), umout=BaseWriter())
-            logging.info('done')
+            um = boot_um()
         return UniversalMachine(um)
 
 
-def proxy(request, logwriter: BaseWriter):
-    local_um = get_um_copy()
+# raises BudgetExhaustedError if the machine spends more than
+# `budget` instructions on the request
+def proxy(request, logwriter: BaseWriter, local_um: Optional[UniversalMachine] = None,
+          budget: Optional[int] = None):
+    if local_um is None:
+        local_um = get_um_copy()
+    if budget is not None:
+        local_um.instruction_budget = local_um.instructions_executed + budget
 
-    run(local_um, umin = ByteReader(io.BytesIO(request)), umout=logwriter)
+    start = local_um.instructions_executed
+    local_um.write_input_bytes(request)
+    run(local_um, umin=BaseReader(), umout=logwriter)
 
     outstream = io.BytesIO()
     run(local_um,
@@ -64,9 +91,94 @@ def proxy(request, logwriter: BaseWriter):
 
     response = outstream.getvalue()
     assert response.endswith(b'% '), (request, response)
+    logging.debug(f'{local_um.instructions_executed - start:,} instructions')
     return response[:-2]
 
 
+# the machine is dropped after exhausted budget, client gets 503
+def proxy_or_unavailable(request, logwriter: BaseWriter,
+                         local_um: Optional[UniversalMachine] = None):
+    try:
+        return proxy(request, logwriter, local_um, request_budget)
+    except BudgetExhaustedError as e:
+        logging.warning(e.message)
+        return b'HTTP/1.1 503 Service Unavailable\n\n' + e.message.encode('ascii') + b'\n'
+
+
+# ------------------ asyncio server ------------------- #
+
+# Keeps `size` booted machines ready. Machine is booted once,
+# the pool holds its copies and is refilled in background.
+class MachinePool:
+    def __init__(self, size: int, executor, boot: Callable[[], UniversalMachine] = boot_um):
+        self.size = size
+        self.executor = executor
+        self.boot = boot
+        self.template = None
+        self.machines = asyncio.Queue()
+        self.refills = set()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.template = await loop.run_in_executor(self.executor, self.boot)
+        for _ in range(self.size):
+            self.machines.put_nowait(UniversalMachine(self.template))
+
+    async def acquire(self) -> UniversalMachine:
+        um = await self.machines.get()
+        task = asyncio.get_running_loop().create_task(self.refill())
+        self.refills.add(task)
+        task.add_done_callback(self.refills.discard)
+        return um
+
+    async def refill(self):
+        loop = asyncio.get_running_loop()
+        um = await loop.run_in_executor(self.executor, UniversalMachine, self.template)
+        await self.machines.put(um)
+
+
+# client gets 500 if the proxy fails; connection is closed whatever happens
+async def handle_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       pool: MachinePool):
+    try:
+        request = []
+        while True:
+            line = await reader.readline()
+            if line == b'':
+                return      # client is gone before the end of request
+            if line.strip() == b'':
+                break
+            request.append(line)
+
+        request = b''.join(request)
+        local_um = await pool.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(pool.executor, proxy_or_unavailable,
+                                                  request, BaseWriter(), local_um)
+        except Exception:
+            logging.exception('proxy failed')
+            response = b'HTTP/1.1 500 Internal Server Error\n\n'
+        writer.write(response)
+        await writer.drain()
+        await asyncio.to_thread(log_exchange, request, response)
+    finally:
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
+
+
+async def serve_async(host, port, pool_size):
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        pool = MachinePool(pool_size, executor)
+        await pool.start()
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_async(reader, writer, pool), host, port)
+        logging.info('listening...')
+        async with server:
+            await server.serve_forever()
+
+
 if __name__ == '__main__':
     import hintcheck
     hintcheck.hintcheck_all_functions()
@@ -75,8 +187,24 @@ if __name__ == '__main__':
                         level=logging.INFO,
                         datefmt='%m-%d %H:%M:%S',)
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='asyncio server with a pool of booted machines')
+    parser.add_argument('--pool', type=int, default=4, help='pool size for --async')
+    parser.add_argument('--budget', type=int,
+                        help=f'instructions per request, 0 for no limit '
+                             f'(default: {REQUEST_BUDGET:,} with --async, no limit otherwise)')
+    args = parser.parse_args()
+    if args.budget is None:
+        request_budget = REQUEST_BUDGET if args.use_async else None
+    else:
+        request_budget = args.budget or None
+
     HOST, PORT = 'localhost', 5017
-    with socketserver.ThreadingTCPServer((HOST, PORT), Handler) as server:
-        Path('logs/default.out').write_bytes(b'')
-        logging.info('listening...')
-        server.serve_forever()
+    Path('logs/default.out').write_bytes(b'')
+    if args.use_async:
+        asyncio.run(serve_async(HOST, PORT, args.pool))
+    else:
+        with socketserver.ThreadingTCPServer((HOST, PORT), Handler) as server:
+            logging.info('listening...')
+            server.serve_forever()
@@ -1,6 +1,13 @@
-from telnet_server import Handler, proxy
+from telnet_server import Handler, MachinePool, proxy, proxy_or_unavailable
+from cpp.um_emulator_test import echo_program
+import telnet_server
+from cpp.um_emulator import UniversalMachine
+from compiler import asm
 import byteio
 
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
 # (printf 'GET / HTTP/1.1\n\n' | nc 127.0.0.1 5017) &(printf 'GET / HTTP/1.1\n\n' | nc 127.0.0.1 5017)
 
 def test_proxy_smoke():
@@ -8,3 +15,84 @@ def test_proxy_smoke():
     assert response.startswith(b'HTTP/1.1 200 OK\n'), response
     assert response.endswith(b'</html>\n'), response
 
+
+def test_machine_pool():
+    # prints input byte and halts
+    program = asm.encode_instructions([asm.InputInsn(1),
+                                       asm.OutputInsn(1),
+                                       asm.HaltInsn()])
+
+    async def acquire_all():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pool = MachinePool(2, executor, boot=lambda: UniversalMachine(program))
+            await pool.start()
+            machines = [await pool.acquire() for _ in range(3)]
+            await asyncio.gather(*pool.refills)
+            assert pool.machines.qsize() == 2
+            return machines
+
+    machines = asyncio.run(acquire_all())
+    for c, um in zip(b'abc', machines):
+        um.write_input(c)
+        assert um.run() == bytes([c])
+
+
+def test_request_budget(monkeypatch):
+    monkeypatch.setattr(telnet_server, 'request_budget', 100)
+    um = UniversalMachine(echo_program())
+    response = proxy_or_unavailable(b'GET / HTTP/1.1\r\n' * 10, byteio.BaseWriter(), um)
+    assert response.startswith(b'HTTP/1.1 503 Service Unavailable\n')
+    assert um.instructions_executed == 100
+
+
+# serves one pool of echo machines on a free port, runs client(port)
+def serve_echo(client):
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pool = MachinePool(1, executor, boot=lambda: UniversalMachine(echo_program()))
+            await pool.start()
+            server = await asyncio.start_server(
+                lambda reader, writer: telnet_server.handle_async(reader, writer, pool),
+                '127.0.0.1', 0)
+            async with server:
+                result = await client(server.sockets[0].getsockname()[1])
+            await asyncio.gather(*pool.refills)
+            return result, pool
+    return asyncio.run(main())
+
+
+def test_async_proxy_failure(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+
+    # echo machine gives no '% ' prompt: proxy fails, client gets 500
+    async def client(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET / HTTP/1.1\r\n\r\n')
+        response = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        return response
+
+    response, pool = serve_echo(client)
+    assert response.startswith(b'HTTP/1.1 500 Internal Server Error\n')
+    assert (tmp_path / 'logs/default.out').read_bytes().endswith(response)
+
+
+def test_async_client_gone(monkeypatch):
+    acquired = []
+    acquire = MachinePool.acquire
+    async def counted(pool):
+        acquired.append(pool)
+        return await acquire(pool)
+    monkeypatch.setattr(MachinePool, 'acquire', counted)
+
+    # disconnects before the blank line: no machine is taken
+    async def client(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET / HTTP/1.1\r\n')
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.sleep(0.2)
+
+    serve_echo(client)
+    assert acquired == []
@@ -6,14 +6,13 @@ from cpp.um_emulator import UniversalMachine
 
 # codex.umz (packed) + password -> umix.umz (unpacked)
 def main():
-    um = UniversalMachine(Path('codex.umz').read_bytes())
+    um = UniversalMachine(Path('codex.umz'))
 
     password = rb'(\b.bb)(\v.vv)06FHPVboundvarHRAkp'
     output = um.run()
-    for c in password:
-        assert um.state == UniversalMachine.State.WAITING, um.state
-        um.write_input(c)
-        output += um.run()
+    assert um.state == UniversalMachine.State.WAITING, um.state
+    um.write_input_bytes(password)
+    output += um.run()
     
     assert um.state == UniversalMachine.State.HALT
     